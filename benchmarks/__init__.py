@@ -0,0 +1 @@
+"""Benchmarks de desempenho da API (executados à parte dos testes)"""
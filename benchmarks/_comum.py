@@ -0,0 +1,92 @@
+"""Preparação compartilhada pelos benchmarks
+
+Cria um banco SQLite temporário (o ``db.sqlite3`` do projeto não é
+tocado), aplica as migrações e popula um usuário com locais, eventos e
+custos. Deve ser importado antes de qualquer módulo do Django.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+_PASTA = tempfile.mkdtemp(prefix='benchmark-eventos-')
+atexit.register(shutil.rmtree, _PASTA, ignore_errors=True)
+os.environ.setdefault('SQLITE_ARQUIVO', str(Path(_PASTA) / 'benchmark.sqlite3'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gerenciamento_eventos.settings')
+# Mede a aplicação, não o cache de respostas
+os.environ.setdefault('RESPOSTAS_CACHE_ATIVO', '0')
+
+# Nada é enviado ao Sentry durante a medição
+os.environ.setdefault('SENTRY_ATIVO', '0')
+
+import django  # noqa: E402  pylint: disable=wrong-import-position
+
+django.setup()
+
+
+def preparar_banco(eventos=2000, custos_por_evento=5, locais=20):
+    """Migra o banco temporário e cria os dados; retorna (usuário, token)"""
+    # pylint: disable=import-outside-toplevel
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from rest_framework.authtoken.models import Token
+    from eventos.models import Local, Evento, Custo
+
+    call_command('migrate', verbosity=0)
+    usuario = get_user_model().objects.create_user(
+        username='benchmark', password='Senha@123', cpf='000.000.000-00',
+        email='benchmark@example.com'
+    )
+    token = Token.objects.create(user=usuario)
+    locais_criados = Local.objects.bulk_create(
+        Local(nome=f'Local {i}', logradouro='Rua A', numero=i,
+              bairro='Centro', cidade='Cidade', estado='Estado',
+              cep='12345-678', capacidade=100 + i, usuario=usuario)
+        for i in range(locais)
+    )
+    inicio = 1_700_000_000
+    eventos_criados = Evento.objects.bulk_create(
+        Evento(titulo=f'Evento {i}', descricao='Descrição ' * 20,
+               orcamento=1000, status='PLANEJADO',
+               dataInicio=_data(inicio + i * 3600),
+               dataFim=_data(inicio + i * 3600 + 1800),
+               local=locais_criados[i % locais], usuario=usuario,
+               total_custos=custos_por_evento * 10,
+               qtd_custos=custos_por_evento)
+        for i in range(eventos)
+    )
+    Custo.objects.bulk_create(
+        (Custo(descricao=f'Item {j}', valor=10, evento=evento)
+         for evento in eventos_criados for j in range(custos_por_evento)),
+        batch_size=2000,
+    )
+    return usuario, token
+
+
+def _data(segundos):
+    # pylint: disable=import-outside-toplevel
+    from datetime import datetime, timezone
+    return datetime.fromtimestamp(segundos, tz=timezone.utc)
+
+
+def relatar(nome, requisicoes, segundos, latencias):
+    """Imprime vazão e latências (em ms) de uma rodada"""
+    latencias = sorted(latencias)
+
+    def percentil(fracao):
+        return latencias[min(len(latencias) - 1,
+                             int(fracao * len(latencias)))] * 1000
+
+    print(f"{nome:<42} {requisicoes / segundos:9.1f} req/s   "
+          f"p50 {percentil(0.5):7.1f} ms   p95 {percentil(0.95):7.1f} ms")
+
+
+def cronometro():
+    """Relógio monotônico de alta resolução"""
+    return time.perf_counter()
@@ -0,0 +1,100 @@
+"""Escrita concorrente de custos por vários processos: perfil padrão x produção
+
+Uso::
+
+    python -m benchmarks.escrita_concorrente [--processos 8] [--custos 200]
+
+Para cada perfil de banco (``DB_PERFIL`` vazio e ``producao``) cria um
+SQLite temporário, inicia ``--processos`` processos que gravam
+``--custos`` custos cada um pelo ORM (com os sinais que atualizam os
+totais do evento e o resumo mensal, como a API faz) e mede a vazão, as
+latências e quantas escritas falharam com "database is locked".
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from pathlib import Path
+
+PERFIS = (('padrão', ''), ('produção (WAL + pragmas)', 'producao'))
+
+
+def _configurar(perfil, arquivo):
+    """Aponta o processo para o banco e o perfil e inicializa o Django"""
+    os.environ['DB_PERFIL'] = perfil
+    os.environ['SQLITE_ARQUIVO'] = arquivo
+    from . import _comum  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
+
+
+def preparar(perfil, arquivo):
+    """Cria o banco com alguns eventos para receberem os custos"""
+    _configurar(perfil, arquivo)
+    from ._comum import preparar_banco  # pylint: disable=import-outside-toplevel
+    preparar_banco(eventos=50, custos_por_evento=0, locais=5)
+
+
+def escrever(perfil, arquivo, quantidade, semente, inicio_em):
+    """Grava ``quantidade`` custos; retorna (latências, falhas por lock)"""
+    _configurar(perfil, arquivo)
+    # pylint: disable=import-outside-toplevel
+    from django.db import OperationalError, connection
+    from eventos.models import Custo, Evento
+
+    eventos = list(Evento.objects.values_list('id', flat=True))
+    connection.close()
+    # Todos os processos começam juntos
+    time.sleep(max(0.0, inicio_em - time.time()))
+    latencias, falhas = [], 0
+    for i in range(quantidade):
+        inicio = time.perf_counter()
+        try:
+            Custo.objects.create(descricao=f'Item {semente}-{i}', valor=10,
+                                 evento_id=eventos[(semente + i) % len(eventos)])
+        except OperationalError as erro:
+            if 'locked' not in str(erro):
+                raise
+            falhas += 1
+            continue
+        latencias.append(time.perf_counter() - inicio)
+    connection.close()
+    return latencias, falhas
+
+
+def main():
+    """Executa as rodadas para os dois perfis e imprime a comparação"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processos', type=int, default=8)
+    parser.add_argument('--custos', type=int, default=200,
+                        help="Custos gravados por processo.")
+    argumentos = parser.parse_args()
+    contexto = multiprocessing.get_context('spawn')
+
+    print(f"{argumentos.processos} processos x {argumentos.custos} custos\n")
+    for nome, perfil in PERFIS:
+        with tempfile.TemporaryDirectory() as pasta:
+            arquivo = str(Path(pasta) / 'escrita.sqlite3')
+            preparacao = contexto.Process(target=preparar,
+                                          args=(perfil, arquivo))
+            preparacao.start()
+            preparacao.join()
+
+            with contexto.Pool(argumentos.processos) as pool:
+                inicio_em = time.time() + 3
+                resultados = pool.starmap(escrever, [
+                    (perfil, arquivo, argumentos.custos, semente, inicio_em)
+                    for semente in range(argumentos.processos)
+                ])
+            segundos = time.time() - inicio_em
+
+        latencias = sorted(latencia for parte, _ in resultados
+                           for latencia in parte)
+        falhas = sum(falha for _, falha in resultados)
+        p95 = latencias[int(0.95 * (len(latencias) - 1))] * 1000 \
+            if latencias else float('nan')
+        print(f"{nome:<28} {len(latencias) / segundos:8.1f} escritas/s   "
+              f"p95 {p95:8.1f} ms   'database is locked': {falhas}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Carga mista de leituras e escritas: só o principal x principal + réplica
+
+Uso::
+
+    python -m benchmarks.replicas_leitura [--leitores 6] [--escritores 2]
+                                          [--segundos 10]
+
+Para cada rodada cria um SQLite temporário com eventos e custos e, na
+rodada com réplica, uma cópia dele em outro arquivo (``DB_REPLICAS``).
+Processos leitores fazem GET na listagem e no detalhe de eventos pela
+API; processos escritores gravam custos pelo ORM no principal. Ao fim
+imprime a vazão e as latências de cada lado e quantas escritas falharam
+com "database is locked".
+
+A cópia não é atualizada durante a rodada: o que se mede é a disputa
+pelo arquivo principal, não a replicação.
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+
+def _configurar(arquivo, replica):
+    """Aponta o processo para os bancos e inicializa o Django"""
+    os.environ['SQLITE_ARQUIVO'] = arquivo
+    os.environ['DB_REPLICAS'] = replica
+    from . import _comum  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
+
+
+def preparar(arquivo):
+    """Cria o banco principal; retorna (chave do token, ids de eventos)"""
+    _configurar(arquivo, '')
+    from ._comum import preparar_banco  # pylint: disable=import-outside-toplevel
+    from eventos.models import Evento  # pylint: disable=import-outside-toplevel
+    _, token = preparar_banco(eventos=2000, custos_por_evento=5, locais=20)
+    return token.key, list(Evento.objects.values_list('id', flat=True)[:200])
+
+
+def ler(arquivo, replica, chave, eventos, ate):
+    """GETs na API até ``ate``; retorna as latências"""
+    _configurar(arquivo, replica)
+    from django.test import Client  # pylint: disable=import-outside-toplevel
+
+    cliente = Client(HTTP_AUTHORIZATION=f'Token {chave}')
+    latencias = []
+    indice = 0
+    while time.time() < ate:
+        url = (f'/api/eventos/{eventos[indice % len(eventos)]}/'
+               if indice % 2 else '/api/eventos/?page_size=50')
+        indice += 1
+        inicio = time.perf_counter()
+        resposta = cliente.get(url)
+        latencias.append(time.perf_counter() - inicio)
+        assert resposta.status_code == 200, (url, resposta.status_code)
+    return latencias
+
+
+def escrever(arquivo, replica, eventos, ate):
+    """Cria custos no principal até ``ate``; retorna (latências, falhas)"""
+    _configurar(arquivo, replica)
+    # pylint: disable=import-outside-toplevel
+    from django.db import OperationalError
+    from eventos.models import Custo
+
+    latencias, falhas = [], 0
+    indice = 0
+    while time.time() < ate:
+        indice += 1
+        inicio = time.perf_counter()
+        try:
+            Custo.objects.create(descricao=f'Item {indice}', valor=10,
+                                 evento_id=eventos[indice % len(eventos)])
+        except OperationalError as erro:
+            if 'locked' not in str(erro):
+                raise
+            falhas += 1
+            continue
+        latencias.append(time.perf_counter() - inicio)
+    return latencias, falhas
+
+
+def _percentil(latencias, fracao):
+    latencias = sorted(latencias)
+    if not latencias:
+        return float('nan')
+    return latencias[min(len(latencias) - 1,
+                         int(fracao * len(latencias)))] * 1000
+
+
+def rodada(contexto, argumentos, com_replica):
+    """Executa uma rodada e imprime o resultado"""
+    with tempfile.TemporaryDirectory() as pasta:
+        arquivo = str(Path(pasta) / 'principal.sqlite3')
+        with contexto.Pool(1) as pool:
+            chave, eventos = pool.apply(preparar, (arquivo,))
+        replica = ''
+        if com_replica:
+            replica = str(Path(pasta) / 'replica.sqlite3')
+            with sqlite3.connect(arquivo) as origem, \
+                    sqlite3.connect(replica) as destino:
+                origem.backup(destino)
+
+        processos = argumentos.leitores + argumentos.escritores
+        # Todos começam depois que os processos subiram
+        ate = time.time() + 5 + argumentos.segundos
+        with contexto.Pool(processos) as pool:
+            leituras = [pool.apply_async(ler, (arquivo, replica, chave,
+                                               eventos, ate))
+                        for _ in range(argumentos.leitores)]
+            escritas = [pool.apply_async(escrever, (arquivo, replica,
+                                                    eventos, ate))
+                        for _ in range(argumentos.escritores)]
+            leituras = [latencia for parte in leituras
+                        for latencia in parte.get()]
+            escritas = [parte.get() for parte in escritas]
+
+    latencias_escrita = [latencia for parte, _ in escritas
+                         for latencia in parte]
+    falhas = sum(falha for _, falha in escritas)
+    nome = 'principal + réplica' if com_replica else 'só o principal'
+    print(f"{nome:<20} leituras {len(leituras) / argumentos.segundos:7.1f}/s "
+          f"(p95 {_percentil(leituras, 0.95):6.1f} ms)   "
+          f"escritas {len(latencias_escrita) / argumentos.segundos:7.1f}/s "
+          f"(p95 {_percentil(latencias_escrita, 0.95):6.1f} ms)   "
+          f"'database is locked': {falhas}")
+
+
+def main():
+    """Roda a carga mista sem e com a réplica de leitura"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--leitores', type=int, default=6)
+    parser.add_argument('--escritores', type=int, default=2)
+    parser.add_argument('--segundos', type=int, default=10)
+    argumentos = parser.parse_args()
+    contexto = multiprocessing.get_context('spawn')
+    print(f"{argumentos.leitores} leitores, {argumentos.escritores} "
+          f"escritores, {argumentos.segundos} s por rodada\n")
+    for com_replica in (False, True):
+        rodada(contexto, argumentos, com_replica)
+
+
+if __name__ == '__main__':
+    main()
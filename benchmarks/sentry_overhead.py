@@ -0,0 +1,111 @@
+"""Custo do Sentry por requisição em cada configuração de amostragem
+
+Uso::
+
+    python -m benchmarks.sentry_overhead [--requisicoes 2000]
+
+Faz as mesmas leituras (listagem e detalhe de eventos) com o Sentry
+desligado, com a amostragem por rota do projeto (settings.SENTRY) e com
+100% de rastreamento, com e sem perfis. O SDK é inicializado com um
+transporte que descarta os envelopes: a serialização é medida, o envio
+pela rede não.
+"""
+import argparse
+
+from ._comum import cronometro, preparar_banco, relatar
+
+import sentry_sdk  # noqa: E402  pylint: disable=wrong-import-order
+from sentry_sdk.integrations.django import DjangoIntegration  # noqa: E402
+from sentry_sdk.transport import Transport  # noqa: E402
+
+
+class TransporteNulo(Transport):
+    """Conta e descarta o que o SDK enviaria"""
+    envelopes = 0
+
+    def capture_event(self, event):
+        TransporteNulo.envelopes += 1
+
+    def capture_envelope(self, envelope):
+        TransporteNulo.envelopes += 1
+
+
+def configuracoes():
+    """(nome, opções do sentry_sdk.init ou None para desligado)"""
+    # pylint: disable=import-outside-toplevel
+    from django.conf import settings
+    from gerenciamento_eventos.sentry import amostrador, filtro_de_transacoes
+    projeto = {**settings.SENTRY}
+    return [
+        ('desligado', None),
+        ('só erros (sem rastreamento)', {}),
+        ('rastreamento 0%', {'traces_sample_rate': 0}),
+        ('amostragem por rota (padrão)', {
+            'traces_sampler': amostrador(projeto),
+            'before_send_transaction': filtro_de_transacoes(projeto),
+        }),
+        ('rastreamento 100%', {'traces_sample_rate': 1.0}),
+        ('rastreamento 100% + perfis 100%', {'traces_sample_rate': 1.0,
+                                              'profiles_sample_rate': 1.0}),
+    ]
+
+
+def medir(cabecalho, urls, requisicoes):
+    """Latências de ``requisicoes`` GETs em sequência, pelo handler WSGI
+
+    (O ``django.test.Client`` não passa pelo WSGIHandler, que é onde a
+    integração do Sentry abre as transações.)
+    """
+    # pylint: disable=import-outside-toplevel
+    from django.core.wsgi import get_wsgi_application
+    from django.test.client import RequestFactory
+    aplicacao = get_wsgi_application()
+    fabrica = RequestFactory()
+    latencias = []
+    for indice in range(requisicoes):
+        caminho, _, consulta = urls[indice % len(urls)].partition('?')
+        ambiente = fabrica._base_environ(  # pylint: disable=protected-access
+            PATH_INFO=caminho, QUERY_STRING=consulta, REQUEST_METHOD='GET',
+            HTTP_AUTHORIZATION=cabecalho)
+        situacao = []
+        inicio = cronometro()
+        b''.join(aplicacao(ambiente,
+                           lambda status, cabecalhos: situacao.append(status)))
+        latencias.append(cronometro() - inicio)
+        assert situacao[0].startswith('200'), (caminho, situacao)
+    return latencias
+
+
+def main():
+    """Mede cada configuração e imprime o custo adicional por requisição"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requisicoes', type=int, default=2000)
+    argumentos = parser.parse_args()
+
+    _, token = preparar_banco(eventos=500, custos_por_evento=3)
+    from eventos.models import Evento  # pylint: disable=import-outside-toplevel
+    evento_id = Evento.objects.values_list('id', flat=True).first()
+    urls = ['/api/eventos/?page_size=20', f'/api/eventos/{evento_id}/']
+    cabecalho = f'Token {token.key}'
+    medir(cabecalho, urls, 200)  # aquecimento
+
+    base = None
+    for nome, opcoes in configuracoes():
+        if opcoes is not None:
+            sentry_sdk.init(dsn='https://chave@localhost/1',
+                            transport=TransporteNulo,
+                            integrations=[DjangoIntegration()], **opcoes)
+        TransporteNulo.envelopes = 0
+        inicio = cronometro()
+        latencias = medir(cabecalho, urls, argumentos.requisicoes)
+        segundos = cronometro() - inicio
+        sentry_sdk.flush()
+        relatar(nome, argumentos.requisicoes, segundos, latencias)
+        media = segundos / argumentos.requisicoes * 1000
+        base = media if base is None else base
+        print(f"{'':<42} +{media - base:6.3f} ms/req   "
+              f"envelopes: {TransporteNulo.envelopes}")
+
+
+if __name__ == '__main__':
+    main()
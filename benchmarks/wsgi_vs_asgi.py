@@ -0,0 +1,121 @@
+"""Vazão de requisições concorrentes: WSGI (views síncronas) x ASGI
+
+Uso::
+
+    python -m benchmarks.wsgi_vs_asgi [--concorrencia 16] [--requisicoes 400]
+
+Cada rodada faz as mesmas leituras (listagem, detalhe e custos de
+eventos) contra a aplicação em processo, sem servidor HTTP:
+
+- WSGI: ``django.test.Client`` (WSGIHandler) em um pool de threads, como
+  um servidor WSGI com threads;
+- ASGI: ``django.test.AsyncClient`` (ASGIHandler), com as requisições
+  concorrentes no mesmo loop de eventos, contra as rotas síncronas do DRF e
+  contra as rotas de ``/api/async/``.
+
+Sem o servidor os números isolam o custo da aplicação; para medir com
+servidores reais use as mesmas URLs com gunicorn e uvicorn.
+"""
+import argparse
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from ._comum import cronometro, preparar_banco, relatar
+
+
+def _urls(eventos, prefixo):
+    """Sequência cíclica de URLs de leitura"""
+    rotas = []
+    for evento_id in eventos:
+        rotas += [f'{prefixo}eventos/?page_size=50',
+                  f'{prefixo}eventos/{evento_id}/',
+                  f'{prefixo}eventos/{evento_id}/custos/']
+    return itertools.cycle(rotas)
+
+
+def rodada_wsgi(cabecalho, urls, concorrencia, requisicoes):
+    """Requisições síncronas em ``concorrencia`` threads"""
+    # pylint: disable=import-outside-toplevel
+    from django.db import connections
+    from django.test import Client
+
+    def trabalhar(quantidade):
+        cliente = Client(HTTP_AUTHORIZATION=cabecalho)
+        latencias = []
+        for _ in range(quantidade):
+            url = next(urls)
+            inicio = cronometro()
+            resposta = cliente.get(url)
+            latencias.append(cronometro() - inicio)
+            assert resposta.status_code == 200, (url, resposta.status_code)
+        connections.close_all()
+        return latencias
+
+    inicio = cronometro()
+    with ThreadPoolExecutor(concorrencia) as executor:
+        partes = executor.map(trabalhar,
+                              [requisicoes // concorrencia] * concorrencia)
+        latencias = [latencia for parte in partes for latencia in parte]
+    return cronometro() - inicio, latencias
+
+
+def rodada_asgi(cabecalho, urls, concorrencia, requisicoes):
+    """Requisições em ``concorrencia`` tarefas no mesmo loop de eventos"""
+    # pylint: disable=import-outside-toplevel
+    from django.test import AsyncClient
+
+    async def trabalhar(quantidade, latencias):
+        cliente = AsyncClient()
+        for _ in range(quantidade):
+            url = next(urls)
+            inicio = cronometro()
+            resposta = await cliente.get(
+                url, headers={'Authorization': cabecalho})
+            latencias.append(cronometro() - inicio)
+            assert resposta.status_code == 200, (url, resposta.status_code)
+
+    async def principal():
+        latencias = []
+        inicio = cronometro()
+        await asyncio.gather(*(
+            trabalhar(requisicoes // concorrencia, latencias)
+            for _ in range(concorrencia)
+        ))
+        return cronometro() - inicio, latencias
+
+    return asyncio.run(principal())
+
+
+def main():
+    """Executa as rodadas e imprime a comparação"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concorrencia', type=int, default=16)
+    parser.add_argument('--requisicoes', type=int, default=400)
+    parser.add_argument('--eventos', type=int, default=2000)
+    argumentos = parser.parse_args()
+
+    _, token = preparar_banco(eventos=argumentos.eventos)
+    cabecalho = f'Token {token.key}'
+    # pylint: disable=import-outside-toplevel
+    from eventos.models import Evento
+    eventos = list(Evento.objects.values_list('id', flat=True)[:50])
+
+    print(f"{argumentos.requisicoes} requisições, concorrência "
+          f"{argumentos.concorrencia}, {argumentos.eventos} eventos\n")
+    for nome, rodada, prefixo in (
+            ('WSGI, views síncronas (DRF)', rodada_wsgi, '/api/'),
+            ('ASGI, views síncronas (DRF)', rodada_asgi, '/api/'),
+            ('ASGI, views assíncronas (/api/async/)', rodada_asgi,
+             '/api/async/')):
+        # Uma rodada curta para aquecer caches de autenticação e conexões
+        rodada(cabecalho, _urls(eventos, prefixo), argumentos.concorrencia,
+               argumentos.concorrencia)
+        segundos, latencias = rodada(
+            cabecalho, _urls(eventos, prefixo), argumentos.concorrencia,
+            argumentos.requisicoes)
+        relatar(nome, len(latencias), segundos, latencias)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from django.contrib import admin # type: ignore
-from .models import Local, Evento, Custo
+from .models import Local, Evento, Custo, ResumoMensal
 
 admin.site.register(Local)
 admin.site.register(Evento)
-admin.site.register(Custo)
\ No newline at end of file
+admin.site.register(Custo)
+admin.site.register(ResumoMensal)
\ No newline at end of file
@@ -4,3 +4,7 @@ from django.apps import AppConfig # type: ignore
 class EventosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'eventos'
+
+    def ready(self):
+        # Registra os sinais que mantêm os totais de custos
+        from . import signals  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
@@ -0,0 +1,73 @@
+"""Exportação dos eventos de um usuário como fluxo CSV ou NDJSON
+
+As linhas são lidas do banco com ``iterator(chunk_size=...)`` e escritas
+na resposta aos poucos, então o uso de memória não cresce com a
+quantidade de eventos. O total de custos de cada evento vem dos campos
+materializados em Evento, sem ler a tabela de Custo.
+"""
+import csv
+import json
+from .services import get_user_eventos
+
+FORMATOS = ('csv', 'ndjson')
+TAMANHO_CHUNK = 2000
+# Quantidade de linhas agrupadas em cada pedaço enviado ao cliente
+LINHAS_POR_PEDACO = 500
+CAMPOS = ('id', 'titulo', 'descricao', 'orcamento', 'status', 'dataInicio',
+          'dataFim', 'observacoes', 'local', 'local__nome', 'total_custos',
+          'qtd_custos')
+CABECALHO = tuple(campo.replace('__', '_') for campo in CAMPOS)
+TIPOS_CONTEUDO = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class _Eco:
+    """Arquivo falso que devolve o que recebe, para o csv.writer"""
+
+    def write(self, valor):
+        """Retorna a linha formatada em vez de gravá-la"""
+        return valor
+
+
+def _texto(valor):
+    """Converte datas e decimais para o mesmo formato da API"""
+    if hasattr(valor, 'isoformat'):
+        valor = valor.isoformat()
+        return valor[:-6] + 'Z' if valor.endswith('+00:00') else valor
+    return str(valor) if valor is not None else None
+
+
+def _linhas(user):
+    """Gera as linhas (tuplas) de eventos do usuário em ordem cronológica"""
+    eventos = get_user_eventos(user).order_by('dataInicio', 'id') \
+        .values_list(*CAMPOS)
+    for linha in eventos.iterator(chunk_size=TAMANHO_CHUNK):
+        yield tuple(_texto(valor) if not isinstance(valor, (int, str))
+                    else valor for valor in linha)
+
+
+def _agrupar(pedacos):
+    """Junta várias linhas em um único pedaço da resposta"""
+    buffer = []
+    for pedaco in pedacos:
+        buffer.append(pedaco)
+        if len(buffer) >= LINHAS_POR_PEDACO:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def exportar_eventos(user, formato):
+    """Gera o conteúdo da exportação no formato pedido, em pedaços"""
+    if formato == 'csv':
+        escritor = csv.writer(_Eco())
+        pedacos = (escritor.writerow(linha) for linha in _linhas(user))
+        yield escritor.writerow(CABECALHO)
+    else:
+        pedacos = (json.dumps(dict(zip(CABECALHO, linha)),
+                              ensure_ascii=False) + '\n'
+                   for linha in _linhas(user))
+    yield from _agrupar(pedacos)
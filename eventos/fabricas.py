@@ -0,0 +1,51 @@
+"""Dados de teste compartilhados pelos testes das apps do projeto
+
+Fica fora dos módulos ``tests`` para que um módulo de testes não precise
+importar outro (e rodar de novo as classes de teste dele).
+"""
+from itertools import count
+from django.contrib.auth import get_user_model
+from .models import Local, Evento
+
+# pylint: disable=no-member
+
+
+class DadosFactory:
+    """Usuário, local e evento de teste com os campos irrelevantes preenchidos
+
+    Os testes informam só o que importa para eles; o resto (senha, CPF,
+    endereço do local, datas do evento) tem um valor padrão.
+    """
+    _cpfs = count(1)
+
+    @classmethod
+    def criar_usuario(cls, username, **campos):
+        """Usuário com a senha padrão e e-mail e CPF únicos"""
+        numero = next(cls._cpfs)
+        return get_user_model().objects.create_user(**{
+            "username": username, "password": "Senha@123",
+            "email": f"{username}@example.com",
+            "cpf": f"900.000.{numero // 100:03d}-{numero % 100:02d}",
+            **campos,
+        })
+
+    @staticmethod
+    def criar_local(usuario, **campos):
+        """Local do usuário com um endereço qualquer"""
+        return Local.objects.create(**{
+            "nome": "Centro", "logradouro": "Rua A", "numero": 1,
+            "bairro": "Centro", "cidade": "Cidade X", "estado": "Estado Y",
+            "cep": "12345-678", "capacidade": 100, "usuario": usuario,
+            **campos,
+        })
+
+    @staticmethod
+    def criar_evento(local, **campos):
+        """Evento de um dia no local, do dono do local"""
+        return Evento.objects.create(**{
+            "titulo": "Evento", "descricao": "Descrição",
+            "orcamento": "1000.00", "dataInicio": "2024-12-01T10:00:00Z",
+            "dataFim": "2024-12-01T18:00:00Z", "local": local,
+            "usuario": local.usuario, **campos,
+        })
+
@@ -0,0 +1,171 @@
+"""Importação em massa de locais e eventos a partir de CSV ou NDJSON
+
+Os arquivos são lidos como fluxo, em lotes de tamanho fixo: cada lote é
+validado com as regras dos serializers, tem os locais referenciados
+conferidos em uma única consulta e é gravado com ``bulk_create``. Assim o
+uso de memória não depende do tamanho do arquivo.
+"""
+# pylint: disable=no-member
+import csv
+import json
+import time
+from itertools import islice
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from .intervalos import conflitos_em_lote
+from .models import Local, Evento
+from .resumos import somar_eventos_ao_resumo
+from .serializers import (LocalSerializer, EventoImportacaoSerializer,
+                          MENSAGEM_CONFLITO_LOTE)
+from .services import incrementar_versao_dados
+
+FORMATOS = ('csv', 'ndjson')
+TAMANHO_LOTE_PADRAO = 1000
+# Limite de erros guardados no resultado, para a memória continuar estável
+MAX_ERROS_REPORTADOS = 100
+
+
+def formato_do_arquivo(nome, formato=None):
+    """Descobre o formato pelo parâmetro informado ou pela extensão"""
+    formato = (formato or nome.rsplit('.', 1)[-1]).lower()
+    if formato == 'jsonl':
+        formato = 'ndjson'
+    if formato not in FORMATOS:
+        raise ValidationError(f"Formato inválido: use {' ou '.join(FORMATOS)}.")
+    return formato
+
+
+def ler_registros(texto, formato):
+    """Gera (número da linha, registro) a partir de um fluxo de texto
+
+    Linhas de NDJSON que não são JSON válido geram o registro ``None``,
+    que o importador conta como rejeitado.
+    """
+    if formato == 'csv':
+        for linha, registro in enumerate(csv.DictReader(texto), start=2):
+            # Campos vazios no CSV contam como não informados
+            yield linha, {chave: valor for chave, valor in registro.items()
+                          if chave and valor not in ('', None)}
+        return
+    for linha, conteudo in enumerate(texto, start=1):
+        if not conteudo.strip():
+            continue
+        try:
+            yield linha, json.loads(conteudo)
+        except ValueError:
+            yield linha, None
+
+
+def _em_lotes(registros, tamanho):
+    """Agrupa o gerador de registros em listas de até ``tamanho`` itens"""
+    registros = iter(registros)
+    while True:
+        lote = list(islice(registros, tamanho))
+        if not lote:
+            return
+        yield lote
+
+
+def _validar(validador, lote, erros):
+    """Valida cada registro do lote e devolve [(linha, dados validados)]"""
+    validos = []
+    for linha, registro in lote:
+        if not isinstance(registro, dict):
+            erros.append((linha, {"registro": ["JSON inválido."]}))
+            continue
+        try:
+            validos.append((linha, validador.run_validation(registro)))
+        except ValidationError as exc:
+            erros.append((linha, exc.detail))
+    return validos
+
+
+def _montar_locais(validos, user, erros):  # pylint: disable=unused-argument
+    """Cria as instâncias de Local de um lote já validado"""
+    return [Local(usuario=user, **dados) for _, dados in validos]
+
+
+def _montar_eventos(validos, user, erros):
+    """Cria as instâncias de Evento, conferindo locais e agenda do lote
+
+    Os locais do lote são conferidos em uma consulta; os eventos já
+    gravados nesses locais, no período coberto pelo lote, são lidos em
+    outra e indexados em memória, junto com os aceitos do próprio lote.
+    """
+    ids = {dados['local_id'] for _, dados in validos}
+    permitidos = set(Local.objects.filter(usuario=user, pk__in=ids)
+                     .values_list('pk', flat=True))
+    proprios = []
+    for linha, dados in validos:
+        if dados['local_id'] not in permitidos:
+            erros.append((linha, {"local": ["Local inválido ou de outro "
+                                            "usuário."]}))
+        else:
+            proprios.append((linha, dados))
+
+    agendados = [(linha, dados['local_id'], dados['dataInicio'],
+                  dados['dataFim']) for linha, dados in proprios
+                 if dados.get('status') != 'CANCELADO']
+    conflitantes = conflitos_em_lote(
+        agendados, Evento.objects.agendas_para(agendados)
+    )
+    eventos = []
+    for linha, dados in proprios:
+        if linha in conflitantes:
+            erros.append((linha, {"non_field_errors": [MENSAGEM_CONFLITO_LOTE]}))
+        else:
+            eventos.append(Evento(usuario=user, **dados))
+    return eventos
+
+
+# tipo: (modelo, serializer, montagem das instâncias, ação após gravar)
+IMPORTADORES = {
+    'locais': (Local, LocalSerializer, _montar_locais, None),
+    'eventos': (Evento, EventoImportacaoSerializer, _montar_eventos,
+                somar_eventos_ao_resumo),
+}
+
+
+def importar(tipo, registros, user, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    """Importa locais ou eventos do usuário a partir de um gerador de registros
+
+    Cada lote é gravado na sua própria transação. Registros inválidos são
+    rejeitados sem impedir a gravação dos demais. Retorna um resumo com as
+    quantidades, os primeiros erros e a vazão obtida.
+    """
+    if tipo not in IMPORTADORES:
+        raise ValidationError(f"Tipo de importação inválido: {tipo}.")
+    modelo, serializer_class, montar, depois_de_gravar = IMPORTADORES[tipo]
+    validador = serializer_class()
+
+    inicio = time.perf_counter()
+    importados = rejeitados = 0
+    erros_reportados = []
+    for lote in _em_lotes(registros, tamanho_lote):
+        erros = []
+        objetos = montar(_validar(validador, lote, erros), user, erros)
+        if objetos:
+            with transaction.atomic():
+                modelo.objects.bulk_create(objetos, batch_size=tamanho_lote)
+                # bulk_create não dispara os sinais que mudam a versão e o
+                # resumo mensal
+                if depois_de_gravar is not None:
+                    depois_de_gravar(objetos)
+                incrementar_versao_dados(user.pk)
+        importados += len(objetos)
+        rejeitados += len(erros)
+        vagas = MAX_ERROS_REPORTADOS - len(erros_reportados)
+        erros_reportados.extend(
+            {"linha": linha, "erros": detalhe}
+            for linha, detalhe in sorted(erros, key=lambda erro: erro[0])[:vagas]
+        )
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "importados": importados,
+        "rejeitados": rejeitados,
+        "erros": erros_reportados,
+        "segundos": round(segundos, 3),
+        "registros_por_segundo": round(
+            (importados + rejeitados) / segundos, 1) if segundos else None,
+    }
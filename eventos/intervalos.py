@@ -0,0 +1,112 @@
+"""Estruturas para consultas de sobreposição de intervalos de tempo
+
+Os intervalos são semiabertos, ``[inicio, fim)``: um evento que termina
+exatamente quando outro começa não conflita com ele.
+"""
+import heapq
+from bisect import bisect_left
+from itertools import accumulate
+
+
+def sobrepoe(inicio_a, fim_a, inicio_b, fim_b):
+    """Indica se dois intervalos semiabertos se sobrepõem"""
+    return inicio_a < fim_b and inicio_b < fim_a
+
+
+class IndiceIntervalos:
+    """Índice em memória para perguntar se um intervalo conflita com outros
+
+    Cada bloco guarda os inícios ordenados e, para cada posição, o maior fim
+    até ali: ``[inicio, fim)`` conflita com o bloco se algum dos intervalos
+    que começam antes de ``fim`` termina depois de ``inicio`` (uma busca
+    binária e uma leitura). Os intervalos adicionados entram em blocos
+    novos, que são fundidos quando ficam do tamanho do anterior, como num
+    contador binário: há O(log n) blocos, então a consulta custa
+    O(log² n) e a inserção O(log n) amortizado. Serve para validar um lote
+    inteiro sem uma consulta por item e sem custo quadrático.
+    """
+
+    def __init__(self, intervalos=()):
+        self._blocos = []
+        intervalos = sorted(intervalos)
+        if intervalos:
+            self._blocos.append(_bloco(intervalos))
+
+    def __len__(self):
+        return sum(len(intervalos) for intervalos, _, _ in self._blocos)
+
+    def conflita(self, inicio, fim):
+        """Indica se ``[inicio, fim)`` se sobrepõe a algum intervalo guardado"""
+        for _, inicios, max_fim in self._blocos:
+            posicao = bisect_left(inicios, fim)
+            if posicao > 0 and max_fim[posicao - 1] > inicio:
+                return True
+        return False
+
+    def adicionar(self, inicio, fim):
+        """Guarda mais um intervalo"""
+        intervalos = [(inicio, fim)]
+        while self._blocos and len(self._blocos[-1][0]) <= len(intervalos):
+            intervalos = list(heapq.merge(self._blocos.pop()[0], intervalos))
+        self._blocos.append(_bloco(intervalos))
+
+
+def _bloco(intervalos):
+    """(intervalos, inicios, maior fim até cada posição) de uma lista
+    ordenada"""
+    inicios = [inicio for inicio, _ in intervalos]
+    max_fim = list(accumulate((fim for _, fim in intervalos), max))
+    return intervalos, inicios, max_fim
+
+
+def encontrar_sobreposicoes(intervalos):
+    """Gera os pares de intervalos que se sobrepõem
+
+    ``intervalos`` é um iterável de (inicio, fim, item) já ordenado por
+    ``inicio``; ele é percorrido uma única vez (varredura com um heap dos
+    intervalos ainda abertos), então pode vir direto de um iterator do
+    banco. Gera (item anterior, item posterior) para cada sobreposição.
+    """
+    abertos = []
+    for ordem, (inicio, fim, item) in enumerate(intervalos):
+        while abertos and abertos[0][0] <= inicio:
+            heapq.heappop(abertos)
+        for _, _, anterior in abertos:
+            yield anterior, item
+        heapq.heappush(abertos, (fim, ordem, item))
+
+
+def janelas_livres(ocupados, inicio, fim):
+    """Gera as janelas (inicio, fim) livres dentro de ``[inicio, fim)``
+
+    ``ocupados`` é um iterável de (inicio, fim) ordenado por início; a
+    varredura guarda só até onde o período já está ocupado, então basta
+    uma passada.
+    """
+    livre_desde = inicio
+    for ocupado_inicio, ocupado_fim in ocupados:
+        if ocupado_inicio >= fim:
+            break
+        if ocupado_inicio > livre_desde:
+            yield livre_desde, ocupado_inicio
+        livre_desde = max(livre_desde, ocupado_fim)
+    if livre_desde < fim:
+        yield livre_desde, fim
+
+
+def conflitos_em_lote(itens, agendas):
+    """Índices dos itens de um lote que conflitam na agenda do seu local
+
+    ``itens`` são tuplas (indice, local, inicio, fim) na ordem em que devem
+    ser aceitos; ``agendas`` mapeia cada local para um IndiceIntervalos com
+    os eventos já gravados. Cada item aceito entra na agenda, então itens
+    do próprio lote que se sobrepõem também são apontados (o posterior).
+    """
+    conflitantes = set()
+    for indice, local, inicio, fim in itens:
+        agenda = agendas.setdefault(local, IndiceIntervalos())
+        if agenda.conflita(inicio, fim):
+            conflitantes.add(indice)
+        else:
+            agenda.adicionar(inicio, fim)
+    return conflitantes
@@ -0,0 +1,52 @@
+"""Comando para importar locais ou eventos de um arquivo CSV ou NDJSON"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from eventos.importacao import (
+    IMPORTADORES, TAMANHO_LOTE_PADRAO, formato_do_arquivo, importar,
+    ler_registros
+)
+
+
+class Command(BaseCommand):
+    """Importa locais ou eventos em lotes, lendo o arquivo como fluxo"""
+    help = ("Importa locais ou eventos de um arquivo CSV ou NDJSON para um "
+            "usuário, em lotes gravados com bulk_create.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(IMPORTADORES))
+        parser.add_argument('arquivo', help="Caminho do arquivo.")
+        parser.add_argument('--usuario', required=True,
+                            help="Username do dono dos registros.")
+        parser.add_argument('--formato',
+                            help="csv ou ndjson (padrão: pela extensão).")
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_PADRAO,
+                            help="Registros por lote.")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['usuario'])
+        except get_user_model().DoesNotExist as exc:
+            raise CommandError("Usuário não encontrado.") from exc
+        if options['lote'] < 1:
+            raise CommandError("O lote deve ter ao menos 1 registro.")
+
+        try:
+            formato = formato_do_arquivo(options['arquivo'],
+                                         options['formato'])
+            with open(options['arquivo'], encoding='utf-8-sig',
+                      newline='') as texto:
+                resultado = importar(options['tipo'],
+                                     ler_registros(texto, formato), user,
+                                     options['lote'])
+        except (OSError, ValidationError) as exc:
+            raise CommandError(str(exc)) from exc
+
+        for erro in resultado['erros']:
+            self.stderr.write(f"Linha {erro['linha']}: {erro['erros']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['importados']} importado(s), "
+            f"{resultado['rejeitados']} rejeitado(s) em "
+            f"{resultado['segundos']}s "
+            f"({resultado['registros_por_segundo']} registros/s)."
+        ))
@@ -0,0 +1,70 @@
+"""Comando para reconstruir ou verificar os totais de custos dos eventos"""
+# pylint: disable=no-member
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from eventos.models import Custo, Evento
+from eventos.resumos import reconstruir_resumo_mensal
+from eventos.services import VALOR_FIELD, incrementar_versao_dados_de_todos
+
+
+def _totais_reais():
+    """Expressões com a soma e a contagem reais dos custos de cada evento"""
+    custos = Custo.objects.filter(evento=OuterRef('pk')).order_by() \
+        .values('evento')
+    total = Coalesce(
+        Subquery(custos.annotate(total=Sum('valor')).values('total')),
+        Value(Decimal('0')), output_field=VALOR_FIELD,
+    )
+    quantidade = Coalesce(
+        Subquery(custos.annotate(qtd=Count('id')).values('qtd')), Value(0)
+    )
+    return total, quantidade
+
+
+class Command(BaseCommand):
+    """Reconstrói (ou apenas verifica) Evento.total_custos e qtd_custos"""
+    help = ("Reconstrói os totais materializados de custos dos eventos. "
+            "Com --verificar apenas lista as divergências.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help="Não altera nada; falha se algum total estiver divergente.",
+        )
+
+    def handle(self, *args, **options):
+        total, quantidade = _totais_reais()
+        if not options['verificar']:
+            atualizados = Evento.objects.update(total_custos=total,
+                                                qtd_custos=quantidade)
+            # O resumo mensal é derivado desses totais
+            linhas = reconstruir_resumo_mensal()
+            # Invalida ETags e respostas em cache com os totais antigos
+            incrementar_versao_dados_de_todos()
+            self.stdout.write(self.style.SUCCESS(
+                f"Totais reconstruídos para {atualizados} evento(s) e "
+                f"{linhas} linha(s) do resumo mensal."
+            ))
+            return
+
+        divergentes = 0
+        eventos = Evento.objects.annotate(
+            total_real=total, qtd_real=quantidade
+        ).values_list('id', 'total_custos', 'qtd_custos', 'total_real',
+                      'qtd_real')
+        for evento_id, salvo, qtd_salva, real, qtd_real in \
+                eventos.iterator(chunk_size=2000):
+            if salvo.quantize(Decimal('0.01')) != \
+                    real.quantize(Decimal('0.01')) or qtd_salva != qtd_real:
+                divergentes += 1
+                self.stdout.write(
+                    f"Evento {evento_id}: salvo {salvo} ({qtd_salva}), "
+                    f"real {real} ({qtd_real})"
+                )
+        if divergentes:
+            raise CommandError(f"{divergentes} evento(s) com totais "
+                               "divergentes. Rode sem --verificar para "
+                               "corrigir.")
+        self.stdout.write(self.style.SUCCESS("Todos os totais conferem."))
@@ -0,0 +1,60 @@
+"""Comando para reconstruir ou verificar o resumo mensal de orçamento e
+custos"""
+# pylint: disable=no-member
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from eventos.resumos import divergencias_do_resumo, reconstruir_resumo_mensal
+from eventos.services import (
+    incrementar_versao_dados, incrementar_versao_dados_de_todos
+)
+
+
+class Command(BaseCommand):
+    """Reconstrói (ou apenas verifica) a tabela ResumoMensal"""
+    help = ("Reconstrói o resumo mensal a partir dos eventos. Com "
+            "--verificar apenas lista as divergências.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help="Não altera nada; falha se alguma linha estiver divergente.",
+        )
+        parser.add_argument(
+            '--usuario', help="Limita ao usuário com este username.",
+        )
+
+    def handle(self, *args, **options):
+        usuario = None
+        if options['usuario']:
+            try:
+                usuario = get_user_model().objects.get(
+                    username=options['usuario'])
+            except get_user_model().DoesNotExist as e:
+                raise CommandError(
+                    f"Usuário {options['usuario']} não encontrado.") from e
+
+        if not options['verificar']:
+            linhas = reconstruir_resumo_mensal(usuario)
+            # Invalida ETags e respostas em cache com o resumo antigo
+            if usuario is None:
+                incrementar_versao_dados_de_todos()
+            else:
+                incrementar_versao_dados(usuario.pk)
+            self.stdout.write(self.style.SUCCESS(
+                f"Resumo mensal reconstruído com {linhas} linha(s)."
+            ))
+            return
+
+        divergentes = 0
+        for chave, salvo, esperado in divergencias_do_resumo(usuario):
+            divergentes += 1
+            usuario_id, local_id, mes, situacao = chave
+            self.stdout.write(
+                f"Usuário {usuario_id}, local {local_id}, {mes:%Y-%m}, "
+                f"{situacao}: salvo {salvo}, esperado {esperado}"
+            )
+        if divergentes:
+            raise CommandError(f"{divergentes} linha(s) do resumo "
+                               "divergentes. Rode sem --verificar para "
+                               "corrigir.")
+        self.stdout.write(self.style.SUCCESS("O resumo mensal confere."))
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.3 on 2026-10-17 10:05
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_totais(apps, schema_editor):
+    """Calcula os totais dos eventos que já existem"""
+    Evento = apps.get_model('eventos', 'Evento')
+    Custo = apps.get_model('eventos', 'Custo')
+    custos = Custo.objects.filter(evento=OuterRef('pk')).order_by().values('evento')
+    Evento.objects.update(
+        total_custos=Coalesce(
+            Subquery(custos.annotate(total=Sum('valor')).values('total')),
+            Value(0), output_field=DecimalField(max_digits=15, decimal_places=2),
+        ),
+        qtd_custos=Coalesce(
+            Subquery(custos.annotate(qtd=Count('id')).values('qtd')), Value(0)
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventos', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evento',
+            name='total_custos',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='evento',
+            name='qtd_custos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(preencher_totais, migrations.RunPython.noop),
+    ]
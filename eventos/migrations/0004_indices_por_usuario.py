@@ -0,0 +1,25 @@
+# Generated by Django 4.2.3 on 2026-10-17 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventos', '0003_evento_total_custos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['usuario', 'dataInicio'], name='evento_usuario_inicio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['usuario', 'status'], name='evento_usuario_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='custo',
+            index=models.Index(fields=['evento', 'id'], name='custo_evento_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventos', '0004_indices_por_usuario'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['local', 'dataFim'], name='evento_local_fim_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.3 on 2026-10-17 14:05
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+import django.db.models.deletion
+
+
+def preencher_resumo(apps, schema_editor):
+    """Monta o resumo mensal a partir dos eventos já existentes"""
+    Evento = apps.get_model('eventos', 'Evento')
+    ResumoMensal = apps.get_model('eventos', 'ResumoMensal')
+    total = models.DecimalField(max_digits=18, decimal_places=2)
+    linhas = Evento.objects.order_by() \
+        .annotate(mes=TruncMonth('dataInicio', output_field=models.DateField())) \
+        .values('usuario', 'local', 'mes', 'status').annotate(
+            orcamento_total=Coalesce(Sum('orcamento'), Value(Decimal('0')),
+                                     output_field=total),
+            custos_total=Coalesce(Sum('total_custos'), Value(Decimal('0')),
+                                  output_field=total),
+            qtd_eventos=Count('id'),
+            qtd_estouros=Count('id', filter=Q(total_custos__gt=F('orcamento'))),
+        )
+    ResumoMensal.objects.bulk_create(
+        (ResumoMensal(usuario_id=linha.pop('usuario'),
+                      local_id=linha.pop('local'), **linha)
+         for linha in linhas.iterator(chunk_size=2000)),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('eventos', '0005_evento_local_fim_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('status', models.CharField(choices=[('PLANEJADO', 'Planejado'), ('CONFIRMADO', 'Confirmado'), ('EM_ANDAMENTO', 'Em Andamento'), ('FINALIZADO', 'Finalizado'), ('CANCELADO', 'Cancelado')], max_length=12)),
+                ('orcamento_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('custos_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('qtd_eventos', models.PositiveIntegerField(default=0)),
+                ('qtd_estouros', models.PositiveIntegerField(default=0)),
+                ('local', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='eventos.local')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Resumo mensal',
+                'verbose_name_plural': 'Resumos mensais',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumomensal',
+            constraint=models.UniqueConstraint(fields=('usuario', 'local', 'mes', 'status'), name='resumo_mensal_unico'),
+        ),
+        migrations.RunPython(preencher_resumo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,211 @@
+"""Mixins dos viewsets de eventos"""
+import hashlib
+import pickle
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .serializers import leitura_rapida
+from .services import get_versao_dados
+
+CONFIGURACAO_CACHE_PADRAO = {
+    'ATIVO': True,
+    # Alias em CACHES; o backend (locmem, arquivo...) define a expulsão LRU
+    # e o limite de entradas (OPTIONS.MAX_ENTRIES)
+    'ALIAS': 'respostas',
+    # Respostas maiores que isso (em bytes) não são guardadas; junto com
+    # MAX_ENTRIES limita a memória usada pelo cache (no locmem, por processo)
+    'TAMANHO_MAXIMO': 64 * 1024,
+}
+CHAVE_ACERTOS = 'respostas:acertos'
+CHAVE_FALHAS = 'respostas:falhas'
+
+
+def versao_da_requisicao(request):
+    """Versão dos dados do usuário, lida uma única vez por requisição"""
+    if not hasattr(request, '_versao_dados'):
+        request._versao_dados = get_versao_dados(request.user)
+    return request._versao_dados
+
+
+def configuracao_cache_respostas():
+    """Configuração de RESPOSTAS_CACHE completada com os valores padrão"""
+    return {**CONFIGURACAO_CACHE_PADRAO,
+            **getattr(settings, 'RESPOSTAS_CACHE', {})}
+
+
+def _contar(cache, chave):
+    """Incrementa um contador do cache, criando-o se preciso"""
+    if not cache.add(chave, 1, timeout=None):
+        try:
+            cache.incr(chave)
+        except ValueError:
+            cache.set(chave, 1, timeout=None)
+
+
+def estatisticas_cache_respostas():
+    """Acertos, falhas e taxa de acerto do cache de respostas
+
+    Os contadores ficam no próprio cache: com o locmem são os do processo
+    que atendeu a requisição, não os do serviço inteiro.
+    """
+    cache = caches[configuracao_cache_respostas()['ALIAS']]
+    acertos = cache.get(CHAVE_ACERTOS, 0)
+    falhas = cache.get(CHAVE_FALHAS, 0)
+    total = acertos + falhas
+    return {'acertos': acertos, 'falhas': falhas,
+            'taxa_acerto': round(acertos / total, 4) if total else None}
+
+
+class CacheRespostaMixin:
+    """Cache de leitura (read-through) para list e retrieve
+
+    A chave junta usuário, versão dos dados do usuário, endpoint e a URL
+    com os parâmetros. Como toda escrita nos dados do usuário (pela API ou
+    pelo ORM) incrementa a versão, as entradas antigas deixam de ser lidas
+    na hora e saem do cache pela expulsão LRU do backend.
+    """
+
+    def chave_cache_resposta(self, request):
+        """Chave da resposta para o usuário, a versão e a URL pedida"""
+        url = hashlib.sha256(
+            request.build_absolute_uri().encode()).hexdigest()[:32]
+        return (f"resposta:{request.user.pk}:{versao_da_requisicao(request)}:"
+                f"{self.basename}:{self.action}:{url}")
+
+    def resposta_em_cache(self, request, gerar, *args, **kwargs):
+        """Devolve a resposta guardada ou gera, guarda e devolve"""
+        configuracao = configuracao_cache_respostas()
+        if not configuracao['ATIVO'] or request.method != 'GET' or \
+                not request.user.is_authenticated:
+            return gerar(request, *args, **kwargs)
+        cache = caches[configuracao['ALIAS']]
+        chave = self.chave_cache_resposta(request)
+        guardado = cache.get(chave)
+        if guardado is not None:
+            _contar(cache, CHAVE_ACERTOS)
+            return Response(pickle.loads(guardado), headers={'X-Cache': 'HIT'})
+
+        _contar(cache, CHAVE_FALHAS)
+        response = gerar(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            dados = pickle.dumps(response.data)
+            if len(dados) <= configuracao['TAMANHO_MAXIMO']:
+                cache.set(chave, dados)
+            response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """Listagem servida pelo cache de respostas"""
+        return self.resposta_em_cache(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Detalhe servido pelo cache de respostas"""
+        return self.resposta_em_cache(request, super().retrieve,
+                                      *args, **kwargs)
+
+
+class ETagVersaoMixin:
+    """GET condicional (ETag / If-None-Match) para list e retrieve
+
+    O ETag é derivado da versão dos dados do usuário (``versao_dados``),
+    que muda a cada escrita em Local, Evento ou Custo dele, e da URL e
+    formato pedidos. Se o cliente já tem a versão atual a resposta 304 sai
+    antes de ``get_queryset`` e de qualquer serialização, com uma única
+    consulta pela versão.
+    """
+
+    def gerar_etag(self, request):
+        """ETag forte da resposta para o usuário e a URL da requisição"""
+        base = (f"{request.user.pk}:{versao_da_requisicao(request)}:"
+                f"{request.build_absolute_uri()}:"
+                f"{request.accepted_renderer.format}")
+        return f'"{hashlib.sha256(base.encode()).hexdigest()[:32]}"'
+
+    def resposta_condicional(self, request, gerar, *args, **kwargs):
+        """Responde 304 se o ETag bate; senão gera a resposta e anexa o ETag"""
+        if request.method not in ('GET', 'HEAD') or \
+                not request.user.is_authenticated:
+            return gerar(request, *args, **kwargs)
+        etag = self.gerar_etag(request)
+        recebidos = request.headers.get('If-None-Match', '')
+        if etag in [valor.strip() for valor in recebidos.split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers={'ETag': etag})
+        response = gerar(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """Listagem com suporte a GET condicional"""
+        return self.resposta_condicional(request, super().list,
+                                         *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Detalhe com suporte a GET condicional"""
+        return self.resposta_condicional(request, super().retrieve,
+                                         *args, **kwargs)
+
+
+class CamposEsparsosMixin:
+    """``?fields=`` e leitura enxuta para list e retrieve
+
+    ``fields`` (nomes separados por vírgula) limita tanto a saída quanto as
+    colunas lidas do banco. A listagem lê as linhas com ``values()`` e as
+    converte com os campos do serializer (LeituraRapida), sem instanciar
+    modelos; serializers com campos que não são colunas usam o caminho
+    normal.
+    """
+
+    def campos_pedidos(self):
+        """Campos pedidos em ``?fields=``, validados, ou None"""
+        if not hasattr(self, '_campos_pedidos'):
+            valor = self.request.query_params.get('fields', '')
+            campos = tuple(dict.fromkeys(
+                nome.strip() for nome in valor.split(',') if nome.strip()))
+            if campos:
+                disponiveis = self.get_serializer_class()().fields
+                invalidos = [nome for nome in campos
+                             if nome not in disponiveis]
+                if invalidos:
+                    raise ValidationError({'fields': [
+                        f"Campo(s) inexistente(s): {', '.join(invalidos)}."]})
+            self._campos_pedidos = campos or None
+        return self._campos_pedidos
+
+    def get_serializer(self, *args, **kwargs):
+        """Serializer restrito aos campos pedidos na leitura"""
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('campos', self.campos_pedidos())
+        return super().get_serializer(*args, **kwargs)
+
+    def _colunas_da_ordenacao(self):
+        ordenacao = getattr(self.pagination_class, 'ordering', ()) or ()
+        return tuple(campo.lstrip('-') for campo in ordenacao)
+
+    def filter_queryset(self, queryset):
+        """No detalhe com ``fields``, lê só as colunas necessárias"""
+        queryset = super().filter_queryset(queryset)
+        campos = self.campos_pedidos() if self.action == 'retrieve' else None
+        if campos:
+            leitura = leitura_rapida(self.get_serializer_class(), campos)
+            if leitura is not None:
+                queryset = queryset.only(*leitura.colunas)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """Listagem a partir de ``values()`` quando o serializer permite"""
+        leitura = leitura_rapida(self.get_serializer_class(),
+                                 self.campos_pedidos())
+        if leitura is None:
+            return super().list(request, *args, **kwargs)
+        # A paginação por cursor precisa das colunas da ordenação
+        colunas = tuple(dict.fromkeys(
+            leitura.colunas + self._colunas_da_ordenacao()))
+        linhas = self.filter_queryset(self.get_queryset()).values(*colunas)
+        pagina = self.paginate_queryset(linhas)
+        if pagina is not None:
+            return self.get_paginated_response(leitura.representar(pagina))
+        return Response(leitura.representar(linhas))
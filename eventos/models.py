@@ -2,6 +2,7 @@
 
 from django.db import models
 from usuarios.models import Usuario
+from .intervalos import IndiceIntervalos
 
 
 class Local(models.Model):
@@ -30,6 +31,67 @@ class Local(models.Model):
         verbose_name_plural = "Locais"
 
 
+class EventoQuerySet(models.QuerySet):
+    """Consultas reutilizáveis de Evento"""
+
+    def sobrepostos(self, inicio, fim):
+        """Eventos não cancelados que se sobrepõem ao intervalo [inicio, fim)
+
+        A condição em ``dataFim`` vem primeiro para aproveitar o índice
+        (local, dataFim): só são lidos eventos que terminam depois de
+        ``inicio``, e não o histórico inteiro do local.
+        """
+        return self.filter(dataFim__gt=inicio, dataInicio__lt=fim) \
+            .exclude(status='CANCELADO')
+
+    def no_periodo(self, inicio_apos=None, fim_antes=None):
+        """Eventos que começam a partir de ``inicio_apos`` e terminam até
+        ``fim_antes``
+
+        Como o fim nunca é anterior ao início, ``fim_antes`` também limita
+        ``dataInicio``: com os dois limites a consulta lê só a faixa do
+        período no índice (usuario, dataInicio).
+        """
+        eventos = self
+        if inicio_apos is not None:
+            eventos = eventos.filter(dataInicio__gte=inicio_apos)
+        if fim_antes is not None:
+            eventos = eventos.filter(dataInicio__lte=fim_antes,
+                                     dataFim__lte=fim_antes)
+        return eventos
+
+    def sobrepostos_ao_periodo(self, inicio, fim):
+        """Eventos que ocupam algum instante de [inicio, fim), inclusive os
+        que começam antes de ``inicio`` ou terminam depois de ``fim``
+
+        Só ``dataInicio < fim`` limita a faixa lida no índice
+        (usuario, dataInicio); ``dataFim > inicio`` é conferido nas linhas
+        dessa faixa.
+        """
+        return self.filter(dataInicio__lt=fim, dataFim__gt=inicio)
+
+    def agendas(self):
+        """Índices de intervalos em memória com os eventos de cada local"""
+        intervalos = {}
+        for local, inicio, fim in self.values_list('local', 'dataInicio',
+                                                   'dataFim'):
+            intervalos.setdefault(local, []).append((inicio, fim))
+        return {local: IndiceIntervalos(lista)
+                for local, lista in intervalos.items()}
+
+    def agendas_para(self, itens):
+        """Agendas dos locais de um lote de (indice, local, inicio, fim)
+
+        Lê, em uma única consulta, só os eventos que se sobrepõem ao
+        período coberto pelo lote.
+        """
+        if not itens:
+            return {}
+        return self.filter(local__in={local for _, local, _, _ in itens}) \
+            .sobrepostos(min(inicio for _, _, inicio, _ in itens),
+                         max(fim for _, _, _, fim in itens)).agendas()
+
+
 class Evento(models.Model):
     """Models de Evento"""
     STATUS = [
@@ -49,14 +111,49 @@ class Evento(models.Model):
     observacoes = models.TextField(blank=True)
     local = models.ForeignKey(Local, on_delete=models.PROTECT)
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+    # Totais materializados dos custos, mantidos pelos sinais de Custo
+    total_custos = models.DecimalField(max_digits=15, decimal_places=2,
+                                       default=0, editable=False)
+    qtd_custos = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = EventoQuerySet.as_manager()
+
+    # Só mudam pelos sinais de Custo (ou pelo comando recalcular_custos)
+    CAMPOS_MATERIALIZADOS = ('total_custos', 'qtd_custos')
 
     def __str__(self):
         return f"Evento {self.titulo}"
 
+    def save(self, *args, **kwargs):
+        """Salva o evento sem sobrescrever os totais de custos
+
+        Uma instância carregada antes de um custo novo traz totais
+        defasados; por isso a atualização grava todos os campos, menos os
+        materializados.
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert') and args == ():
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key
+                and campo.name not in self.CAMPOS_MATERIALIZADOS
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         """ Como os verbos do model devem se comportar"""
         verbose_name = "Evento"
         verbose_name_plural = "Eventos"
+        indexes = [
+            # Listagem paginada e filtros de período dos eventos do usuário
+            models.Index(fields=['usuario', 'dataInicio'],
+                         name='evento_usuario_inicio_idx'),
+            models.Index(fields=['usuario', 'status'],
+                         name='evento_usuario_status_idx'),
+            # Conflitos de agenda: eventos do local que ainda não terminaram
+            models.Index(fields=['local', 'dataFim'],
+                         name='evento_local_fim_idx'),
+        ]
 
 
 class Custo(models.Model):
@@ -72,3 +169,42 @@ class Custo(models.Model):
         """ Como os verbos do model devem se comportar"""
         verbose_name = "Custo"
         verbose_name_plural = "Custos"
+        indexes = [
+            # Custos de um evento em ordem de criação (paginação por cursor)
+            models.Index(fields=['evento', 'id'], name='custo_evento_id_idx'),
+        ]
+
+
+class ResumoMensal(models.Model):
+    """Totais de orçamento e custos por usuário, local, mês e status
+
+    Tabela materializada para os relatórios: cada evento contribui para a
+    linha do mês da sua ``dataInicio``. É mantida de forma incremental pelos
+    sinais de Evento e Custo (módulo ``resumos``) e pode ser reconstruída
+    com o comando ``recalcular_resumo_mensal``.
+    """
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+    local = models.ForeignKey(Local, on_delete=models.CASCADE)
+    # Primeiro dia do mês
+    mes = models.DateField()
+    status = models.CharField(choices=Evento.STATUS, max_length=12)
+    orcamento_total = models.DecimalField(max_digits=18, decimal_places=2,
+                                          default=0)
+    custos_total = models.DecimalField(max_digits=18, decimal_places=2,
+                                       default=0)
+    qtd_eventos = models.PositiveIntegerField(default=0)
+    qtd_estouros = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Resumo {self.mes:%Y-%m} {self.status}"
+
+    class Meta:
+        """ Como os verbos do model devem se comportar"""
+        verbose_name = "Resumo mensal"
+        verbose_name_plural = "Resumos mensais"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['usuario', 'local', 'mes', 'status'],
+                name='resumo_mensal_unico'
+            ),
+        ]
@@ -0,0 +1,26 @@
+"""Paginação por cursor (keyset) usada pelos endpoints de eventos"""
+from gerenciamento_eventos.pagination import PaginacaoPorCursor
+
+
+class LocalCursorPagination(PaginacaoPorCursor):
+    """Locais do usuário em ordem de criação"""
+    ordering = ('id',)
+
+
+class EventoCursorPagination(PaginacaoPorCursor):
+    """Eventos do usuário em ordem cronológica
+
+    O ``id`` só desempata a ordenação. O CursorPagination do DRF filtra
+    apenas pela primeira coluna (``dataInicio > posição``, pelo índice
+    ``(usuario, dataInicio)``) e pula com OFFSET os eventos que começam no
+    mesmo instante do último da página anterior. O custo de uma página
+    cresce só com a quantidade desses empates, não com a profundidade.
+    A rota assíncrona (``views_async``) usa o keyset completo
+    ``(dataInicio, id)``.
+    """
+    ordering = ('dataInicio', 'id')
+
+
+class CustoCursorPagination(PaginacaoPorCursor):
+    """Custos em ordem de criação"""
+    ordering = ('id',)
@@ -0,0 +1,53 @@
+"""Leitura dos parâmetros de query string das views de eventos
+
+Compartilhado pelas views do DRF e pelas views assíncronas
+(``views_async``), que recebem um ``Request`` do DRF em volta da
+requisição do Django. Valores inválidos levantam ``ValidationError`` com o
+nome do parâmetro.
+"""
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+def parametro_data(request, nome):
+    """Lê um parâmetro de query string como data e hora (ISO 8601)"""
+    valor = request.query_params.get(nome)
+    if not valor:
+        return None
+    try:
+        return serializers.DateTimeField().to_internal_value(valor)
+    except ValidationError as ve:
+        raise ValidationError({nome: ve.detail}) from ve
+
+
+def parametro_inteiro(request, nome):
+    """Lê um parâmetro de query string como inteiro não negativo"""
+    valor = request.query_params.get(nome)
+    if not valor:
+        return None
+    try:
+        return serializers.IntegerField(min_value=0).to_internal_value(valor)
+    except ValidationError as ve:
+        raise ValidationError({nome: ve.detail}) from ve
+
+
+def filtros_de_eventos(request):
+    """Lê os filtros de listagem de eventos da query string
+
+    ``status`` aceita vários valores separados por vírgula.
+    """
+    situacoes = request.query_params.get('status')
+    return {
+        'inicio_apos': parametro_data(request, 'inicio_apos'),
+        'fim_antes': parametro_data(request, 'fim_antes'),
+        'situacoes': [situacao.strip().upper()
+                      for situacao in situacoes.split(',') if situacao.strip()]
+        if situacoes else None,
+        'local': parametro_inteiro(request, 'local'),
+    }
+
+
+def parametro_booleano(request, nome):
+    """Lê um parâmetro de query string como booleano (true/1/sim)"""
+    valor = request.query_params.get(nome, '')
+    return valor.strip().lower() in ('1', 'true', 'sim')
@@ -0,0 +1,188 @@
+"""Manutenção da tabela materializada ResumoMensal
+
+Cada evento contribui para uma linha (usuario, local, mês de início,
+status) com o seu orçamento, o seu total de custos, uma unidade em
+``qtd_eventos`` e, se os custos passam do orçamento, uma em
+``qtd_estouros``. As funções daqui aplicam só a diferença entre a
+contribuição anterior e a atual, com expressões F, para que escritas
+concorrentes não se sobrescrevam.
+"""
+# pylint: disable=no-member
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, DateField, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+from .models import Evento, ResumoMensal
+
+# Campos do evento que definem a sua contribuição para o resumo
+CAMPOS_CONTRIBUICAO = ('usuario_id', 'local_id', 'dataInicio', 'status',
+                       'orcamento', 'total_custos')
+CAMPOS_TOTAIS = ('orcamento_total', 'custos_total', 'qtd_eventos',
+                 'qtd_estouros')
+TOTAL_FIELD = DecimalField(max_digits=18, decimal_places=2)
+
+
+def mes_de(data_inicio):
+    """Primeiro dia do mês de ``data_inicio`` no fuso atual (como TruncMonth)"""
+    data = Evento._meta.get_field('dataInicio').to_python(data_inicio)
+    if timezone.is_aware(data):
+        data = timezone.localtime(data)
+    return data.date().replace(day=1)
+
+
+def estado_do_evento(evento):
+    """Campos de contribuição de uma instância, ou None se algum foi adiado"""
+    # Lê do __dict__ para não disparar consultas em campos adiados
+    estado = {campo: evento.__dict__.get(campo)
+              for campo in CAMPOS_CONTRIBUICAO}
+    return None if None in estado.values() else estado
+
+
+def estado_gravado(evento_id):
+    """Campos de contribuição do evento como estão no banco"""
+    return Evento.objects.filter(pk=evento_id) \
+        .values(*CAMPOS_CONTRIBUICAO).first()
+
+
+def contribuicao(estado):
+    """(chave, totais) com que um evento entra no resumo"""
+    orcamento = Decimal(str(estado['orcamento']))
+    custos = Decimal(str(estado['total_custos']))
+    chave = (estado['usuario_id'], estado['local_id'],
+             mes_de(estado['dataInicio']), estado['status'])
+    return chave, {'orcamento_total': orcamento, 'custos_total': custos,
+                   'qtd_eventos': 1, 'qtd_estouros': int(custos > orcamento)}
+
+
+def _somar(chave, totais):
+    """Soma os totais (positivos ou negativos) à linha da chave"""
+    alteracoes = {campo: F(campo) + valor
+                  for campo, valor in totais.items() if valor}
+    if not alteracoes:
+        return
+    usuario_id, local_id, mes, situacao = chave
+    linha = ResumoMensal.objects.filter(usuario_id=usuario_id,
+                                        local_id=local_id, mes=mes,
+                                        status=situacao)
+    if linha.update(**alteracoes):
+        return
+    if any(valor < 0 for valor in totais.values()):
+        # Nada a descontar de uma linha que não existe; o comando
+        # recalcular_resumo_mensal corrige o resumo se ele estiver defasado
+        return
+    ResumoMensal.objects.get_or_create(usuario_id=usuario_id,
+                                       local_id=local_id, mes=mes,
+                                       status=situacao)
+    linha.update(**alteracoes)
+
+
+def atualizar_resumo(anterior=None, atual=None):
+    """Troca a contribuição ``anterior`` pela ``atual`` (estados de evento)
+
+    Sem ``anterior`` o evento é somado; sem ``atual`` é descontado. Quando
+    a chave não muda, as duas viram uma única atualização.
+    """
+    diferencas = defaultdict(lambda: dict.fromkeys(CAMPOS_TOTAIS, 0))
+    for estado, sinal in ((anterior, -1), (atual, 1)):
+        if estado is not None:
+            chave, totais = contribuicao(estado)
+            for campo, valor in totais.items():
+                diferencas[chave][campo] += sinal * valor
+    with transaction.atomic(savepoint=False):
+        for chave, totais in diferencas.items():
+            _somar(chave, totais)
+
+
+def somar_custos_ao_resumo(evento_id, valor):
+    """Aplica ao resumo um ``valor`` já somado a Evento.total_custos"""
+    if not valor:
+        return
+    atual = estado_gravado(evento_id)
+    if atual is not None:
+        anterior = {**atual, 'total_custos': atual['total_custos'] - valor}
+        atualizar_resumo(anterior, atual)
+
+
+def somar_eventos_ao_resumo(eventos):
+    """Soma ao resumo eventos novos gravados sem sinais (bulk_create)
+
+    As contribuições são agrupadas por chave antes, então o custo é uma
+    atualização por linha do resumo, não por evento.
+    """
+    por_chave = defaultdict(lambda: dict.fromkeys(CAMPOS_TOTAIS, 0))
+    for evento in eventos:
+        chave, totais = contribuicao(estado_do_evento(evento))
+        for campo, valor in totais.items():
+            por_chave[chave][campo] += valor
+    with transaction.atomic(savepoint=False):
+        for chave, totais in por_chave.items():
+            _somar(chave, totais)
+
+
+def linhas_do_resumo(eventos):
+    """Linhas do resumo calculadas com um GROUP BY sobre ``eventos``"""
+    zero = Value(Decimal('0'))
+    linhas = eventos.order_by() \
+        .annotate(mes=TruncMonth('dataInicio', output_field=DateField())) \
+        .values('usuario', 'local', 'mes', 'status').annotate(
+            orcamento_total=Coalesce(Sum('orcamento'), zero,
+                                     output_field=TOTAL_FIELD),
+            custos_total=Coalesce(Sum('total_custos'), zero,
+                                  output_field=TOTAL_FIELD),
+            qtd_eventos=Count('id'),
+            qtd_estouros=Count('id',
+                               filter=Q(total_custos__gt=F('orcamento'))),
+        )
+    for linha in linhas.iterator(chunk_size=2000):
+        linha['usuario_id'] = linha.pop('usuario')
+        linha['local_id'] = linha.pop('local')
+        yield linha
+
+
+def reconstruir_resumo_mensal(usuario=None):
+    """Apaga e recalcula o resumo (de todos ou de um usuário)"""
+    eventos, resumo = Evento.objects.all(), ResumoMensal.objects.all()
+    if usuario is not None:
+        eventos = eventos.filter(usuario=usuario)
+        resumo = resumo.filter(usuario=usuario)
+    with transaction.atomic():
+        resumo.delete()
+        criadas = ResumoMensal.objects.bulk_create(
+            (ResumoMensal(**linha) for linha in linhas_do_resumo(eventos)),
+            batch_size=1000,
+        )
+    return len(criadas)
+
+
+def divergencias_do_resumo(usuario=None):
+    """Gera (chave, salvo, esperado) para cada linha do resumo divergente
+
+    Linhas salvas zeradas (de eventos que mudaram de chave ou foram
+    removidos) equivalem a linhas ausentes.
+    """
+    eventos, resumo = Evento.objects.all(), ResumoMensal.objects.all()
+    if usuario is not None:
+        eventos = eventos.filter(usuario=usuario)
+        resumo = resumo.filter(usuario=usuario)
+    zerado = dict.fromkeys(CAMPOS_TOTAIS, 0)
+
+    def chave(linha):
+        return (linha['usuario_id'], linha['local_id'], linha['mes'],
+                linha['status'])
+
+    def totais(linha):
+        return {campo: linha[campo] for campo in CAMPOS_TOTAIS}
+
+    esperado = {chave(linha): totais(linha)
+                for linha in linhas_do_resumo(eventos)}
+    salvos = resumo.values('usuario_id', 'local_id', 'mes', 'status',
+                           *CAMPOS_TOTAIS)
+    for linha in salvos.iterator(chunk_size=2000):
+        salvo = totais(linha)
+        correto = esperado.pop(chave(linha), zerado)
+        if salvo != correto:
+            yield chave(linha), salvo, correto
+    for restante, correto in esperado.items():
+        yield restante, zerado, correto
@@ -1,9 +1,170 @@
 """Serializers de eventos"""
+from functools import lru_cache
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers # type: ignore
+from .intervalos import conflitos_em_lote
 from .models import Local, Evento, Custo
 # pylint: disable=no-member, arguments-renamed
 
-class LocalSerializer(serializers.ModelSerializer):
+# Chave do contexto com os objetos relacionados já resolvidos em lote
+RELACIONADOS = '_relacionados'
+# Chave do contexto que indica que os conflitos de agenda são conferidos
+# pelo lote inteiro, e não item a item
+CONFLITOS_EM_LOTE = '_conflitos_em_lote'
+MENSAGEM_CONFLITO = "O local já tem o evento {titulo} (id {id}) neste horário."
+MENSAGEM_CONFLITO_LOTE = "O local já tem outro evento neste horário."
+# Só uma escrita que mexe nestes campos pode criar um conflito de agenda
+CAMPOS_DA_AGENDA = ('local', 'dataInicio', 'dataFim', 'status')
+
+
+class RelacionadoDoUsuarioField(serializers.PrimaryKeyRelatedField):
+    """Chave primária restrita aos objetos do usuário autenticado
+
+    O filtro por usuário só é montado na validação, então serializar para
+    leitura não toca no banco. Quando o ListaPreResolvidaSerializer já
+    resolveu os ids do lote, a busca é feita nesse resultado em vez de uma
+    consulta por item.
+    """
+
+    def get_queryset(self):
+        user = self.context['request'].user
+        return super().get_queryset().filter(usuario=user)
+
+    def to_internal_value(self, data):
+        resolvidos = self.context.get(RELACIONADOS, {}).get(self.field_name)
+        if resolvidos is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return resolvidos[int(data)]
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        return None
+
+
+class ListaPreResolvidaSerializer(serializers.ListSerializer):
+    """ListSerializer que resolve os relacionamentos do lote de uma vez
+
+    Antes de validar os itens, junta os ids de cada RelacionadoDoUsuarioField
+    e busca todos com uma única consulta ``IN``, guardando o resultado no
+    contexto para os itens reutilizarem.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            relacionados = self.context.setdefault(RELACIONADOS, {})
+            for nome, campo in self.child.fields.items():
+                if not isinstance(campo, RelacionadoDoUsuarioField) or \
+                        campo.read_only:
+                    continue
+                ids = set()
+                for item in data:
+                    valor = item.get(nome) if isinstance(item, dict) else None
+                    if isinstance(valor, (int, str)) and \
+                            not isinstance(valor, bool) and \
+                            str(valor).isdigit():
+                        ids.add(int(valor))
+                relacionados[nome] = campo.get_queryset().in_bulk(ids)
+        return super().to_internal_value(data)
+
+
+class CamposDinamicosMixin:
+    """Aceita ``campos`` para serializar só um subconjunto dos campos"""
+
+    def __init__(self, *args, campos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if campos is not None:
+            for nome in set(self.fields) - set(campos):
+                self.fields.pop(nome)
+
+
+class LeituraRapida:
+    """Representação de listas a partir de ``values()``, sem instâncias
+
+    Os conversores (``to_representation`` de cada campo do serializer) são
+    montados uma vez; cada linha vira um dict com uma chamada por campo,
+    sem instanciar o modelo nem percorrer a maquinaria do ModelSerializer.
+    A saída é a mesma do serializer.
+    """
+
+    def __init__(self, conversores):
+        self.conversores = conversores
+        self.colunas = tuple(coluna for _, coluna, _ in conversores)
+
+    def representar(self, linhas):
+        """Converte as linhas de ``values()`` para a saída da API"""
+        conversores = self.conversores
+        return [
+            {nome: None if linha[coluna] is None else converter(linha[coluna])
+             for nome, coluna, converter in conversores}
+            for linha in linhas
+        ]
+
+
+def _sem_conversao(valor):
+    return valor
+
+
+@lru_cache(maxsize=64)
+def leitura_rapida(serializer_class, campos=None):
+    """LeituraRapida para o serializer e os campos pedidos
+
+    Retorna None quando algum campo não corresponde a uma coluna do modelo
+    (campos calculados, fontes aninhadas...); nesses casos a listagem usa o
+    serializer normal.
+    """
+    modelo = serializer_class.Meta.model
+    conversores = []
+    for nome, campo in serializer_class(campos=campos).fields.items():
+        try:
+            coluna = modelo._meta.get_field(campo.source)
+        except FieldDoesNotExist:
+            return None
+        if not coluna.concrete:
+            return None
+        if isinstance(campo, serializers.PrimaryKeyRelatedField):
+            # values() já traz a chave primária do relacionado
+            conversores.append((nome, campo.source, _sem_conversao))
+        elif isinstance(campo, serializers.RelatedField) or \
+                coluna.is_relation:
+            return None
+        else:
+            conversores.append((nome, campo.source, campo.to_representation))
+    return LeituraRapida(conversores)
+
+
+class ListaEventosSerializer(ListaPreResolvidaSerializer):
+    """Lista de eventos que confere os conflitos de agenda do lote de uma vez
+
+    Em vez de uma consulta por item, lê os eventos já gravados nos locais
+    e no período do lote em uma consulta e confere todos os itens (inclusive
+    entre si) em um índice de intervalos em memória.
+    """
+
+    def to_internal_value(self, data):
+        self.context[CONFLITOS_EM_LOTE] = True
+        validados = super().to_internal_value(data)
+        itens = [
+            (indice, dados['local'].pk, dados['dataInicio'], dados['dataFim'])
+            for indice, dados in enumerate(validados)
+            if dados.get('dataFim') and dados.get('status') != 'CANCELADO'
+        ]
+        conflitantes = conflitos_em_lote(
+            itens, Evento.objects.agendas_para(itens)
+        )
+        if conflitantes:
+            raise serializers.ValidationError([
+                {'non_field_errors': [MENSAGEM_CONFLITO_LOTE]}
+                if indice in conflitantes else {}
+                for indice in range(len(validados))
+            ])
+        return validados
+
+
+class LocalSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer de Local"""
     class Meta:
         """Classe que define as informações principais"""
@@ -11,11 +172,9 @@ class LocalSerializer(serializers.ModelSerializer):
         fields = "__all__"
         read_only_fields = ['usuario']
 
-class EventoSerializer(serializers.ModelSerializer):
+class EventoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer de Eventos"""
-    local = serializers.PrimaryKeyRelatedField(
-        queryset=Evento.objects.none()
-    )
+    local = RelacionadoDoUsuarioField(queryset=Local.objects.all())
     dataFim = serializers.DateTimeField(required=False)  # Torna o campo obrigatório
 
     class Meta:
@@ -23,36 +182,83 @@ class EventoSerializer(serializers.ModelSerializer):
         model = Evento
         fields = "__all__"
         read_only_fields = ['usuario']
+        list_serializer_class = ListaEventosSerializer
 
-    def __init__(self, *args, **kwargs):
-        """Inicializa o serializer com filtro de locais por usuário"""
-        super().__init__(*args, **kwargs)
-        # Limita os locais ao usuário autenticado para segurança
-        user = self.context['request'].user
-        self.fields['local'].queryset = Local.objects.filter(usuario=user)
+    # Desligado pela importação, que confere os conflitos do lote inteiro
+    verificar_conflitos = True
 
     def validate(self, data):
-        """Valida se a data de término é posterior à data de início"""
+        """Valida se a data de término é posterior à data de início e se o
+        local está livre no período"""
+        data_inicio = data.get('dataInicio',
+                               getattr(self.instance, 'dataInicio', None))
         data_fim = data.get('dataFim')  # Usa .get() para evitar o KeyError
-        if data_fim and data_fim < data.get('dataInicio'):
+        if data_fim and data_inicio and data_fim < data_inicio:
             raise serializers.ValidationError("A data de término"
                                               "não pode ser antes da data de início.")
+        if self.verificar_conflitos and \
+                not self.context.get(CONFLITOS_EM_LOTE) and \
+                self.muda_a_agenda(data):
+            self.validar_conflito(data, data_inicio)
         return data
 
-class CustoSerializer(serializers.ModelSerializer):
+    def muda_a_agenda(self, data):
+        """Indica se a escrita cria o evento ou mexe em local, período ou
+        status (editar só o título não confere a agenda de novo)"""
+        return self.instance is None or \
+            any(campo in data for campo in CAMPOS_DA_AGENDA)
+
+    def validar_conflito(self, data, data_inicio):
+        """Recusa o evento se o local já tiver outro evento no período"""
+        local = data.get('local', getattr(self.instance, 'local_id', None))
+        data_fim = data.get('dataFim', getattr(self.instance, 'dataFim', None))
+        situacao = data.get('status', getattr(self.instance, 'status', None))
+        if None in (local, data_inicio, data_fim) or situacao == 'CANCELADO':
+            return
+        conflitos = Evento.objects.filter(local=local) \
+            .sobrepostos(data_inicio, data_fim)
+        if self.instance is not None:
+            conflitos = conflitos.exclude(pk=self.instance.pk)
+        conflito = conflitos.values('id', 'titulo').first()
+        if conflito:
+            raise serializers.ValidationError(
+                MENSAGEM_CONFLITO.format(**conflito)
+            )
+
+class EventoImportacaoSerializer(EventoSerializer):
+    """Serializer de uma linha da importação de eventos
+
+    Usa as regras do EventoSerializer, mas lê o local como id simples: os
+    locais de cada lote são conferidos de uma vez pelo importador.
+    """
+    local = serializers.IntegerField(source='local_id', min_value=1)
+    dataFim = serializers.DateTimeField()
+    verificar_conflitos = False
+
+    class Meta(EventoSerializer.Meta):
+        """Classe que define as informações principais"""
+        fields = ['titulo', 'descricao', 'orcamento', 'status', 'dataInicio',
+                  'dataFim', 'observacoes', 'local']
+
+class CustoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializers de Custo"""
-    evento = serializers.PrimaryKeyRelatedField(
-        queryset=Evento.objects.none()
-    )
+    evento = RelacionadoDoUsuarioField(queryset=Evento.objects.all())
 
     class Meta:
         """Classe que define as informações principais"""
         model = Custo
         fields = "__all__"
+        list_serializer_class = ListaPreResolvidaSerializer
 
-    def __init__(self, *args, **kwargs):
-        """Inicializa o serializer com filtro de eventos por usuário"""
-        super().__init__(*args, **kwargs)
-        # Limita os eventos ao usuário autenticado para segurança
-        user = self.context['request'].user
-        self.fields['evento'].queryset = Evento.objects.filter(usuario=user)
+class CustoLoteSerializer(serializers.ModelSerializer):
+    """Serializer de um item do cadastro de custos em lote
+
+    O evento é lido como id simples; a posse dos eventos é conferida de
+    uma vez para o lote inteiro em ``services.criar_custos_em_lote``.
+    """
+    evento = serializers.IntegerField(source='evento_id', min_value=1)
+
+    class Meta:
+        """Classe que define as informações principais"""
+        model = Custo
+        fields = ['id', 'descricao', 'valor', 'evento']
@@ -1,7 +1,29 @@
 """Serviços para a criação adequada dos eventos"""
 # pylint: disable=no-member
+from collections import defaultdict
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+from decimal import Decimal
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
 from rest_framework.exceptions import ValidationError
-from .models import Local, Evento, Custo
+from usuarios.models import Usuario
+from .intervalos import encontrar_sobreposicoes, janelas_livres
+from .models import Local, Evento, Custo, ResumoMensal
+from .resumos import CAMPOS_TOTAIS, somar_custos_ao_resumo
+from .serializers import CustoLoteSerializer
+
+# Mesmo formato do campo Custo.valor, usado nas somas feitas no banco
+VALOR_FIELD = DecimalField(max_digits=15, decimal_places=2)
+# Quantidade máxima de custos aceita em uma única requisição de lote
+LOTE_MAXIMO_CUSTOS = 1000
+# Maior período aceito pela visão de calendário
+JANELA_MAXIMA_CALENDARIO = timedelta(days=366)
+# Campos da projeção compacta usada pelo calendário
+CAMPOS_CALENDARIO = ('id', 'titulo', 'dataInicio', 'dataFim', 'status',
+                     'local')
 
 
 def get_user_locals(user):
@@ -27,6 +49,126 @@ def get_user_eventos(user):
         raise e
 
 
+def _validar_situacoes(situacoes):
+    """Recusa valores de status que não existem em Evento.STATUS"""
+    validas = dict(Evento.STATUS)
+    invalidas = [situacao for situacao in situacoes or ()
+                 if situacao not in validas]
+    if invalidas:
+        raise ValidationError(
+            {"status": [f"Status inválido: {', '.join(invalidas)}."]})
+
+
+def filtrar_eventos(eventos, inicio_apos=None, fim_antes=None,
+                    situacoes=None, local=None):
+    """Aplica os filtros de período, status e local a uma consulta de eventos"""
+    if inicio_apos and fim_antes and fim_antes < inicio_apos:
+        raise ValidationError("'fim_antes' deve ser posterior a 'inicio_apos'.")
+    _validar_situacoes(situacoes)
+    if situacoes:
+        eventos = eventos.filter(status__in=situacoes)
+    if local is not None:
+        eventos = eventos.filter(local=local)
+    return eventos.no_periodo(inicio_apos, fim_antes)
+
+
+def calendario_do_usuario(user, inicio_apos, fim_antes, **filtros):
+    """Projeção compacta dos eventos do usuário em um período
+
+    Entram os eventos que se sobrepõem ao período, inclusive os que o
+    atravessam (começam no mês anterior, por exemplo). O período é
+    obrigatório e limitado, e a leitura fica no índice (usuario,
+    dataInicio); os valores saem direto de ``values()``, sem instanciar
+    modelos nem passar pelo serializer.
+    """
+    if inicio_apos is None or fim_antes is None:
+        raise ValidationError("Informe 'inicio_apos' e 'fim_antes'.")
+    if fim_antes < inicio_apos:
+        raise ValidationError("'fim_antes' deve ser posterior a 'inicio_apos'.")
+    if fim_antes - inicio_apos > JANELA_MAXIMA_CALENDARIO:
+        raise ValidationError("O período do calendário deve ter no máximo "
+                              f"{JANELA_MAXIMA_CALENDARIO.days} dias.")
+    eventos = filtrar_eventos(get_user_eventos(user), **filtros) \
+        .sobrepostos_ao_periodo(inicio_apos, fim_antes)
+    return list(eventos.order_by('dataInicio', 'id')
+                .values(*CAMPOS_CALENDARIO))
+
+
+def _metricas_orcamento():
+    """Agregações de orçamento e custos sobre os eventos
+
+    Os custos vêm do total materializado em Evento.total_custos, então
+    nenhuma consulta precisa de JOIN com Custo.
+    """
+    zero = Value(Decimal('0'))
+    return {
+        'orcamento_total': Coalesce(Sum('orcamento'), zero,
+                                    output_field=VALOR_FIELD),
+        'custos_total': Coalesce(Sum('total_custos'), zero,
+                                 output_field=VALOR_FIELD),
+        'qtd_eventos': Count('id'),
+        'qtd_estouros': Count('id', filter=Q(total_custos__gt=F('orcamento'))),
+    }
+
+
+def _metricas_resumo():
+    """As mesmas agregações, somando as linhas do resumo mensal"""
+    return {campo: Sum(campo) for campo in CAMPOS_TOTAIS}
+
+
+def _com_utilizacao(linha):
+    """Acrescenta a utilização (custos / orçamento) a uma linha agregada"""
+    orcamento = linha['orcamento_total']
+    linha['utilizacao'] = round(Decimal(linha['custos_total']) /
+                                Decimal(orcamento), 4) if orcamento else None
+    return linha
+
+
+def analise_orcamento(user, inicio_apos=None, fim_antes=None, situacoes=None,
+                      local=None):
+    """Orçamento e custos dos eventos do usuário agrupados para o painel
+
+    São três consultas GROUP BY (por status, por mês de início e por
+    local); o total geral é somado a partir dos grupos por status, sem
+    outra consulta. Sem filtro de período os grupos saem da tabela
+    ResumoMensal, que tem uma linha por (local, mês, status) em vez de uma
+    por evento; com período, que pode cortar um mês ao meio, saem dos
+    eventos.
+    """
+    if inicio_apos is None and fim_antes is None:
+        _validar_situacoes(situacoes)
+        linhas = ResumoMensal.objects.filter(usuario=user, qtd_eventos__gt=0)
+        if situacoes:
+            linhas = linhas.filter(status__in=situacoes)
+        if local is not None:
+            linhas = linhas.filter(local=local)
+        metricas, mes = _metricas_resumo(), F('mes')
+    else:
+        linhas = filtrar_eventos(get_user_eventos(user), inicio_apos,
+                                 fim_antes, situacoes, local)
+        metricas, mes = _metricas_orcamento(), TruncMonth('dataInicio')
+    linhas = linhas.order_by()
+
+    por_status = list(linhas.values('status').annotate(**metricas)
+                      .order_by('status'))
+    por_mes = list(linhas.annotate(periodo=mes).values('periodo')
+                   .annotate(**metricas).order_by('periodo'))
+    por_local = list(linhas.values('local', nome_local=F('local__nome'))
+                     .annotate(**metricas).order_by('local'))
+    for linha in por_mes:
+        linha['mes'] = linha.pop('periodo').strftime('%Y-%m')
+
+    total = {chave: sum((linha[chave] for linha in por_status),
+                        Decimal('0') if chave.endswith('_total') else 0)
+             for chave in metricas}
+    return {
+        "total": _com_utilizacao(total),
+        "por_status": [_com_utilizacao(linha) for linha in por_status],
+        "por_mes": [_com_utilizacao(linha) for linha in por_mes],
+        "por_local": [_com_utilizacao(linha) for linha in por_local],
+    }
+
+
 def create_evento(data, user):
     """Criando o evento atrelado ao usuário e ao local"""
     if not data.is_valid():
@@ -34,16 +176,40 @@ def create_evento(data, user):
     data.save(usuario=user)
 
 
-def calcular_custos(evento):
-    """Calculo dos custos"""
+def agregacoes_de_custos():
+    """Expressões do total e da quantidade de custos (SUM/COUNT no banco)"""
+    return {
+        'total': Coalesce(Sum('valor'), Value(Decimal('0')),
+                          output_field=VALOR_FIELD),
+        'quantidade': Count('id'),
+    }
+
+
+def custos_por_descricao(custos):
+    """Total e quantidade de ``custos`` agrupados por descrição"""
+    return custos.order_by().values('descricao').annotate(
+        total=Sum('valor'), quantidade=Count('id')
+    ).order_by('-total', 'descricao')
+
+
+def calcular_custos(evento, detalhar=False):
+    """Calculo dos custos
+
+    O total e a quantidade são calculados no banco (SUM/COUNT) em uma única
+    consulta. A lista de custos volta como queryset ainda não avaliado, para
+    que só seja lida quando pedida (e paginada). Com ``detalhar`` também
+    retorna o total agrupado por descrição.
+    """
     try:
         custos = Custo.objects.filter(evento=evento)
-        if not custos.exists():
-            return {"message": "Nenhum custo associado a este evento.",
-                    "custos": [], "total": 0}
-
-        total = sum(custo.valor for custo in custos)
-        return {"custos": custos, "total": total}
+        resumo = custos.aggregate(**agregacoes_de_custos())
+        resultado = {"custos": custos, "total": resumo['total'],
+                     "quantidade": resumo['quantidade']}
+        if not resumo['quantidade']:
+            resultado["message"] = "Nenhum custo associado a este evento."
+        if detalhar:
+            resultado["por_descricao"] = list(custos_por_descricao(custos))
+        return resultado
     except Exception as e:
         raise e
 
@@ -54,3 +220,172 @@ def get_user_custos(user):
         return Custo.objects.filter(evento__usuario=user)
     except Exception as e:
         raise e
+
+
+def atualizar_totais_evento(evento_id, valor, quantidade):
+    """Soma ``valor`` e ``quantidade`` aos totais materializados do evento
+
+    A atualização é feita no banco com expressões F, então escritas
+    concorrentes no mesmo evento não se sobrescrevem. A diferença também é
+    aplicada ao resumo mensal.
+    """
+    with transaction.atomic(savepoint=False):
+        Evento.objects.filter(pk=evento_id).update(
+            total_custos=F('total_custos') + valor,
+            qtd_custos=F('qtd_custos') + quantidade,
+        )
+        somar_custos_ao_resumo(evento_id, valor)
+
+
+def criar_custos_em_lote(itens, user):
+    """Cria vários custos em uma única transação
+
+    Cada item é validado isoladamente, a posse dos eventos é conferida com
+    uma consulta para todos os ids distintos e os custos são gravados com
+    um único ``bulk_create``. Se algum item for inválido nada é gravado e
+    a ValidationError traz os erros de cada item pelo índice.
+    """
+    if not isinstance(itens, list) or not itens:
+        raise ValidationError("Envie uma lista não vazia de custos.")
+    if len(itens) > LOTE_MAXIMO_CUSTOS:
+        raise ValidationError(
+            f"O lote aceita no máximo {LOTE_MAXIMO_CUSTOS} custos."
+        )
+
+    # Um único serializer valida todos os itens, sem recriar os campos
+    validador = CustoLoteSerializer()
+    validos, erros = [], {}
+    for indice, item in enumerate(itens):
+        try:
+            validos.append((indice, validador.run_validation(item)))
+        except ValidationError as exc:
+            erros[indice] = exc.detail
+
+    ids = {dados['evento_id'] for _, dados in validos}
+    permitidos = set(Evento.objects.filter(usuario=user, pk__in=ids)
+                     .values_list('pk', flat=True))
+    for indice, dados in validos:
+        if dados['evento_id'] not in permitidos:
+            erros[indice] = {"evento": ["Evento inválido ou de outro "
+                                        "usuário."]}
+    if erros:
+        raise ValidationError({"erros": dict(sorted(erros.items()))})
+
+    custos = [Custo(**dados) for _, dados in validos]
+    totais = defaultdict(lambda: [Decimal('0'), 0])
+    for custo in custos:
+        totais[custo.evento_id][0] += custo.valor
+        totais[custo.evento_id][1] += 1
+    with transaction.atomic():
+        criados = Custo.objects.bulk_create(custos)
+        # bulk_create não dispara os sinais, então os totais vão aqui
+        for evento_id, (valor, quantidade) in totais.items():
+            atualizar_totais_evento(evento_id, valor, quantidade)
+        incrementar_versao_dados(user.pk)
+    return criados
+
+
+def incrementar_versao_dados(usuario_id):
+    """Marca que os dados (locais, eventos, custos) do usuário mudaram"""
+    Usuario.objects.filter(pk=usuario_id).update(
+        versao_dados=F('versao_dados') + 1
+    )
+
+
+def incrementar_versao_dados_de_todos():
+    """Marca que os dados de todos os usuários mudaram
+
+    Usado depois das reconstruções em massa (comandos ``recalcular_*``),
+    que escrevem com ``update()`` e não disparam os sinais.
+    """
+    Usuario.objects.update(versao_dados=F('versao_dados') + 1)
+
+
+def incrementar_versao_dados_do_evento(evento_id):
+    """Incrementa a versão dos dados do dono do evento, em uma consulta"""
+    Usuario.objects.filter(evento__pk=evento_id).update(
+        versao_dados=F('versao_dados') + 1
+    )
+
+
+def get_versao_dados(user):
+    """Lê a versão atual dos dados do usuário direto do banco
+
+    Não usa o objeto ``user`` da requisição, que pode ter vindo do cache
+    de autenticação com uma versão antiga. Lê sempre do ``default``: numa
+    réplica atrasada a versão antiga revalidaria ETags e respostas em
+    cache já defasados.
+    """
+    return Usuario.objects.using(DEFAULT_DB_ALIAS).filter(pk=user.pk) \
+        .values_list('versao_dados', flat=True).first()
+
+
+def conflitos_do_local(local, inicio=None, fim=None):
+    """Pares de eventos sobrepostos de um local, opcionalmente em uma janela
+
+    Lê os eventos uma única vez, em ordem de início, e encontra os pares
+    com uma varredura, sem consulta por evento.
+    """
+    eventos = Evento.objects.filter(local=local).exclude(status='CANCELADO')
+    if inicio is not None:
+        eventos = eventos.filter(dataFim__gt=inicio)
+    if fim is not None:
+        eventos = eventos.filter(dataInicio__lt=fim)
+    eventos = eventos.order_by('dataInicio', 'id').values(
+        'id', 'titulo', 'status', 'dataInicio', 'dataFim'
+    )
+    return [
+        {"evento": anterior, "conflita_com": posterior}
+        for anterior, posterior in encontrar_sobreposicoes(
+            (evento['dataInicio'], evento['dataFim'], evento)
+            for evento in eventos.iterator(chunk_size=2000)
+        )
+    ]
+
+
+def disponibilidade_dos_locais(user, inicio, fim, capacidade_minima=None,
+                               duracao_minima=None):
+    """Janelas livres de cada local do usuário no período [inicio, fim)
+
+    Usa duas consultas, independentemente da quantidade de locais: uma
+    para os locais com a capacidade pedida e outra para os eventos desses
+    locais no período, em ordem de local e início. As janelas de cada
+    local saem de uma varredura sobre os seus eventos. Locais sem nenhuma
+    janela de pelo menos ``duracao_minima`` ficam de fora.
+    """
+    if inicio is None or fim is None:
+        raise ValidationError("Informe 'inicio' e 'fim'.")
+    if fim <= inicio:
+        raise ValidationError("'fim' deve ser posterior a 'inicio'.")
+    locais = Local.objects.filter(usuario=user)
+    if capacidade_minima is not None:
+        locais = locais.filter(capacidade__gte=capacidade_minima)
+    locais = list(locais.order_by('id').values('id', 'nome', 'capacidade'))
+
+    ocupacao = Evento.objects \
+        .filter(local__in=[local['id'] for local in locais]) \
+        .sobrepostos(inicio, fim).order_by('local', 'dataInicio') \
+        .values_list('local', 'dataInicio', 'dataFim')
+    ocupados = {
+        local_id: [(ocupado_inicio, ocupado_fim)
+                   for _, ocupado_inicio, ocupado_fim in eventos]
+        for local_id, eventos in groupby(ocupacao.iterator(chunk_size=2000),
+                                         key=itemgetter(0))
+    }
+
+    disponiveis = []
+    for local in locais:
+        janelas = [
+            {"inicio": janela_inicio, "fim": janela_fim}
+            for janela_inicio, janela_fim in janelas_livres(
+                ocupados.get(local['id'], ()), inicio, fim)
+            if duracao_minima is None
+            or janela_fim - janela_inicio >= duracao_minima
+        ]
+        if janelas:
+            disponiveis.append({
+                **local,
+                "livre_no_periodo": local['id'] not in ocupados,
+                "janelas": janelas,
+            })
+    return disponiveis
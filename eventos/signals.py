@@ -0,0 +1,151 @@
+"""Sinais que mantêm os totais materializados de custos em Evento, o
+resumo mensal e a versão dos dados de cada usuário"""
+# pylint: disable=unused-argument
+from decimal import Decimal
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+from .models import Local, Evento, Custo
+from .resumos import (
+    atualizar_resumo, contribuicao, estado_do_evento, estado_gravado
+)
+from .services import (
+    atualizar_totais_evento, incrementar_versao_dados,
+    incrementar_versao_dados_do_evento
+)
+
+
+def _guardar_estado(instance):
+    """Guarda o evento e o valor que estão gravados no banco"""
+    # Lê do __dict__ para não disparar consultas em campos adiados
+    instance._evento_original = instance.__dict__.get('evento_id')
+    instance._valor_original = instance.__dict__.get('valor')
+
+
+@receiver(post_init, sender=Custo)
+def custo_carregado(sender, instance, **kwargs):
+    """Guarda o estado inicial de custos já existentes no banco"""
+    if instance.pk is not None:
+        _guardar_estado(instance)
+
+
+@receiver(pre_save, sender=Custo)
+def custo_sera_salvo(sender, instance, **kwargs):
+    """Lê o estado gravado quando o custo foi carregado com campos adiados"""
+    if instance.pk is None:
+        return
+    if getattr(instance, '_evento_original', None) is None or \
+            getattr(instance, '_valor_original', None) is None:
+        gravado = Custo.objects.filter(pk=instance.pk) \
+            .values('evento_id', 'valor').first()
+        if gravado is not None:
+            instance._evento_original = gravado['evento_id']
+            instance._valor_original = gravado['valor']
+
+
+@receiver(post_save, sender=Custo)
+def custo_salvo(sender, instance, created, **kwargs):
+    """Aplica a diferença do custo salvo aos totais do evento"""
+    valor = Decimal(str(instance.valor))
+    if created:
+        atualizar_totais_evento(instance.evento_id, valor, 1)
+    else:
+        evento_original = instance._evento_original
+        valor_original = Decimal(str(instance._valor_original))
+        if evento_original != instance.evento_id:
+            atualizar_totais_evento(evento_original, -valor_original, -1)
+            atualizar_totais_evento(instance.evento_id, valor, 1)
+        elif valor != valor_original:
+            atualizar_totais_evento(instance.evento_id,
+                                    valor - valor_original, 0)
+    incrementar_versao_dados_do_evento(instance.evento_id)
+    _guardar_estado(instance)
+
+
+@receiver(post_delete, sender=Custo)
+def custo_removido(sender, instance, origin=None, **kwargs):
+    """Desconta o custo removido dos totais do evento
+
+    Quando a remoção vem em cascata (de um Evento ou Usuário), o próprio
+    evento também está sendo removido e não há o que atualizar.
+    """
+    origem = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origem is not Custo:
+        return
+    evento_id = getattr(instance, '_evento_original', None) or instance.evento_id
+    valor = getattr(instance, '_valor_original', None)
+    if valor is None:
+        valor = instance.valor
+    atualizar_totais_evento(evento_id, -Decimal(str(valor)), -1)
+    incrementar_versao_dados_do_evento(evento_id)
+
+
+def _origem_e_evento(origin):
+    """Indica se a remoção partiu de um Evento (e não de uma cascata)"""
+    origem = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin is None or origem is Evento
+
+
+@receiver(post_init, sender=Evento)
+def evento_carregado(sender, instance, **kwargs):
+    """Guarda a contribuição do evento para o resumo mensal"""
+    if instance.pk is not None:
+        instance._resumo_original = estado_do_evento(instance)
+
+
+@receiver(pre_save, sender=Evento)
+def evento_sera_salvo(sender, instance, **kwargs):
+    """Lê o estado gravado quando o evento foi carregado com campos adiados"""
+    if not instance._state.adding and \
+            getattr(instance, '_resumo_original', None) is None:
+        instance._resumo_original = estado_gravado(instance.pk)
+
+
+@receiver(post_save, sender=Evento)
+def evento_salvo(sender, instance, created, **kwargs):
+    """Move a contribuição do evento no resumo mensal, se ela mudou
+
+    Os totais de custos da instância podem estar defasados (o save não os
+    grava); quando a contribuição muda, valem os que estão no banco.
+    """
+    anterior = None if created else instance._resumo_original
+    atual = estado_do_evento(instance)
+    if anterior is not None:
+        if atual is not None and \
+                contribuicao({**anterior, 'total_custos': 0}) == \
+                contribuicao({**atual, 'total_custos': 0}):
+            return
+        atual = estado_gravado(instance.pk)
+        anterior = {**anterior, 'total_custos': atual['total_custos']}
+    elif atual is None:
+        atual = estado_gravado(instance.pk)
+    atualizar_resumo(anterior, atual)
+    instance._resumo_original = atual
+
+
+@receiver(pre_delete, sender=Evento)
+def evento_sera_removido(sender, instance, origin=None, **kwargs):
+    """Guarda a contribuição gravada do evento que vai ser removido
+
+    Em cascata (do usuário) as linhas do resumo também são removidas.
+    """
+    if _origem_e_evento(origin):
+        instance._resumo_original = estado_gravado(instance.pk)
+
+
+@receiver(post_delete, sender=Evento)
+def evento_removido(sender, instance, origin=None, **kwargs):
+    """Desconta o evento removido do resumo mensal"""
+    if _origem_e_evento(origin) and instance._resumo_original is not None:
+        atualizar_resumo(instance._resumo_original, None)
+
+
+@receiver(post_save, sender=Local)
+@receiver(post_delete, sender=Local)
+@receiver(post_save, sender=Evento)
+@receiver(post_delete, sender=Evento)
+def dados_do_usuario_alterados(sender, instance, **kwargs):
+    """Qualquer escrita em Local ou Evento muda a versão dos dados do dono"""
+    incrementar_versao_dados(instance.usuario_id)
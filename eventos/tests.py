@@ -1,10 +1,38 @@
-from rest_framework import status
+from decimal import Decimal
+import csv
+import json
+import os
+import re
+import tempfile
+from io import StringIO
+from rest_framework import serializers, status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIClient
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import (
+    AsyncClient, AsyncRequestFactory, TestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.contrib.auth import get_user_model
-from eventos.models import Local, Evento
+from eventos import views_async
+from eventos.fabricas import DadosFactory
+from eventos.intervalos import (
+    IndiceIntervalos, encontrar_sobreposicoes, janelas_livres
+)
+from eventos.models import Local, Evento, Custo, ResumoMensal
+from eventos.serializers import (
+    EventoSerializer, CustoSerializer, LocalSerializer, leitura_rapida
+)
+from eventos.services import get_user_locals, get_user_eventos, get_user_custos
 from faker import Faker
+from rest_framework.authtoken.models import Token
+from usuarios.authentication import limpar_caches
 from random import randint
+from asgiref.sync import sync_to_async
 
 # pylint: disable=no-member
 
@@ -28,7 +56,6 @@ class UsuarioFactory:
             "last_name": fake.last_name()
         }
 
-
 class UsuarioAPITests(TestCase):
     """Essa classe de testes foca nos testes dos usuários"""
     
@@ -58,7 +85,9 @@ class UsuarioAPITests(TestCase):
         self.client.post(self.url_usuarios, self.user_data, format='json')
         response = self.client.get(self.url_usuarios, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)  # Ao menos um?
+        self.assertEqual([usuario["username"]
+                          for usuario in response.data["results"]],
+                         [self.user_data["username"]])
 
     def test_buscar_usuario_por_id(self):
         """
@@ -115,3 +144,1338 @@ class UsuarioAPITests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         response_pos_lixim = self.client.get(f"{self.url_usuarios}{user_id}/")
         self.assertEqual(response_pos_lixim.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CalcularCustosAPITests(APITestCase):
+    """Testes do endpoint /api/eventos/{id}/custos/"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_custos")
+        self.client.force_authenticate(user=self.user)
+        local = DadosFactory.criar_local(self.user)
+        self.evento = DadosFactory.criar_evento(
+            local, dataInicio="2024-12-25T10:00:00Z",
+            dataFim="2024-12-25T18:00:00Z"
+        )
+        self.url = f"/api/eventos/{self.evento.id}/custos/"
+
+    def criar_custos(self, quantidade, descricao="Som", valor="10.50"):
+        """Cria custos para o evento de teste"""
+        Custo.objects.bulk_create(
+            Custo(descricao=descricao, valor=valor, evento=self.evento)
+            for _ in range(quantidade)
+        )
+
+    def test_total_sem_custos(self):
+        """Sem custos o total é zero e a mensagem é mantida"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total"], 0)
+        self.assertEqual(response.data["quantidade"], 0)
+        self.assertIn("message", response.data)
+
+    def test_total_calculado_no_banco(self):
+        """Total e quantidade vêm de uma agregação, sem listar os custos"""
+        self.criar_custos(3)
+        self.criar_custos(2, descricao="Buffet", valor="100.00")
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total"], Decimal("231.50"))
+        self.assertEqual(response.data["quantidade"], 5)
+        self.assertNotIn("custos", response.data)
+
+    def test_detalhar_por_descricao(self):
+        """Com detalhar=true o total é agrupado por descrição"""
+        self.criar_custos(3)
+        self.criar_custos(2, descricao="Buffet", valor="100.00")
+        response = self.client.get(self.url, {"detalhar": "true"})
+        por_descricao = response.data["por_descricao"]
+        self.assertEqual([item["descricao"] for item in por_descricao],
+                         ["Buffet", "Som"])
+        self.assertEqual(por_descricao[1]["quantidade"], 3)
+
+    def test_listar_custos_paginado(self):
+        """Com listar=true a lista de custos vem paginada por cursor"""
+        self.criar_custos(5)
+        response = self.client.get(self.url, {"listar": "true",
+                                              "page_size": 2})
+        self.assertEqual(len(response.data["custos"]), 2)
+        self.assertEqual(response.data["quantidade"], 5)
+        self.assertIsNotNone(response.data["next"])
+        segunda = self.client.get(response.data["next"])
+        self.assertEqual(len(segunda.data["custos"]), 2)
+        self.assertNotEqual(segunda.data["custos"][0]["id"],
+                            response.data["custos"][0]["id"])
+
+
+class TotaisCustosTests(APITestCase):
+    """Testes dos totais materializados de custos em Evento"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_totais")
+        self.client.force_authenticate(user=self.user)
+        local = DadosFactory.criar_local(self.user)
+        self.eventos = [
+            DadosFactory.criar_evento(
+                local, titulo=f"Evento {i}", dataInicio="2024-12-25T10:00:00Z",
+                dataFim="2024-12-25T18:00:00Z"
+            )
+            for i in range(2)
+        ]
+
+    def totais(self, evento):
+        """Lê os totais salvos do evento"""
+        evento.refresh_from_db()
+        return evento.total_custos, evento.qtd_custos
+
+    def test_totais_pela_api(self):
+        """Criar, alterar, mover e remover custos pela API atualiza totais"""
+        url = "/api/custos/"
+        criado = self.client.post(url, {"descricao": "Som", "valor": "150.00",
+                                        "evento": self.eventos[0].id},
+                                  format='json')
+        self.assertEqual(self.totais(self.eventos[0]), (Decimal("150"), 1))
+
+        self.client.patch(f"{url}{criado.data['id']}/", {"valor": "200.00"},
+                          format='json')
+        self.assertEqual(self.totais(self.eventos[0]), (Decimal("200"), 1))
+
+        self.client.patch(f"{url}{criado.data['id']}/",
+                          {"evento": self.eventos[1].id}, format='json')
+        self.assertEqual(self.totais(self.eventos[0]), (Decimal("0"), 0))
+        self.assertEqual(self.totais(self.eventos[1]), (Decimal("200"), 1))
+
+        self.client.delete(f"{url}{criado.data['id']}/")
+        self.assertEqual(self.totais(self.eventos[1]), (Decimal("0"), 0))
+
+    def test_totais_pelo_orm(self):
+        """Custos criados e removidos pelo ORM também atualizam os totais"""
+        evento = self.eventos[0]
+        Custo.objects.create(descricao="A", valor="10.25", evento=evento)
+        custo = Custo.objects.create(descricao="B", valor="5.00",
+                                     evento=evento)
+        self.assertEqual(self.totais(evento), (Decimal("15.25"), 2))
+        Custo.objects.filter(pk=custo.pk).delete()
+        self.assertEqual(self.totais(evento), (Decimal("10.25"), 1))
+
+    def test_salvar_custo_com_campos_adiados(self):
+        """Salvar um custo carregado com only() não altera os totais"""
+        evento = self.eventos[0]
+        custo = Custo.objects.create(descricao="A", valor="10.00",
+                                     evento=evento)
+        Custo.objects.only('descricao').get(pk=custo.pk).save()
+        self.assertEqual(self.totais(evento), (Decimal("10"), 1))
+        adiado = Custo.objects.only('evento').get(pk=custo.pk)
+        adiado.descricao = "B"
+        adiado.save()
+        self.assertEqual(self.totais(evento), (Decimal("10"), 1))
+        resumo = ResumoMensal.objects.get(usuario=self.user)
+        self.assertEqual(resumo.custos_total, Decimal("10"))
+
+    def test_totais_na_listagem(self):
+        """A listagem de eventos traz os totais sem serem editáveis"""
+        Custo.objects.create(descricao="A", valor="30.00",
+                             evento=self.eventos[0])
+        url = f"/api/eventos/{self.eventos[0].id}/"
+        self.client.patch(url, {"total_custos": "999.00"}, format='json')
+        response = self.client.get(url)
+        self.assertEqual(response.data["total_custos"], "30.00")
+        self.assertEqual(response.data["qtd_custos"], 1)
+
+    def test_comando_recalcular_custos(self):
+        """O comando detecta divergências e reconstrói os totais"""
+        Custo.objects.create(descricao="A", valor="12.00",
+                             evento=self.eventos[0])
+        Evento.objects.update(total_custos=0, qtd_custos=0)
+        with self.assertRaises(CommandError):
+            call_command("recalcular_custos", "--verificar",
+                         stdout=StringIO())
+        call_command("recalcular_custos", stdout=StringIO())
+        self.assertEqual(self.totais(self.eventos[0]), (Decimal("12"), 1))
+        call_command("recalcular_custos", "--verificar", stdout=StringIO())
+
+
+class PaginacaoCursorTests(APITestCase):
+    """Testes da paginação por cursor das listagens"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_paginas")
+        self.client.force_authenticate(user=self.user)
+        self.local = DadosFactory.criar_local(self.user)
+        # Criados fora de ordem para conferir a ordenação por dataInicio
+        for dia in (5, 1, 4, 2, 3):
+            DadosFactory.criar_evento(
+                self.local, titulo=f"Evento {dia}", orcamento=10,
+                dataInicio=f"2024-12-0{dia}T10:00:00Z",
+                dataFim=f"2024-12-0{dia}T18:00:00Z"
+            )
+
+    def test_eventos_paginados_por_data(self):
+        """As páginas seguem dataInicio e o cursor leva à próxima página"""
+        response = self.client.get("/api/eventos/", {"page_size": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        titulos = [item["titulo"] for item in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            titulos += [item["titulo"] for item in response.data["results"]]
+        self.assertEqual(titulos, [f"Evento {dia}" for dia in range(1, 6)])
+
+    def test_empates_de_data_entre_paginas(self):
+        """Eventos no mesmo instante não se repetem nem somem entre páginas"""
+        for indice in range(3):
+            DadosFactory.criar_evento(
+                self.local, titulo=f"Empate {indice}", orcamento=10,
+                dataInicio="2024-12-02T10:00:00Z",
+                dataFim="2024-12-02T12:00:00Z"
+            )
+        esperados = list(Evento.objects.filter(usuario=self.user)
+                         .order_by("dataInicio", "id")
+                         .values_list("id", flat=True))
+        response = self.client.get("/api/eventos/", {"page_size": 2})
+        ids = [item["id"] for item in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            ids += [item["id"] for item in response.data["results"]]
+        self.assertEqual(ids, esperados)
+
+    def test_tamanho_maximo_de_pagina(self):
+        """page_size é limitado pelo máximo configurado"""
+        response = self.client.get("/api/locais/", {"page_size": 100000})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("next", response.data)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_usuarios_paginados(self):
+        """A listagem de usuários também é paginada por cursor"""
+        response = self.client.get("/api/usuarios/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["username"],
+                         "usuario_paginas")
+
+
+class PlanoDeConsultaMixin:
+    """Helper que confere o plano (EXPLAIN QUERY PLAN) de um queryset"""
+
+    VARREDURA = re.compile(r"\bSCAN (?!CONSTANT ROW)")
+    ORDENACAO_TEMPORARIA = "USE TEMP B-TREE"
+
+    def assertSemVarreduraCompleta(self, queryset, ordenacao_por_indice=False):
+        """Falha se o plano ler alguma tabela inteira
+
+        Com ``ordenacao_por_indice`` também exige que o ORDER BY seja
+        atendido pelo índice, sem ordenação temporária.
+        """
+        plano = queryset.explain()
+        for linha in plano.splitlines():
+            if self.VARREDURA.search(linha):
+                self.fail(f"Varredura completa no plano:\n{plano}\n\n"
+                          f"{queryset.query}")
+            if ordenacao_por_indice and self.ORDENACAO_TEMPORARIA in linha:
+                self.fail(f"ORDER BY sem índice no plano:\n{plano}")
+
+
+class PlanoDeConsultaServicesTests(PlanoDeConsultaMixin, TestCase):
+    """Os querysets da camada de serviços devem usar os índices"""
+
+    def setUp(self):
+        self.user = DadosFactory.criar_usuario("usuario_plano")
+
+    def test_locais_do_usuario(self):
+        """Locais do usuário em ordem de id"""
+        self.assertSemVarreduraCompleta(
+            get_user_locals(self.user).order_by('id')[:51],
+            ordenacao_por_indice=True
+        )
+
+    def test_eventos_do_usuario_por_data(self):
+        """Eventos paginados e filtrados por período usam (usuario, dataInicio)"""
+        eventos = get_user_eventos(self.user)
+        self.assertSemVarreduraCompleta(
+            eventos.order_by('dataInicio', 'id')[:51],
+            ordenacao_por_indice=True
+        )
+        self.assertSemVarreduraCompleta(
+            eventos.filter(dataInicio__gte="2024-12-01T00:00:00Z",
+                           dataInicio__lt="2025-01-01T00:00:00Z")
+            .order_by('dataInicio'),
+            ordenacao_por_indice=True
+        )
+
+    def test_eventos_do_usuario_por_status(self):
+        """Filtro por status usa (usuario, status)"""
+        plano = get_user_eventos(self.user).filter(status="PLANEJADO").explain()
+        self.assertIn("evento_usuario_status_idx", plano)
+
+    def test_custos_do_usuario(self):
+        """Custos passam pelo índice de usuario em Evento e de evento em Custo"""
+        self.assertSemVarreduraCompleta(
+            get_user_custos(self.user).order_by('id')[:51]
+        )
+        self.assertSemVarreduraCompleta(
+            Custo.objects.filter(evento=1).order_by('id')[:51],
+            ordenacao_por_indice=True
+        )
+
+
+class CustosEmLoteAPITests(APITestCase):
+    """Testes do endpoint /api/custos/lote/"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_lote")
+        outro = DadosFactory.criar_usuario("outro_lote")
+        self.client.force_authenticate(user=self.user)
+        self.eventos = {}
+        for dono in (self.user, outro):
+            local = DadosFactory.criar_local(dono)
+            self.eventos[dono.username] = DadosFactory.criar_evento(
+                local, dataInicio="2024-12-25T10:00:00Z",
+                dataFim="2024-12-25T18:00:00Z"
+            )
+        self.url = "/api/custos/lote/"
+
+    def test_criar_lote(self):
+        """Cria todos os custos com poucas consultas e atualiza os totais"""
+        evento = self.eventos["usuario_lote"]
+        itens = [{"descricao": f"Item {i}", "valor": "2.50",
+                  "evento": evento.id} for i in range(100)]
+        # posse, INSERT, totais do evento, resumo mensal (leitura e
+        # atualização), versão e o savepoint da transação
+        with self.assertNumQueries(8):
+            response = self.client.post(self.url, itens, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 100)
+        self.assertTrue(all(item["id"] for item in response.data))
+        evento.refresh_from_db()
+        self.assertEqual((evento.total_custos, evento.qtd_custos),
+                         (Decimal("250"), 100))
+
+    def test_erros_por_item(self):
+        """Itens inválidos ou de outro usuário são apontados pelo índice"""
+        itens = [
+            {"descricao": "Ok", "valor": "1.00",
+             "evento": self.eventos["usuario_lote"].id},
+            {"descricao": "Sem valor",
+             "evento": self.eventos["usuario_lote"].id},
+            {"descricao": "Alheio", "valor": "1.00",
+             "evento": self.eventos["outro_lote"].id},
+        ]
+        response = self.client.post(self.url, itens, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(response.data["erros"]), [1, 2])
+        self.assertIn("valor", response.data["erros"][1])
+        self.assertFalse(Custo.objects.exists())
+
+    def test_lote_vazio(self):
+        """Um lote vazio ou que não é lista é recusado"""
+        response = self.client.post(self.url, {"descricao": "x"},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImportacaoTests(APITestCase):
+    """Testes da importação de locais e eventos em lote"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_importacao")
+        self.outro = DadosFactory.criar_usuario("outro_importacao")
+        self.client.force_authenticate(user=self.user)
+
+    def criar_local(self, dono):
+        """Cria um local para o usuário informado"""
+        return DadosFactory.criar_local(dono)
+
+    def test_importar_locais_csv(self):
+        """Linhas válidas são gravadas e as inválidas apontadas pela linha"""
+        conteudo = (
+            "nome,logradouro,numero,bairro,cidade,estado,cep,capacidade\n"
+            "Teatro,Rua B,,Centro,Natal,RN,59000-000,300\n"
+            "Arena,Rua C,10,Centro,Natal,RN,59000-001,abc\n"
+            "Galpão,Rua D,20,Centro,Natal,RN,59000-002,80\n"
+        )
+        arquivo = SimpleUploadedFile("locais.csv", conteudo.encode())
+        response = self.client.post("/api/locais/importar/",
+                                    {"arquivo": arquivo}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["importados"], 2)
+        self.assertEqual(response.data["rejeitados"], 1)
+        self.assertEqual(response.data["erros"][0]["linha"], 3)
+        self.assertEqual(
+            set(Local.objects.filter(usuario=self.user)
+                .values_list("nome", flat=True)), {"Teatro", "Galpão"}
+        )
+
+    def test_importar_eventos_ndjson(self):
+        """Os locais são conferidos em lote e JSON inválido é rejeitado"""
+        meu, alheio = self.criar_local(self.user), self.criar_local(self.outro)
+        base = {"titulo": "Show", "descricao": "D", "orcamento": "10.00",
+                "dataInicio": "2024-12-25T10:00:00Z",
+                "dataFim": "2024-12-25T18:00:00Z"}
+        linhas = [json.dumps({**base, "local": meu.id,
+                              "dataInicio": f"2024-12-2{i}T10:00:00Z",
+                              "dataFim": f"2024-12-2{i}T18:00:00Z"})
+                  for i in range(5)]
+        linhas += [json.dumps({**base, "local": alheio.id}), "{quebrado"]
+        arquivo = SimpleUploadedFile("eventos.ndjson",
+                                     "\n".join(linhas).encode())
+        response = self.client.post("/api/eventos/importar/",
+                                    {"arquivo": arquivo}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["importados"], 5)
+        self.assertEqual([erro["linha"] for erro in response.data["erros"]],
+                         [6, 7])
+        self.assertEqual(Evento.objects.filter(usuario=self.user).count(), 5)
+
+    def test_formato_invalido(self):
+        """Arquivos de formato desconhecido são recusados"""
+        arquivo = SimpleUploadedFile("locais.xml", b"<locais/>")
+        response = self.client.post("/api/locais/importar/",
+                                    {"arquivo": arquivo}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_comando_importar_dados(self):
+        """O comando importa em vários lotes e informa a vazão"""
+        local = self.criar_local(self.user)
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson",
+                                         delete=False) as arquivo:
+            for i in range(25):
+                arquivo.write(json.dumps({
+                    "titulo": f"Evento {i}", "descricao": "D",
+                    "orcamento": "1.00", "local": local.id,
+                    "dataInicio": f"2024-12-{i + 1:02d}T10:00:00Z",
+                    "dataFim": f"2024-12-{i + 1:02d}T18:00:00Z",
+                }) + "\n")
+        self.addCleanup(os.remove, arquivo.name)
+        saida = StringIO()
+        call_command("importar_dados", "eventos", arquivo.name,
+                     "--usuario", "usuario_importacao", "--lote", "10",
+                     stdout=saida)
+        self.assertIn("25 importado(s)", saida.getvalue())
+        self.assertEqual(Evento.objects.filter(usuario=self.user).count(), 25)
+
+
+class ExportacaoTests(APITestCase):
+    """Testes da exportação de eventos em fluxo"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_exportacao")
+        self.client.force_authenticate(user=self.user)
+        local = DadosFactory.criar_local(self.user, nome="Teatro")
+        for dia in (2, 1):
+            evento = DadosFactory.criar_evento(
+                local, titulo=f"Evento {dia}", orcamento=100,
+                dataInicio=f"2024-12-0{dia}T10:00:00Z",
+                dataFim=f"2024-12-0{dia}T18:00:00Z"
+            )
+            Custo.objects.create(descricao="Som", valor="7.50", evento=evento)
+
+    def test_exportar_csv(self):
+        """O CSV vem em fluxo, em ordem cronológica e com o total de custos"""
+        response = self.client.get("/api/eventos/exportar/",
+                                   {"formato": "csv"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        conteudo = b"".join(response.streaming_content).decode()
+        linhas = list(csv.DictReader(StringIO(conteudo)))
+        self.assertEqual([linha["titulo"] for linha in linhas],
+                         ["Evento 1", "Evento 2"])
+        self.assertEqual(linhas[0]["local_nome"], "Teatro")
+        self.assertEqual(linhas[0]["total_custos"], "7.50")
+        self.assertEqual(linhas[0]["dataInicio"], "2024-12-01T10:00:00Z")
+
+    def test_exportar_ndjson(self):
+        """Cada linha do NDJSON é um evento"""
+        response = self.client.get("/api/eventos/exportar/",
+                                   {"formato": "ndjson"})
+        conteudo = b"".join(response.streaming_content).decode()
+        eventos = [json.loads(linha) for linha in conteudo.splitlines()]
+        self.assertEqual(len(eventos), 2)
+        self.assertEqual(eventos[1]["qtd_custos"], 1)
+
+    def test_formato_invalido(self):
+        """Formatos desconhecidos são recusados"""
+        response = self.client.get("/api/eventos/exportar/",
+                                   {"formato": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ValidacaoDePosseTests(TestCase):
+    """Testes da validação de posse dos relacionamentos nos serializers"""
+
+    def setUp(self):
+        self.user = DadosFactory.criar_usuario("usuario_posse")
+        outro = DadosFactory.criar_usuario("outro_posse")
+        self.locais = [
+            DadosFactory.criar_local(dono, nome=f"Local {i}")
+            for i, dono in enumerate((self.user, self.user, outro))
+        ]
+        request = APIRequestFactory().get("/")
+        request.user = self.user
+        self.contexto = {"request": request}
+
+    def dados_evento(self, local, dia=25):
+        """Dados válidos de um evento no local informado"""
+        return {"titulo": "Evento", "descricao": "Descrição",
+                "orcamento": "10.00", "dataInicio": f"2024-12-{dia:02d}T10:00:00Z",
+                "dataFim": f"2024-12-{dia:02d}T18:00:00Z", "local": local.id}
+
+    def test_lista_resolve_locais_em_uma_consulta(self):
+        """Validar muitos eventos consulta os locais e as agendas uma vez"""
+        dados = [self.dados_evento(self.locais[i % 2], dia=i // 2 + 1)
+                 for i in range(50)]
+        serializer = EventoSerializer(data=dados, many=True,
+                                      context=self.contexto)
+        with self.assertNumQueries(2):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data[1]["local"],
+                         self.locais[1])
+
+    def test_lista_recusa_local_de_outro_usuario(self):
+        """O local de outro usuário é recusado no item correspondente"""
+        dados = [self.dados_evento(self.locais[0]),
+                 self.dados_evento(self.locais[2])]
+        serializer = EventoSerializer(data=dados, many=True,
+                                      context=self.contexto)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors[0], {})
+        self.assertIn("local", serializer.errors[1])
+
+    def test_item_unico_recusa_local_de_outro_usuario(self):
+        """Sem lote, a validação continua restrita ao usuário"""
+        serializer = EventoSerializer(data=self.dados_evento(self.locais[2]),
+                                      context=self.contexto)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("local", serializer.errors)
+
+    def test_leitura_nao_consulta_posse(self):
+        """Serializar para leitura não monta a consulta de posse"""
+        evento = DadosFactory.criar_evento(
+            self.locais[0], orcamento=10, dataInicio="2024-12-25T10:00:00Z",
+            dataFim="2024-12-25T18:00:00Z"
+        )
+        custos = [Custo.objects.create(descricao="A", valor=1, evento=evento)
+                  for _ in range(3)]
+        with self.assertNumQueries(0):
+            dados = CustoSerializer(custos, many=True,
+                                    context=self.contexto).data
+        self.assertEqual(dados[0]["evento"], evento.id)
+
+
+class ETagTests(APITestCase):
+    """Testes do GET condicional com ETag"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_etag")
+        self.client.force_authenticate(user=self.user)
+        self.local = DadosFactory.criar_local(self.user)
+        self.evento = DadosFactory.criar_evento(
+            self.local, orcamento=10, dataInicio="2024-12-25T10:00:00Z",
+            dataFim="2024-12-25T18:00:00Z"
+        )
+
+    def test_nao_modificado(self):
+        """Com o ETag atual a resposta é 304, só com a consulta da versão"""
+        response = self.client.get("/api/eventos/")
+        etag = response["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/eventos/",
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+    def test_escritas_mudam_o_etag(self):
+        """Escrever em local, evento ou custo do usuário muda o ETag"""
+        etags = [self.client.get("/api/eventos/")["ETag"]]
+        Custo.objects.create(descricao="Som", valor=5, evento=self.evento)
+        etags.append(self.client.get("/api/eventos/")["ETag"])
+        self.client.patch(f"/api/locais/{self.local.id}/", {"nome": "Novo"},
+                          format='json')
+        etags.append(self.client.get("/api/eventos/")["ETag"])
+        self.assertEqual(len(set(etags)), 3)
+        response = self.client.get("/api/eventos/",
+                                   HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_por_url(self):
+        """Lista e detalhe têm ETags diferentes"""
+        lista = self.client.get("/api/eventos/")["ETag"]
+        detalhe = self.client.get(f"/api/eventos/{self.evento.id}/")
+        self.assertNotEqual(lista, detalhe["ETag"])
+        response = self.client.get(f"/api/eventos/{self.evento.id}/",
+                                   HTTP_IF_NONE_MATCH=detalhe["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_save_do_usuario_nao_volta_a_versao(self):
+        """Salvar uma instância antiga do usuário não revalida ETags antigos"""
+        antigo = get_user_model().objects.get(pk=self.user.pk)
+        etag = self.client.get("/api/eventos/")["ETag"]
+        Custo.objects.create(descricao="Som", valor=5, evento=self.evento)
+        antigo.first_name = "Novo"
+        antigo.save()
+        antigo.save(update_fields=["first_name", "versao_dados"])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "Novo")
+        self.assertGreater(self.user.versao_dados, antigo.versao_dados)
+        response = self.client.get("/api/eventos/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_reconstrucao_muda_o_etag(self):
+        """Depois dos comandos recalcular_* o cliente recebe os novos totais"""
+        Custo.objects.create(descricao="Som", valor=5, evento=self.evento)
+        Evento.objects.update(total_custos=0, qtd_custos=0)
+        url = f"/api/eventos/{self.evento.id}/"
+        antiga = self.client.get(url)
+        self.assertEqual(antiga.data["total_custos"], "0.00")
+        call_command("recalcular_custos", stdout=StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=antiga["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total_custos"], "5.00")
+        for argumentos in ((), ("--usuario", self.user.username)):
+            etag = response["ETag"]
+            call_command("recalcular_resumo_mensal", *argumentos,
+                         stdout=StringIO())
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CacheRespostasTests(APITestCase):
+    """Testes do cache de respostas das listagens e detalhes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_cache")
+        self.client.force_authenticate(user=self.user)
+        self.local = DadosFactory.criar_local(self.user)
+
+    def test_segunda_leitura_vem_do_cache(self):
+        """A segunda leitura só consulta a versão dos dados"""
+        primeira = self.client.get("/api/locais/")
+        self.assertEqual(primeira["X-Cache"], "MISS")
+        with self.assertNumQueries(1):
+            segunda = self.client.get("/api/locais/")
+        self.assertEqual(segunda["X-Cache"], "HIT")
+        self.assertEqual(segunda.data, primeira.data)
+
+    def test_escrita_invalida_o_cache(self):
+        """Escritas pela API ou pelo ORM tornam a entrada antiga inválida"""
+        self.client.get("/api/locais/")
+        self.client.patch(f"/api/locais/{self.local.id}/", {"nome": "Novo"},
+                          format='json')
+        response = self.client.get("/api/locais/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["results"][0]["nome"], "Novo")
+        Local.objects.filter(pk=self.local.pk).first().delete()
+        response = self.client.get("/api/locais/")
+        self.assertEqual(response.data["results"], [])
+
+    def test_parametros_fazem_parte_da_chave(self):
+        """URLs com parâmetros diferentes não compartilham a entrada"""
+        self.client.get("/api/locais/")
+        response = self.client.get("/api/locais/", {"page_size": 1})
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_cache_em_arquivo(self):
+        """O cache também funciona com o backend em arquivo"""
+        with tempfile.TemporaryDirectory() as pasta:
+            caches_arquivo = {
+                "default": {"BACKEND": "django.core.cache.backends.locmem."
+                                       "LocMemCache"},
+                "respostas": {"BACKEND": "django.core.cache.backends."
+                                         "filebased.FileBasedCache",
+                              "LOCATION": pasta},
+            }
+            with override_settings(CACHES=caches_arquivo):
+                self.client.get(f"/api/locais/{self.local.id}/")
+                response = self.client.get(f"/api/locais/{self.local.id}/")
+                self.assertEqual(response["X-Cache"], "HIT")
+
+    def test_estatisticas(self):
+        """As estatísticas só ficam disponíveis para administradores"""
+        response = self.client.get("/api/cache/respostas/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get("/api/locais/")
+        self.client.get("/api/locais/")
+        response = self.client.get("/api/cache/respostas/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreaterEqual(response.data["acertos"], 1)
+        self.assertGreaterEqual(response.data["falhas"], 1)
+
+
+class IntervalosTests(TestCase):
+    """Testes das estruturas de sobreposição de intervalos"""
+
+    def test_indice_intervalos(self):
+        """Intervalos semiabertos: encostar no fim não é conflito"""
+        indice = IndiceIntervalos([(10, 20), (30, 40)])
+        self.assertTrue(indice.conflita(15, 16))
+        self.assertTrue(indice.conflita(5, 35))
+        self.assertFalse(indice.conflita(20, 30))
+        self.assertFalse(indice.conflita(0, 10))
+        indice.adicionar(0, 50)
+        self.assertTrue(indice.conflita(20, 30))
+        self.assertEqual(len(indice), 3)
+
+    def test_indice_confere_com_forca_bruta(self):
+        """Depois de várias fusões de blocos o índice segue a força bruta"""
+        inicios = [randint(0, 500) for _ in range(20)]
+        guardados = [(inicio, inicio + randint(1, 30)) for inicio in inicios]
+        indice = IndiceIntervalos(guardados)
+        for _ in range(200):
+            inicio = randint(0, 500)
+            fim = inicio + randint(1, 30)
+            esperado = any(inicio < outro_fim and outro_inicio < fim
+                           for outro_inicio, outro_fim in guardados)
+            self.assertEqual(indice.conflita(inicio, fim), esperado)
+            indice.adicionar(inicio, fim)
+            guardados.append((inicio, fim))
+        self.assertEqual(len(indice), len(guardados))
+
+    def test_encontrar_sobreposicoes(self):
+        """A varredura devolve só os pares que se sobrepõem"""
+        intervalos = [(1, 5, "a"), (2, 3, "b"), (5, 8, "c"), (6, 7, "d")]
+        self.assertEqual(list(encontrar_sobreposicoes(intervalos)),
+                         [("a", "b"), ("c", "d")])
+
+    def test_janelas_livres(self):
+        """As janelas livres descontam ocupações sobrepostas e de borda"""
+        ocupados = [(0, 12), (15, 20), (18, 25), (40, 60)]
+        self.assertEqual(list(janelas_livres(ocupados, 10, 50)),
+                         [(12, 15), (25, 40)])
+        self.assertEqual(list(janelas_livres([], 10, 50)), [(10, 50)])
+
+
+class ConflitosAgendaTests(PlanoDeConsultaMixin, APITestCase):
+    """Testes da detecção de conflitos de horário por local"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_agenda")
+        self.client.force_authenticate(user=self.user)
+        self.locais = [
+            DadosFactory.criar_local(self.user, nome=f"Local {i}")
+            for i in range(2)
+        ]
+        self.evento = DadosFactory.criar_evento(
+            self.locais[0], titulo="Ocupado", descricao="D", orcamento=10,
+            dataInicio="2024-12-25T10:00:00Z", dataFim="2024-12-25T18:00:00Z"
+        )
+
+    def dados(self, inicio, fim, local=None, **extra):
+        """Dados de um evento no intervalo do mesmo dia 25/12/2024"""
+        return {"titulo": "Novo", "descricao": "D", "orcamento": "10.00",
+                "dataInicio": f"2024-12-25T{inicio}:00:00Z",
+                "dataFim": f"2024-12-25T{fim}:00:00Z",
+                "local": (local or self.locais[0]).id, **extra}
+
+    def test_recusa_sobreposicao(self):
+        """Um evento sobreposto no mesmo local é recusado"""
+        response = self.client.post("/api/eventos/", self.dados(12, 20),
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(f"id {self.evento.id}",
+                      str(response.data["non_field_errors"][0]))
+
+    def test_permite_sem_sobreposicao(self):
+        """Horário encostado, outro local ou status cancelado são aceitos"""
+        for dados in (self.dados(18, 20), self.dados(12, 20, self.locais[1]),
+                      self.dados(12, 20, status="CANCELADO")):
+            response = self.client.post("/api/eventos/", dados, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED,
+                             response.data)
+
+    def test_ignora_cancelados_e_o_proprio_evento(self):
+        """Editar o próprio evento não conflita com ele mesmo"""
+        DadosFactory.criar_evento(
+            self.locais[0], titulo="Cancelado", descricao="D", orcamento=10,
+            status="CANCELADO", dataInicio="2024-12-25T18:00:00Z",
+            dataFim="2024-12-25T22:00:00Z"
+        )
+        response = self.client.patch(f"/api/eventos/{self.evento.id}/",
+                                     {"dataFim": "2024-12-25T21:00:00Z"},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK,
+                         response.data)
+
+    def test_editar_titulo_nao_confere_a_agenda(self):
+        """Um evento já sobreposto (dado legado) continua editável"""
+        legado = Evento.objects.bulk_create([Evento(
+            titulo="Legado", descricao="D", orcamento=10, local=self.locais[0],
+            usuario=self.user, dataInicio="2024-12-25T12:00:00Z",
+            dataFim="2024-12-25T20:00:00Z"
+        )])[0]
+        response = self.client.patch(f"/api/eventos/{legado.id}/",
+                                     {"titulo": "Renomeado"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK,
+                         response.data)
+        response = self.client.patch(f"/api/eventos/{legado.id}/",
+                                     {"dataFim": "2024-12-25T21:00:00Z"},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_lista_confere_o_lote_em_memoria(self):
+        """Itens do lote conflitam com a agenda e entre si"""
+        dados = [self.dados(8, 10), self.dados(9, 11), self.dados(20, 22),
+                 self.dados(21, 23)]
+        serializer = EventoSerializer(
+            data=dados, many=True,
+            context={"request": APIRequestFactory().get("/")}
+        )
+        serializer.context["request"].user = self.user
+        with self.assertNumQueries(2):
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual([bool(erro) for erro in serializer.errors],
+                         [False, True, False, True])
+
+    def test_endpoint_conflitos(self):
+        """O endpoint lista os pares de eventos sobrepostos do local"""
+        outro = DadosFactory.criar_evento(
+            self.locais[0], titulo="Sobreposto", descricao="D", orcamento=10,
+            dataInicio="2024-12-25T17:00:00Z", dataFim="2024-12-25T19:00:00Z"
+        )
+        url = f"/api/locais/{self.locais[0].id}/conflitos/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["evento"]["id"], self.evento.id)
+        self.assertEqual(response.data[0]["conflita_com"]["id"], outro.id)
+        response = self.client.get(url, {"inicio": "2024-12-26T00:00:00Z"})
+        self.assertEqual(response.data, [])
+        response = self.client.get(url, {"inicio": "amanhã"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_importacao_recusa_sobreposicao(self):
+        """A importação recusa linhas que conflitam com a agenda ou o lote"""
+        linhas = [json.dumps(self.dados(hora, hora + 2)) for hora in (16, 19, 20)]
+        arquivo = SimpleUploadedFile("eventos.ndjson",
+                                     "\n".join(linhas).encode())
+        response = self.client.post("/api/eventos/importar/",
+                                    {"arquivo": arquivo}, format='multipart')
+        self.assertEqual(response.data["importados"], 1)
+        self.assertEqual([erro["linha"] for erro in response.data["erros"]],
+                         [1, 3])
+
+    def test_consulta_de_conflito_usa_indice(self):
+        """A consulta de sobreposição usa o índice (local, dataFim)"""
+        self.assertSemVarreduraCompleta(
+            Evento.objects.filter(local=self.locais[0])
+            .sobrepostos("2024-12-25T12:00:00Z", "2024-12-25T20:00:00Z")
+        )
+
+
+class DisponibilidadeTests(APITestCase):
+    """Testes da busca de locais livres em /api/locais/disponibilidade/"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_livre")
+        outro = DadosFactory.criar_usuario("outro_livre")
+        self.client.force_authenticate(user=self.user)
+        self.locais = [
+            DadosFactory.criar_local(
+                dono, nome=f"Local {capacidade}", capacidade=capacidade
+            )
+            for capacidade, dono in ((50, self.user), (200, self.user),
+                                     (500, self.user), (1000, outro))
+        ]
+        for local, inicio, fim in ((self.locais[1], 8, 12),
+                                   (self.locais[1], 14, 18),
+                                   (self.locais[2], 9, 21)):
+            DadosFactory.criar_evento(
+                local, titulo="Ocupado", descricao="D", orcamento=10,
+                dataInicio=f"2024-12-25T{inicio}:00:00Z",
+                dataFim=f"2024-12-25T{fim}:00:00Z"
+            )
+        self.periodo = {"inicio": "2024-12-25T10:00:00Z",
+                        "fim": "2024-12-25T20:00:00Z"}
+
+    def buscar(self, **parametros):
+        """Consulta a disponibilidade no período padrão"""
+        return self.client.get("/api/locais/disponibilidade/",
+                               {**self.periodo, **parametros})
+
+    def test_janelas_por_local(self):
+        """Cada local traz as suas janelas livres, em duas consultas"""
+        with self.assertNumQueries(2):
+            response = self.buscar(capacidade_minima=100)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        local = response.data[0]
+        self.assertEqual(local["id"], self.locais[1].id)
+        self.assertFalse(local["livre_no_periodo"])
+        self.assertEqual(
+            [(janela["inicio"].hour, janela["fim"].hour)
+             for janela in local["janelas"]], [(12, 14), (18, 20)]
+        )
+
+    def test_local_livre_e_duracao_minima(self):
+        """Locais sem eventos ficam livres e janelas curtas são descartadas"""
+        response = self.buscar(duracao_minima=180)
+        self.assertEqual([local["id"] for local in response.data],
+                         [self.locais[0].id])
+        self.assertTrue(response.data[0]["livre_no_periodo"])
+
+    def test_parametros_invalidos(self):
+        """Período ausente, invertido ou capacidade inválida são recusados"""
+        response = self.client.get("/api/locais/disponibilidade/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.buscar(fim="2024-12-25T09:00:00Z")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.buscar(capacidade_minima="muitos")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CalendarioTests(PlanoDeConsultaMixin, APITestCase):
+    """Testes dos filtros de período e da visão de calendário de eventos"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_calendario")
+        self.client.force_authenticate(user=self.user)
+        self.locais = [
+            DadosFactory.criar_local(self.user, nome=f"Local {i}")
+            for i in range(2)
+        ]
+        for mes, dia, situacao, local in ((11, 30, "PLANEJADO", 0),
+                                          (12, 1, "PLANEJADO", 0),
+                                          (12, 15, "CONFIRMADO", 1),
+                                          (12, 31, "PLANEJADO", 1),
+                                          (1, 2, "PLANEJADO", 0)):
+            ano = 2025 if mes == 1 else 2024
+            DadosFactory.criar_evento(
+                self.locais[local], titulo=f"Evento {mes}/{dia}",
+                descricao="D", orcamento=10, status=situacao,
+                dataInicio=f"{ano}-{mes:02d}-{dia:02d}T10:00:00Z",
+                dataFim=f"{ano}-{mes:02d}-{dia:02d}T18:00:00Z"
+            )
+        self.dezembro = {"inicio_apos": "2024-12-01T00:00:00Z",
+                         "fim_antes": "2025-01-01T00:00:00Z"}
+
+    def titulos(self, response):
+        """Títulos dos eventos da resposta, na ordem recebida"""
+        itens = response.data
+        if isinstance(itens, dict):
+            itens = itens["results"]
+        return [item["titulo"] for item in itens]
+
+    def test_listagem_filtrada(self):
+        """A listagem aceita período, status e local"""
+        response = self.client.get("/api/eventos/", self.dezembro)
+        self.assertEqual(self.titulos(response),
+                         ["Evento 12/1", "Evento 12/15", "Evento 12/31"])
+        response = self.client.get("/api/eventos/", {
+            **self.dezembro, "status": "confirmado,planejado",
+            "local": self.locais[1].id})
+        self.assertEqual(self.titulos(response),
+                         ["Evento 12/15", "Evento 12/31"])
+        response = self.client.get("/api/eventos/", {"status": "ADIADO"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_calendario(self):
+        """O calendário devolve a projeção compacta do período"""
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/eventos/calendario/",
+                                       self.dezembro)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.titulos(response),
+                         ["Evento 12/1", "Evento 12/15", "Evento 12/31"])
+        self.assertEqual(set(response.data[0]),
+                         {"id", "titulo", "dataInicio", "dataFim", "status",
+                          "local"})
+        self.assertEqual(response.data[0]["local"], self.locais[0].id)
+        etag = response["ETag"]
+        response = self.client.get("/api/eventos/calendario/", self.dezembro,
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_calendario_inclui_eventos_que_atravessam_o_periodo(self):
+        """Eventos que cruzam a virada do mês aparecem nos dois meses"""
+        DadosFactory.criar_evento(
+            self.locais[1], titulo="Virada", descricao="D", orcamento=10,
+            dataInicio="2024-11-30T22:00:00Z", dataFim="2024-12-01T02:00:00Z"
+        )
+        response = self.client.get("/api/eventos/calendario/", self.dezembro)
+        self.assertEqual(self.titulos(response),
+                         ["Virada", "Evento 12/1", "Evento 12/15",
+                          "Evento 12/31"])
+        response = self.client.get("/api/eventos/calendario/", {
+            "inicio_apos": "2024-11-01T00:00:00Z",
+            "fim_antes": "2024-12-01T00:00:00Z"})
+        self.assertEqual(self.titulos(response), ["Evento 11/30", "Virada"])
+        # Terminar exatamente no início do período não é sobreposição
+        response = self.client.get("/api/eventos/calendario/", {
+            "inicio_apos": "2024-12-01T02:00:00Z",
+            "fim_antes": "2024-12-01T09:00:00Z"})
+        self.assertEqual(self.titulos(response), [])
+        self.assertSemVarreduraCompleta(
+            Evento.objects.filter(usuario=self.user)
+            .sobrepostos_ao_periodo("2024-12-01T00:00:00Z",
+                                    "2025-01-01T00:00:00Z")
+            .order_by('dataInicio', 'id'),
+        )
+
+    def test_calendario_exige_periodo_limitado(self):
+        """Sem período, ou com período longo demais, o calendário recusa"""
+        response = self.client.get("/api/eventos/calendario/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/api/eventos/calendario/", {
+            "inicio_apos": "2020-01-01T00:00:00Z",
+            "fim_antes": "2025-01-01T00:00:00Z"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_periodo_usa_indice(self):
+        """O filtro de período lê só a faixa do índice (usuario, dataInicio)"""
+        self.assertSemVarreduraCompleta(
+            Evento.objects.filter(usuario=self.user)
+            .no_periodo("2024-12-01T00:00:00Z", "2025-01-01T00:00:00Z")
+            .order_by('dataInicio', 'id'),
+        )
+        plano = Evento.objects.filter(usuario=self.user).no_periodo(
+            "2024-12-01T00:00:00Z", "2025-01-01T00:00:00Z").explain()
+        self.assertRegex(plano, r"evento_usuario_inicio_idx \(usuario_id=\? "
+                                r"AND dataInicio>\? AND dataInicio<\?\)")
+
+
+class AnaliseOrcamentoTests(APITestCase):
+    """Testes do endpoint /api/eventos/analise-orcamento/"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_analise")
+        self.client.force_authenticate(user=self.user)
+        self.locais = [
+            DadosFactory.criar_local(self.user, nome=f"Local {i}")
+            for i in range(2)
+        ]
+        # (mês, status, local, orçamento, custos)
+        for dia, (mes, situacao, local, orcamento, custos) in enumerate((
+                (11, "PLANEJADO", 0, "100.00", ["60.00", "50.00"]),
+                (11, "CONFIRMADO", 1, "200.00", ["50.00"]),
+                (12, "PLANEJADO", 1, "300.00", []),
+        ), start=1):
+            evento = DadosFactory.criar_evento(
+                self.locais[local], descricao="D", orcamento=orcamento,
+                status=situacao, dataInicio=f"2024-{mes}-{dia:02d}T10:00:00Z",
+                dataFim=f"2024-{mes}-{dia:02d}T18:00:00Z"
+            )
+            for valor in custos:
+                Custo.objects.create(descricao="Item", valor=valor,
+                                     evento=evento)
+
+    def test_agrupamentos(self):
+        """Totais, estouros e utilização por status, mês e local"""
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/eventos/analise-orcamento/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        total = response.data["total"]
+        self.assertEqual(Decimal(total["orcamento_total"]), Decimal("600.00"))
+        self.assertEqual(Decimal(total["custos_total"]), Decimal("160.00"))
+        self.assertEqual(total["qtd_eventos"], 3)
+        self.assertEqual(total["qtd_estouros"], 1)
+        self.assertEqual(total["utilizacao"], Decimal("0.2667"))
+        self.assertEqual(
+            [(linha["status"], linha["qtd_eventos"], linha["qtd_estouros"])
+             for linha in response.data["por_status"]],
+            [("CONFIRMADO", 1, 0), ("PLANEJADO", 2, 1)]
+        )
+        self.assertEqual(
+            [(linha["mes"], Decimal(linha["custos_total"]))
+             for linha in response.data["por_mes"]],
+            [("2024-11", Decimal("160.00")), ("2024-12", Decimal("0"))]
+        )
+        self.assertEqual(
+            [(linha["nome_local"], Decimal(linha["orcamento_total"]))
+             for linha in response.data["por_local"]],
+            [("Local 0", Decimal("100.00")), ("Local 1", Decimal("500.00"))]
+        )
+
+    def test_filtros(self):
+        """Os filtros da listagem também valem para a análise"""
+        response = self.client.get("/api/eventos/analise-orcamento/",
+                                   {"inicio_apos": "2024-12-01T00:00:00Z"})
+        self.assertEqual(response.data["total"]["qtd_eventos"], 1)
+        self.assertEqual(response.data["total"]["utilizacao"], Decimal("0"))
+        response = self.client.get("/api/eventos/analise-orcamento/",
+                                   {"status": "FINALIZADO"})
+        self.assertIsNone(response.data["total"]["utilizacao"])
+        self.assertEqual(response.data["por_mes"], [])
+
+
+class ResumoMensalTests(APITestCase):
+    """Testes da manutenção incremental da tabela ResumoMensal"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_resumo")
+        self.client.force_authenticate(user=self.user)
+        self.local = DadosFactory.criar_local(self.user)
+        self.evento = DadosFactory.criar_evento(
+            self.local, descricao="D", orcamento=100,
+            dataInicio="2024-11-10T10:00:00Z", dataFim="2024-11-10T18:00:00Z"
+        )
+
+    def resumo(self):
+        """Linhas não zeradas do resumo como (mês, status, totais)"""
+        return [
+            (linha.mes.strftime("%Y-%m"), linha.status,
+             linha.orcamento_total, linha.custos_total, linha.qtd_eventos,
+             linha.qtd_estouros)
+            for linha in ResumoMensal.objects.filter(qtd_eventos__gt=0)
+            .order_by("mes", "status")
+        ]
+
+    def assertResumoConfere(self):
+        """O resumo incremental é igual ao reconstruído do zero"""
+        call_command("recalcular_resumo_mensal", "--verificar",
+                     stdout=StringIO())
+
+    def test_custos_atualizam_o_resumo(self):
+        """Criar, alterar e remover custos ajusta totais e estouros"""
+        custo = Custo.objects.create(descricao="A", valor="80.00",
+                                     evento=self.evento)
+        self.assertEqual(self.resumo(), [("2024-11", "PLANEJADO",
+                                          Decimal("100"), Decimal("80"), 1, 0)])
+        custo.valor = Decimal("120.00")
+        custo.save()
+        self.assertEqual(self.resumo()[0][3:], (Decimal("120"), 1, 1))
+        custo.delete()
+        self.assertEqual(self.resumo()[0][3:], (Decimal("0"), 1, 0))
+        self.assertResumoConfere()
+
+    def test_evento_muda_de_linha(self):
+        """Mudar status ou mês move a contribuição entre linhas"""
+        Custo.objects.create(descricao="A", valor="30.00", evento=self.evento)
+        response = self.client.patch(
+            f"/api/eventos/{self.evento.id}/",
+            {"status": "CONFIRMADO", "dataInicio": "2024-12-01T10:00:00Z",
+             "dataFim": "2024-12-01T18:00:00Z"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.resumo(), [("2024-12", "CONFIRMADO",
+                                          Decimal("100"), Decimal("30"), 1, 0)])
+        self.assertResumoConfere()
+        self.client.delete(f"/api/eventos/{self.evento.id}/")
+        self.assertEqual(self.resumo(), [])
+        self.assertResumoConfere()
+
+    def test_instancia_defasada_nao_sobrescreve_totais(self):
+        """Salvar um evento carregado antes de um custo mantém os totais"""
+        carregado = Evento.objects.get(pk=self.evento.pk)
+        Custo.objects.create(descricao="A", valor="30.00", evento=self.evento)
+        carregado.orcamento = Decimal("20.00")
+        carregado.save()
+        carregado.refresh_from_db()
+        self.assertEqual(carregado.total_custos, Decimal("30"))
+        self.assertEqual(self.resumo()[0][2:], (Decimal("20"), Decimal("30"),
+                                                1, 1))
+        self.assertResumoConfere()
+
+    def test_importacao_soma_ao_resumo(self):
+        """Eventos importados em lote entram no resumo"""
+        linhas = [json.dumps({"titulo": "Show", "descricao": "D",
+                              "orcamento": "10.00", "local": self.local.id,
+                              "dataInicio": f"2024-11-2{i}T10:00:00Z",
+                              "dataFim": f"2024-11-2{i}T18:00:00Z"})
+                  for i in range(3)]
+        arquivo = SimpleUploadedFile("eventos.ndjson",
+                                     "\n".join(linhas).encode())
+        self.client.post("/api/eventos/importar/", {"arquivo": arquivo},
+                         format='multipart')
+        self.assertEqual(self.resumo()[0][2:],
+                         (Decimal("130"), Decimal("0"), 4, 0))
+        self.assertResumoConfere()
+
+    def test_comando_reconstroi_divergencias(self):
+        """Escritas sem sinais são apontadas e corrigidas pelo comando"""
+        Evento.objects.update(status="FINALIZADO")
+        with self.assertRaises(CommandError):
+            self.assertResumoConfere()
+        saida = StringIO()
+        call_command("recalcular_resumo_mensal", stdout=saida)
+        self.assertIn("1 linha(s)", saida.getvalue())
+        self.assertEqual(self.resumo()[0][1], "FINALIZADO")
+        self.assertResumoConfere()
+
+
+class CamposEsparsosTests(APITestCase):
+    """Testes de ?fields= e da leitura enxuta das listagens"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_campos")
+        self.client.force_authenticate(user=self.user)
+        self.local = DadosFactory.criar_local(self.user)
+        for dia in range(1, 4):
+            evento = DadosFactory.criar_evento(
+                self.local, titulo=f"Evento {dia}",
+                descricao="Texto longo " * 50, orcamento="1234.50",
+                observacoes="Observação",
+                dataInicio=f"2024-12-0{dia}T10:00:00Z",
+                dataFim=f"2024-12-0{dia}T18:30:00Z"
+            )
+            Custo.objects.create(descricao="Item", valor="10.05",
+                                 evento=evento)
+
+    def consultas_de_eventos(self, url):
+        """SELECTs em eventos_evento feitos pela requisição"""
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(url)
+        return response, [consulta["sql"] for consulta in contexto.captured_queries
+                          if consulta["sql"].startswith("SELECT")
+                          and 'FROM "eventos_evento"' in consulta["sql"]]
+
+    def test_leitura_enxuta_igual_ao_serializer(self):
+        """A listagem por values() gera a mesma saída do serializer"""
+        response = self.client.get("/api/eventos/")
+        esperado = json.loads(JSONRenderer().render(EventoSerializer(
+            Evento.objects.order_by("dataInicio", "id"), many=True).data))
+        self.assertEqual(response.json()["results"], esperado)
+
+    def test_fields_limita_saida_e_consulta(self):
+        """?fields= reduz a resposta e as colunas lidas na listagem"""
+        response, consultas = self.consultas_de_eventos(
+            "/api/eventos/?fields=id,titulo,local")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["results"][0],
+                         {"id": response.json()["results"][0]["id"],
+                          "titulo": "Evento 1", "local": self.local.id})
+        self.assertTrue(consultas)
+        self.assertTrue(all('"descricao"' not in sql for sql in consultas))
+
+    def test_fields_no_detalhe(self):
+        """O detalhe também aceita ?fields= e adia as outras colunas"""
+        evento = Evento.objects.first()
+        response, consultas = self.consultas_de_eventos(
+            f"/api/eventos/{evento.id}/?fields=titulo,orcamento")
+        self.assertEqual(response.json(), {"titulo": evento.titulo,
+                                           "orcamento": "1234.50"})
+        self.assertTrue(all('"descricao"' not in sql for sql in consultas))
+
+    def test_fields_invalido(self):
+        """Campos inexistentes são recusados"""
+        response = self.client.get("/api/locais/?fields=nome,senha")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("fields", response.data)
+
+    def test_serializer_com_campo_calculado_usa_caminho_normal(self):
+        """Campos que não são colunas desativam a leitura enxuta"""
+
+        class LocalComResumo(LocalSerializer):
+            """Serializer de teste com um campo calculado"""
+            resumo = serializers.SerializerMethodField()
+
+            def get_resumo(self, obj):
+                """Campo calculado"""
+                return str(obj)
+
+        self.assertIsNone(leitura_rapida(LocalComResumo))
+        self.assertIsNotNone(leitura_rapida(LocalComResumo, ("nome",)))
+
+
+class ViewsAssincronasTests(TestCase):
+    """Testes das leituras assíncronas em /api/async/"""
+
+    def setUp(self):
+        limpar_caches()
+        self.user = DadosFactory.criar_usuario("usuario_async")
+        outro = DadosFactory.criar_usuario("outro_async")
+        self.token = Token.objects.create(user=self.user)
+        local = DadosFactory.criar_local(self.user)
+        self.eventos = [
+            DadosFactory.criar_evento(
+                local, titulo=f"Evento {dia}", descricao="D",
+                orcamento="100.00", dataInicio=f"2024-12-0{dia}T10:00:00Z",
+                dataFim=f"2024-12-0{dia}T18:00:00Z"
+            )
+            for dia in (3, 1, 2)
+        ]
+        for valor in ("10.00", "20.50"):
+            Custo.objects.create(descricao="Item", valor=valor,
+                                 evento=self.eventos[0])
+        local_alheio = DadosFactory.criar_local(
+            outro, nome="Outro", logradouro="Rua B", numero=2
+        )
+        self.alheio = DadosFactory.criar_evento(
+            local_alheio, titulo="Alheio", descricao="D", orcamento="100.00"
+        )
+        self.cliente = AsyncClient()
+        self.sincrono = APIClient()
+        self.sincrono.force_authenticate(user=self.user)
+
+    async def get(self, url, dados=None):
+        """GET assíncrono com o token do usuário"""
+        return await self.cliente.get(
+            url, dados, headers={"Authorization": f"Token {self.token.key}"})
+
+    async def test_sem_token(self):
+        """Sem token válido a resposta é 401"""
+        response = await self.cliente.get("/api/async/eventos/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.cliente.get(
+            "/api/async/eventos/", headers={"Authorization": "Token invalido"})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_listagem_paginada(self):
+        """A listagem segue dataInicio e o cursor leva à próxima página"""
+        response = await self.get("/api/async/eventos/", {"page_size": 2})
+        dados = response.json()
+        self.assertEqual([item["titulo"] for item in dados["results"]],
+                         ["Evento 1", "Evento 2"])
+        response = await self.get(dados["next"])
+        dados = response.json()
+        self.assertEqual([item["titulo"] for item in dados["results"]],
+                         ["Evento 3"])
+        self.assertIsNone(dados["next"])
+        response = await self.get("/api/async/eventos/", {"cursor": "lixo"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_mesma_saida_da_rota_sincrona(self):
+        """Detalhe e custos têm a mesma saída das rotas do DRF"""
+        evento = self.eventos[0]
+        for assincrona, sincrona in (
+                (f"/api/async/eventos/{evento.id}/",
+                 f"/api/eventos/{evento.id}/"),
+                (f"/api/async/eventos/{evento.id}/custos/?detalhar=1&listar=1",
+                 f"/api/eventos/{evento.id}/custos/?detalhar=1&listar=1")):
+            response = await self.get(assincrona)
+            esperado = await sync_to_async(self.sincrono.get)(sincrona)
+            dados = response.json()
+            dados.pop("next", None)
+            dados.pop("previous", None)
+            esperado = esperado.json()
+            esperado.pop("next", None)
+            esperado.pop("previous", None)
+            self.assertEqual(dados, esperado)
+
+    async def test_evento_de_outro_usuario(self):
+        """Eventos de outro usuário não são encontrados"""
+        for url in (f"/api/async/eventos/{self.alheio.id}/",
+                    f"/api/async/eventos/{self.alheio.id}/custos/"):
+            response = await self.get(url)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.cliente.post(
+            "/api/async/eventos/",
+            headers={"Authorization": f"Token {self.token.key}"})
+        self.assertEqual(response.status_code,
+                         status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(response["Allow"], "GET, HEAD")
+
+    async def test_head_sem_corpo(self):
+        """HEAD tem os cabeçalhos do GET e nenhum corpo"""
+        cabecalhos = {"Authorization": f"Token {self.token.key}"}
+        fabrica = AsyncRequestFactory()
+        completa = await views_async.listar_eventos(
+            fabrica.get("/api/async/eventos/", headers=cabecalhos))
+        resposta = await views_async.listar_eventos(
+            fabrica.head("/api/async/eventos/", headers=cabecalhos))
+        self.assertEqual(resposta.status_code, status.HTTP_200_OK)
+        self.assertEqual(resposta.content, b"")
+        self.assertEqual(int(resposta["Content-Length"]),
+                         len(completa.content))
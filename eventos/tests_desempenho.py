@@ -0,0 +1,287 @@
+"""Testes de desempenho: consultas e tempo por endpoint
+
+Com um volume de dados próximo do real (centenas de eventos e milhares
+de custos), cada endpoint de listagem, detalhe, criação e custos tem um
+orçamento exato de consultas (``assertNumQueries``): um N+1 num
+serializer ou viewset muda a contagem e o teste falha. As listagens
+também não podem fazer mais consultas com páginas maiores.
+
+As requisições se autenticam pelo token, como os clientes reais, então a
+contagem inclui o caminho do cache de autenticação.
+
+Com ``DESEMPENHO_TEMPO=1`` as leituras também têm o tempo (mediana)
+comparado com a referência gravada em ``desempenho_referencia.json``, com
+a tolerância ``DESEMPENHO_TOLERANCIA`` (fração, padrão 1.0 = até o dobro)
+e uma folga fixa de ``FOLGA_MS``. O tempo depende da máquina, por isso
+fica fora da execução padrão. Para medir ou regravar a referência nesta
+máquina::
+
+    DESEMPENHO_TEMPO=1 python manage.py test eventos.tests_desempenho
+    DESEMPENHO_GRAVAR_REFERENCIA=1 python manage.py test eventos.tests_desempenho
+"""
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest import skipUnless
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from eventos.models import Local, Evento, Custo
+from eventos.resumos import reconstruir_resumo_mensal
+from usuarios.authentication import limpar_caches
+
+# pylint: disable=no-member
+
+ARQUIVO_REFERENCIA = Path(__file__).with_name('desempenho_referencia.json')
+TOLERANCIA = float(os.environ.get('DESEMPENHO_TOLERANCIA', '1.0'))
+FOLGA_MS = 5.0
+REPETICOES = 15
+GRAVAR_REFERENCIA = os.environ.get('DESEMPENHO_GRAVAR_REFERENCIA') == '1'
+MEDIR_TEMPO = GRAVAR_REFERENCIA or os.environ.get('DESEMPENHO_TEMPO') == '1'
+
+LOCAIS = 20
+EVENTOS = 600
+CUSTOS_POR_EVENTO = 5
+INICIO = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _local(usuario, numero):
+    return Local(nome=f"Local {numero}", logradouro="Rua A", numero=numero,
+                 bairro="Centro", cidade="Cidade X", estado="Estado Y",
+                 cep="12345-678", capacidade=50 + numero, usuario=usuario)
+
+
+def _povoar(usuario, eventos):
+    """Locais, eventos (sem sobreposição) e custos de um usuário"""
+    locais = Local.objects.bulk_create(
+        _local(usuario, numero) for numero in range(LOCAIS))
+    criados = Evento.objects.bulk_create(
+        Evento(titulo=f"Evento {numero}", descricao="Descrição " * 20,
+               orcamento=1000, status=("PLANEJADO", "CONFIRMADO")[numero % 2],
+               dataInicio=INICIO + timedelta(hours=6 * numero),
+               dataFim=INICIO + timedelta(hours=6 * numero + 4),
+               local=locais[numero % LOCAIS], usuario=usuario,
+               total_custos=CUSTOS_POR_EVENTO * 250,
+               qtd_custos=CUSTOS_POR_EVENTO)
+        for numero in range(eventos))
+    Custo.objects.bulk_create(
+        (Custo(descricao=f"Item {item % 3}", valor=250, evento=evento)
+         for evento in criados for item in range(CUSTOS_POR_EVENTO)),
+        batch_size=2000)
+    return locais, criados
+
+
+@override_settings(RESPOSTAS_CACHE={"ATIVO": False},
+                   METRICAS={"ATIVO": False},
+                   REPLICAS_LEITURA={"ALIASES": []})
+class DesempenhoEndpointsTests(TestCase):
+    """Orçamentos de consultas e de tempo dos endpoints da API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = get_user_model()
+        cls.user = usuario.objects.create_user(
+            username="usuario_desempenho", password="Senha@123",
+            cpf="121.232.343-45", email="desempenho@example.com"
+        )
+        outro = usuario.objects.create_user(
+            username="outro_desempenho", password="Senha@123",
+            cpf="121.232.343-56", email="outro_desempenho@example.com"
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.locais, cls.eventos = _povoar(cls.user, EVENTOS)
+        # Dados de outro usuário, que os filtros por dono devem ignorar
+        _povoar(outro, EVENTOS // 4)
+        reconstruir_resumo_mensal()
+        cls.evento = cls.eventos[EVENTOS // 2]
+        cls.custo = Custo.objects.filter(evento=cls.evento).first()
+
+    def setUp(self):
+        limpar_caches()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def urls(self):
+        """Rotas de leitura: nome -> URL"""
+        evento, local = self.evento.pk, self.locais[0].pk
+        periodo = "2024-02-01T00:00:00Z", "2024-03-01T00:00:00Z"
+        return {
+            "locais-list": "/api/locais/",
+            "locais-detail": f"/api/locais/{local}/",
+            "locais-disponibilidade": "/api/locais/disponibilidade/"
+                                      "?inicio={}&fim={}".format(*periodo),
+            "locais-conflitos": f"/api/locais/{local}/conflitos/",
+            "eventos-list": "/api/eventos/",
+            "eventos-list-filtrada": "/api/eventos/?status=CONFIRMADO&"
+                                     "inicio_apos=2024-02-01T00:00:00Z",
+            "eventos-detail": f"/api/eventos/{evento}/",
+            "eventos-calendario": "/api/eventos/calendario/"
+                                  "?inicio_apos={}&fim_antes={}".format(*periodo),
+            "eventos-analise-orcamento": "/api/eventos/analise-orcamento/",
+            "eventos-custos": f"/api/eventos/{evento}/custos/",
+            "eventos-custos-detalhados": f"/api/eventos/{evento}/custos/"
+                                         "?detalhar=1&listar=1",
+            "custos-list": "/api/custos/",
+            "custos-detail": f"/api/custos/{self.custo.pk}/",
+            "usuarios-list": "/api/usuarios/",
+            "usuarios-detail": f"/api/usuarios/{self.user.pk}/",
+        }
+
+    # Consultas por leitura, com o token já resolvido por uma requisição
+    # anterior (fica no cache de autenticação). Os viewsets com ETag leem
+    # antes a versão dos dados do usuário (1 consulta).
+    CONSULTAS_LEITURA = {
+        "locais-list": 2,
+        "locais-detail": 2,
+        "locais-disponibilidade": 2,
+        "locais-conflitos": 2,
+        "eventos-list": 2,
+        "eventos-list-filtrada": 2,
+        "eventos-detail": 2,
+        "eventos-calendario": 2,
+        # versão + agrupamentos por status, mês e local no resumo mensal
+        "eventos-analise-orcamento": 4,
+        # evento + agregação (+ por descrição + página de custos)
+        "eventos-custos": 2,
+        "eventos-custos-detalhados": 4,
+        "custos-list": 2,
+        "custos-detail": 2,
+        "usuarios-list": 1,
+        "usuarios-detail": 1,
+        "async-eventos-list": 1,
+        "async-eventos-detail": 1,
+        "async-eventos-custos": 2,
+    }
+
+    def get_async(self, url):
+        """GET pelo AsyncClient, autenticado pelo token"""
+        async def _get():
+            return await AsyncClient().get(
+                url, headers={"Authorization": f"Token {self.token.key}"})
+        return async_to_sync(_get)()
+
+    def ler(self, nome, url):
+        """Faz a leitura pela rota síncrona ou assíncrona"""
+        if nome.startswith("async-"):
+            return self.get_async(url)
+        return self.client.get(url)
+
+    def urls_de_leitura(self):
+        """Rotas síncronas e as equivalentes assíncronas"""
+        evento = self.evento.pk
+        return {**self.urls(),
+                "async-eventos-list": "/api/async/eventos/",
+                "async-eventos-detail": f"/api/async/eventos/{evento}/",
+                "async-eventos-custos": f"/api/async/eventos/{evento}/custos/"}
+
+    def test_consultas_das_leituras(self):
+        """Cada leitura faz exatamente as consultas do orçamento"""
+        for nome, url in self.urls_de_leitura().items():
+            with self.subTest(nome):
+                self.ler(nome, url)  # token e versão em cache
+                with self.assertNumQueries(self.CONSULTAS_LEITURA[nome]):
+                    response = self.ler(nome, url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_consultas_nao_crescem_com_a_pagina(self):
+        """Listagens fazem as mesmas consultas com páginas de 5 ou 100 itens"""
+        for url in ("/api/locais/", "/api/eventos/", "/api/custos/",
+                    "/api/usuarios/", "/api/async/eventos/",
+                    f"/api/eventos/{self.evento.pk}/custos/?listar=1"):
+            with self.subTest(url):
+                contagens = []
+                for tamanho in (5, 100):
+                    endereco = f"{url}{'&' if '?' in url else '?'}" \
+                               f"page_size={tamanho}"
+                    self.ler("async-" if "/async/" in url else "", endereco)
+                    with CaptureQueriesContext(connection) as contexto:
+                        self.ler("async-" if "/async/" in url else "",
+                                 endereco)
+                    contagens.append(len(contexto.captured_queries))
+                self.assertEqual(contagens[0], contagens[1])
+
+    def test_consultas_das_criacoes(self):
+        """Criação de local, evento, custo, custos em lote e usuário"""
+        local = self.locais[1].pk
+        self.client.get("/api/usuarios/")  # token em cache
+        # Cada tupla: nome, consultas, URL, dados. O evento novo cai num
+        # mês e local que já têm linha no resumo mensal (o caso comum).
+        criacoes = [
+            # INSERT + versão
+            ("locais-create", 2, "/api/locais/", {
+                "nome": "Novo", "logradouro": "Rua B", "numero": 9,
+                "bairro": "Centro", "cidade": "Cidade X",
+                "estado": "Estado Y", "cep": "12345-678", "capacidade": 80}),
+            # local, conflitos, INSERT, resumo mensal, versão
+            ("eventos-create", 5, "/api/eventos/", {
+                "titulo": "Novo", "descricao": "D", "orcamento": "500.00",
+                "status": "CONFIRMADO", "dataInicio": "2024-01-01T12:00:00Z",
+                "dataFim": "2024-01-01T14:00:00Z", "local": local}),
+            # evento, INSERT, totais do evento, estado e resumo, versão
+            ("custos-create", 6, "/api/custos/", {
+                "descricao": "Som", "valor": "120.00",
+                "evento": self.evento.pk}),
+            ("custos-lote", 8, "/api/custos/lote/", [
+                {"descricao": f"Item {i}", "valor": "2.50",
+                 "evento": self.evento.pk} for i in range(50)]),
+            # unicidade de username, cpf e email + INSERT
+            ("usuarios-create", 4, "/api/usuarios/", {
+                "username": "novo_desempenho", "cpf": "121.232.343-67",
+                "email": "novo_desempenho@example.com",
+                "password": "Senha@123", "first_name": "Novo",
+                "last_name": "Usuário"}),
+        ]
+        for nome, consultas, url, dados in criacoes:
+            with self.subTest(nome), self.assertNumQueries(consultas):
+                response = self.client.post(url, dados, format="json")
+                self.assertEqual(response.status_code,
+                                 status.HTTP_201_CREATED, response.data)
+
+    def test_consultas_da_exportacao(self):
+        """A exportação lê os eventos num único SELECT, sem consulta por evento"""
+        self.client.get("/api/eventos/exportar/?formato=ndjson")
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/eventos/exportar/?formato=ndjson")
+            linhas = b"".join(response.streaming_content).splitlines()
+        self.assertEqual(len(linhas), EVENTOS)
+
+    def medir(self, nome, url):
+        """Mediana, em ms, de REPETICOES leituras (depois do aquecimento)"""
+        for _ in range(2):
+            self.ler(nome, url)
+        tempos = []
+        for _ in range(REPETICOES):
+            inicio = time.perf_counter()
+            response = self.ler(nome, url)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return statistics.median(tempos)
+
+    @skipUnless(MEDIR_TEMPO, "Tempo medido só com DESEMPENHO_TEMPO=1")
+    def test_tempo_das_leituras(self):
+        """A mediana de cada leitura fica dentro da referência gravada"""
+        medidos = {nome: round(self.medir(nome, url), 3)
+                   for nome, url in self.urls_de_leitura().items()}
+        if GRAVAR_REFERENCIA:
+            ARQUIVO_REFERENCIA.write_text(
+                json.dumps(medidos, indent=2, sort_keys=True) + "\n",
+                encoding="utf-8")
+            self.skipTest(f"Referência gravada em {ARQUIVO_REFERENCIA.name}")
+        referencia = json.loads(ARQUIVO_REFERENCIA.read_text(encoding="utf-8"))
+        for nome, medido in medidos.items():
+            with self.subTest(nome):
+                self.assertIn(nome, referencia,
+                              "Sem referência: regrave o arquivo")
+                limite = referencia[nome] * (1 + TOLERANCIA) + FOLGA_MS
+                self.assertLessEqual(
+                    medido, limite,
+                    f"{nome}: {medido:.1f} ms, referência "
+                    f"{referencia[nome]:.1f} ms (limite {limite:.1f} ms)")
@@ -1,6 +1,9 @@
 """ Neste módulo temos a implementação dos viewsets, com
 o auxílio do services, criadas na api"""
 # pylint: disable=no-member, too-many-ancestors, too-many-return-statements
+import io
+from datetime import timedelta
+
 # Importações do Django REST framework
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated
@@ -9,17 +12,49 @@ from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError, PermissionDenied
 from rest_framework.exceptions import NotAuthenticated
 from django.core.exceptions import ObjectDoesNotExist
+from django.http import StreamingHttpResponse
+from gerenciamento_eventos.roteamento import LeituraReplicaMixin
 
 # Importações locais
+from .exportacao import FORMATOS, TIPOS_CONTEUDO, exportar_eventos
+from .importacao import formato_do_arquivo, importar, ler_registros
+from .mixins import CacheRespostaMixin, CamposEsparsosMixin, ETagVersaoMixin
 from .models import Evento, Custo
-from .serializers import LocalSerializer, EventoSerializer, CustoSerializer
+from .pagination import (
+    LocalCursorPagination, EventoCursorPagination, CustoCursorPagination
+)
+from .parametros import (
+    filtros_de_eventos, parametro_booleano, parametro_data, parametro_inteiro
+)
+from .serializers import (
+    LocalSerializer, EventoSerializer, CustoSerializer, CustoLoteSerializer
+)
 from .services import (
     get_user_locals, create_local, get_user_eventos, create_evento,
-    calcular_custos, get_user_custos
+    calcular_custos, get_user_custos, criar_custos_em_lote,
+    conflitos_do_local, disponibilidade_dos_locais, filtrar_eventos,
+    calendario_do_usuario, analise_orcamento
 )
 
 
-class LocalViewSet(viewsets.ModelViewSet):
+def _importar_arquivo(request, tipo):
+    """Importa o arquivo enviado no campo ``arquivo`` da requisição"""
+    arquivo = request.FILES.get('arquivo')
+    if arquivo is None:
+        raise ValidationError("Envie o arquivo no campo 'arquivo'.")
+    formato = formato_do_arquivo(arquivo.name,
+                                 request.query_params.get('formato'))
+    # Lê o upload como fluxo de texto, sem carregar o arquivo na memória
+    texto = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+    try:
+        return importar(tipo, ler_registros(texto, formato), request.user)
+    finally:
+        texto.detach()
+
+
+class LocalViewSet(LeituraReplicaMixin, ETagVersaoMixin,
+                   CacheRespostaMixin, CamposEsparsosMixin,
+                   viewsets.ModelViewSet):
     """ViewSet para gerenciamento de Locais
 
         Fornece operações CRUD para locais, com acesso restrito ao usuário
@@ -27,6 +62,7 @@ class LocalViewSet(viewsets.ModelViewSet):
     """
     serializer_class = LocalSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = LocalCursorPagination
 
     def get_queryset(self):
         """Retorna apenas locais do usuário autenticado"""
@@ -77,8 +113,67 @@ class LocalViewSet(viewsets.ModelViewSet):
             return Response({'Local não encontrado': str(e)},
                             status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=['POST'], url_path="importar")
+    def importar(self, request):
+        """Endpoint para importar locais de um arquivo CSV ou NDJSON
+
+        O arquivo vai no campo ``arquivo`` (multipart); o formato vem de
+        ``?formato=`` ou da extensão. Retorna quantos registros foram
+        importados e rejeitados, os primeiros erros por linha e a vazão.
+        """
+        try:
+            resultado = _importar_arquivo(request, 'locais')
+            return Response(resultado, status=status.HTTP_201_CREATED)
+        except ValidationError as ve:
+            return Response({'Não foi possível importar': ve.detail},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError as e:
+            return Response({'Arquivo não está em UTF-8': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['GET'], url_path="disponibilidade")
+    def disponibilidade(self, request):
+        """Endpoint que busca locais livres em um período
+
+        Recebe ``inicio`` e ``fim`` (ISO 8601) e, opcionalmente,
+        ``capacidade_minima`` e ``duracao_minima`` (em minutos). Retorna,
+        para cada local com alguma janela livre, as janelas do período.
+        """
+        try:
+            duracao = parametro_inteiro(request, 'duracao_minima')
+            return Response(
+                disponibilidade_dos_locais(
+                    request.user, parametro_data(request, 'inicio'),
+                    parametro_data(request, 'fim'),
+                    parametro_inteiro(request, 'capacidade_minima'),
+                    timedelta(minutes=duracao) if duracao else None
+                ),
+                status=status.HTTP_200_OK
+            )
+        except ValidationError as ve:
+            return Response(ve.detail, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['GET'], url_path="conflitos")
+    def conflitos(self, request, pk=None):  # pylint: disable=unused-argument
+        """Endpoint que lista os eventos do local com horários sobrepostos
+
+        Aceita ``inicio`` e ``fim`` (ISO 8601) para limitar a janela
+        analisada. Cada item traz o par de eventos em conflito.
+        """
+        try:
+            local = self.get_object()
+            return Response(
+                conflitos_do_local(local, parametro_data(request, 'inicio'),
+                                   parametro_data(request, 'fim')),
+                status=status.HTTP_200_OK
+            )
+        except ValidationError as ve:
+            return Response(ve.detail, status=status.HTTP_400_BAD_REQUEST)
+
 
-class EventoViewSet(viewsets.ModelViewSet):
+class EventoViewSet(LeituraReplicaMixin, ETagVersaoMixin,
+                    CacheRespostaMixin, CamposEsparsosMixin,
+                    viewsets.ModelViewSet):
     """ViewSet para gerenciamento de Eventos
 
     Fornece operações CRUD para eventos, com acesso restrito ao usuário
@@ -86,11 +181,20 @@ class EventoViewSet(viewsets.ModelViewSet):
     """
     serializer_class = EventoSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = EventoCursorPagination
 
     def get_queryset(self):
-        """Retorna apenas eventos do usuário autenticado"""
+        """Retorna apenas eventos do usuário autenticado
+
+        Na listagem aplica os filtros ``inicio_apos``, ``fim_antes``,
+        ``status`` e ``local`` da query string.
+        """
         try:
-            return get_user_eventos(self.request.user)
+            eventos = get_user_eventos(self.request.user)
+            if self.action == 'list':
+                eventos = filtrar_eventos(
+                    eventos, **filtros_de_eventos(self.request))
+            return eventos
         except PermissionError as e:
             return Response({'Você não tem permissão para executar isso':
                              str(e)}, status=status.HTTP_403_FORBIDDEN)
@@ -136,25 +240,124 @@ class EventoViewSet(viewsets.ModelViewSet):
             return Response({'Evento não encontrado': str(e)},
                             status=status.HTTP_404_NOT_FOUND)
 
-    @action(detail=True, methods=['GET'], url_path="custos")
-    def calcular_custos(self, request):  # ignorar
-        """Endpoint personalizado para calcular custos totais do evento
+    @action(detail=False, methods=['POST'], url_path="importar")
+    def importar(self, request):
+        """Endpoint para importar eventos de um arquivo CSV ou NDJSON
 
-        Retorna uma lista de custos e o valor total acumulado.
+        O arquivo vai no campo ``arquivo`` (multipart); o formato vem de
+        ``?formato=`` ou da extensão. Retorna quantos registros foram
+        importados e rejeitados, os primeiros erros por linha e a vazão.
         """
         try:
-            evento = self.get_object()
-            custos_data = calcular_custos(evento)
+            resultado = _importar_arquivo(request, 'eventos')
+            return Response(resultado, status=status.HTTP_201_CREATED)
+        except ValidationError as ve:
+            return Response({'Não foi possível importar': ve.detail},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError as e:
+            return Response({'Arquivo não está em UTF-8': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['GET'], url_path="calendario")
+    def calendario(self, request):
+        """Endpoint com a projeção compacta dos eventos de um período
+
+        Exige ``inicio_apos`` e ``fim_antes`` e aceita ``status`` e
+        ``local``. Cada item traz id, titulo, dataInicio, dataFim, status e
+        o id do local. Usa o mesmo ETag e cache de respostas da listagem.
+        """
+        return self.resposta_condicional(
+            request, self.resposta_em_cache, self._gerar_calendario
+        )
 
-            custo_serializer = CustoSerializer(
-                custos_data['custos'], many=True, context={'request': request}
+    def _gerar_calendario(self, request):
+        try:
+            return Response(
+                calendario_do_usuario(request.user,
+                                      **filtros_de_eventos(request)),
+                status=status.HTTP_200_OK
             )
+        except ValidationError as ve:
+            return Response(ve.detail, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['GET'], url_path="analise-orcamento")
+    def analise_orcamento(self, request):
+        """Endpoint com orçamento, custos, estouros e utilização agrupados
 
+        Agrupa os eventos do usuário por status, por mês de início e por
+        local. Aceita os mesmos filtros da listagem (``inicio_apos``,
+        ``fim_antes``, ``status`` e ``local``).
+        """
+        return self.resposta_condicional(
+            request, self.resposta_em_cache, self._gerar_analise_orcamento
+        )
+
+    def _gerar_analise_orcamento(self, request):
+        try:
             return Response(
-                {'custos': custo_serializer.data,
-                 'total': custos_data['total']},
+                analise_orcamento(request.user,
+                                  **filtros_de_eventos(request)),
                 status=status.HTTP_200_OK
             )
+        except ValidationError as ve:
+            return Response(ve.detail, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['GET'], url_path="exportar")
+    def exportar(self, request):
+        """Endpoint para exportar todos os eventos do usuário
+
+        Envia a resposta como fluxo (CSV ou NDJSON, via ``?formato=``), com
+        o total e a quantidade de custos de cada evento.
+        """
+        formato = request.query_params.get('formato', 'csv').lower()
+        if formato not in FORMATOS:
+            return Response({"Erro": "Formato inválido: use "
+                             f"{' ou '.join(FORMATOS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        resposta = StreamingHttpResponse(
+            exportar_eventos(request.user, formato),
+            content_type=TIPOS_CONTEUDO[formato]
+        )
+        resposta['Content-Disposition'] = \
+            f'attachment; filename="eventos.{formato}"'
+        return resposta
+
+    @action(detail=True, methods=['GET'], url_path="custos")
+    def calcular_custos(self, request, pk=None):  # pylint: disable=unused-argument
+        """Endpoint personalizado para calcular custos totais do evento
+
+        Retorna o valor total e a quantidade de custos, calculados no banco.
+        Parâmetros opcionais:
+
+        - ``detalhar=true``: inclui o total agrupado por descrição;
+        - ``listar=true``: inclui a lista de custos, paginada por cursor.
+        """
+        try:
+            evento = self.get_object()
+            custos_data = calcular_custos(
+                evento, detalhar=parametro_booleano(request, 'detalhar')
+            )
+
+            resposta = {'total': custos_data['total'],
+                        'quantidade': custos_data['quantidade']}
+            if 'message' in custos_data:
+                resposta['message'] = custos_data['message']
+            if 'por_descricao' in custos_data:
+                resposta['por_descricao'] = custos_data['por_descricao']
+
+            if parametro_booleano(request, 'listar'):
+                paginador = CustoCursorPagination()
+                pagina = paginador.paginate_queryset(
+                    custos_data['custos'], request, view=self
+                )
+                custo_serializer = CustoSerializer(
+                    pagina, many=True, context={'request': request}
+                )
+                resposta['custos'] = custo_serializer.data
+                resposta['next'] = paginador.get_next_link()
+                resposta['previous'] = paginador.get_previous_link()
+
+            return Response(resposta, status=status.HTTP_200_OK)
         except Evento.DoesNotExist:  # pode ignorar
             return Response(
                 {'error': 'Evento não encontrado.'},
@@ -183,7 +386,9 @@ class EventoViewSet(viewsets.ModelViewSet):
                             status=status.HTTP_404_NOT_FOUND)
 
 
-class CustoViewSet(viewsets.ModelViewSet):
+class CustoViewSet(LeituraReplicaMixin, ETagVersaoMixin,
+                   CacheRespostaMixin, CamposEsparsosMixin,
+                   viewsets.ModelViewSet):
     """ViewSet para gerenciamento de Custos
 
     Fornece operações CRUD para custos, com acesso restrito aos custos
@@ -192,6 +397,7 @@ class CustoViewSet(viewsets.ModelViewSet):
     serializer_class = CustoSerializer
     queryset = Custo.objects.all()  # pode ignorar
     permission_classes = [IsAuthenticated]
+    pagination_class = CustoCursorPagination
 
     def get_queryset(self):
         """Retorna apenas custos dos eventos do usuário autenticado"""
@@ -215,3 +421,27 @@ class CustoViewSet(viewsets.ModelViewSet):
         except ObjectDoesNotExist as e:
             return Response({'Custo ou evento não encontrado': str(e)},
                             status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['POST'], url_path="lote")
+    def criar_em_lote(self, request):
+        """Endpoint para cadastrar vários custos de uma vez
+
+        Recebe uma lista de custos e grava todos em uma única transação.
+        Se algum item for inválido nada é gravado e a resposta traz os
+        erros de cada item pelo índice.
+        """
+        try:
+            criados = criar_custos_em_lote(request.data, request.user)
+            return Response(
+                CustoLoteSerializer(criados, many=True).data,
+                status=status.HTTP_201_CREATED
+            )
+        except ValidationError as ve:
+            return Response(ve.detail, status=status.HTTP_400_BAD_REQUEST)
+        except PermissionDenied as pe:
+            return Response({'Você não tem permissão para executar esta ação':
+                            str(pe)}, status=status.HTTP_403_FORBIDDEN)
+        except NotAuthenticated as e:
+            return Response({'Você não está autenticado': str(e)},
+                            status=status.HTTP_401_UNAUTHORIZED)
+
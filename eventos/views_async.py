@@ -0,0 +1,193 @@
+"""Versões assíncronas (ASGI) das leituras de eventos
+
+São views do Django, não do DRF (que não tem views assíncronas): usam o
+ORM assíncrono (``aget``, ``aiterator``, ``aaggregate``) e, servidas pela
+aplicação de ``gerenciamento_eventos/asgi.py``, não ocupam uma thread por
+requisição enquanto esperam o banco. A saída é a mesma das rotas
+síncronas: os campos são convertidos com LeituraRapida e a resposta é
+renderizada pelo JSONRenderer do DRF.
+
+A autenticação é só por token (``Authorization: Token <chave>``) e a
+paginação é por cursor, só para frente.
+"""
+# pylint: disable=no-member
+import base64
+import json
+from functools import wraps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework import status
+from rest_framework.exceptions import NotAuthenticated, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from usuarios.authentication import autenticar_token
+from .models import Evento, Custo
+from .pagination import EventoCursorPagination, CustoCursorPagination
+from .parametros import filtros_de_eventos, parametro_booleano
+from .serializers import EventoSerializer, CustoSerializer, leitura_rapida
+from .services import (
+    agregacoes_de_custos, custos_por_descricao, filtrar_eventos
+)
+
+
+def _resposta(dados, codigo=status.HTTP_200_OK):
+    """Resposta JSON renderizada como nas rotas do DRF"""
+    return HttpResponse(JSONRenderer().render(dados), status=codigo,
+                        content_type='application/json')
+
+
+async def _usuario(request):
+    """Usuário do token enviado no cabeçalho Authorization, ou None"""
+    partes = request.headers.get('Authorization', '').split()
+    if len(partes) != 2 or partes[0].lower() != 'token':
+        return None
+    credenciais = await autenticar_token(partes[1])
+    return credenciais[0] if credenciais else None
+
+
+def _get_autenticado(view):
+    """Só aceita GET e HEAD e passa à view o usuário autenticado pelo token
+
+    No HEAD a resposta é a do GET sem o corpo, mantendo o Content-Length.
+    (Os decoradores de método do Django 4.2 não aceitam views async.)
+    """
+    @wraps(view)
+    async def _view(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        usuario = await _usuario(request)
+        if usuario is None:
+            resposta = _resposta(
+                {'detail': str(NotAuthenticated.default_detail)},
+                status.HTTP_401_UNAUTHORIZED)
+        else:
+            resposta = await view(request, usuario, *args, **kwargs)
+        if request.method == 'HEAD':
+            resposta['Content-Length'] = len(resposta.content)
+            resposta.content = b''
+        return resposta
+    return _view
+
+
+def _nao_encontrado():
+    return _resposta({'detail': 'Não encontrado.'}, status.HTTP_404_NOT_FOUND)
+
+
+def _codificar_cursor(valores):
+    texto = json.dumps(valores, cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(texto.encode()).decode()
+
+
+def _decodificar_cursor(cursor, modelo, ordenacao):
+    """Valores da última linha da página anterior, convertidos pelo modelo"""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(valores) != len(ordenacao):
+            raise ValueError
+        return [modelo._meta.get_field(campo).to_python(valor)
+                for campo, valor in zip(ordenacao, valores)]
+    except Exception as e:  # pylint: disable=broad-except
+        raise ValidationError({'cursor': ['Cursor inválido.']}) from e
+
+
+def _depois_de(ordenacao, valores):
+    """Q das linhas que vêm depois de ``valores`` na ``ordenacao`` (keyset)"""
+    condicao = Q()
+    for posicao, campo in enumerate(ordenacao):
+        anteriores = dict(zip(ordenacao[:posicao], valores[:posicao]))
+        condicao |= Q(**anteriores, **{f'{campo}__gt': valores[posicao]})
+    return condicao
+
+
+def _tamanho_pagina(request, paginacao):
+    tamanho = settings.REST_FRAMEWORK.get('PAGE_SIZE')
+    try:
+        tamanho = int(request.GET.get(paginacao.page_size_query_param,
+                                      tamanho))
+    except ValueError:
+        pass
+    return max(1, min(tamanho, paginacao.max_page_size))
+
+
+async def _pagina(request, queryset, paginacao, leitura):
+    """Uma página da consulta, lida com ``aiterator`` e um cursor keyset"""
+    ordenacao = paginacao.ordering
+    modelo = queryset.model
+    cursor = request.GET.get(paginacao.cursor_query_param)
+    if cursor:
+        queryset = queryset.filter(
+            _depois_de(ordenacao, _decodificar_cursor(cursor, modelo,
+                                                      ordenacao)))
+    tamanho = _tamanho_pagina(request, paginacao)
+    colunas = tuple(dict.fromkeys(leitura.colunas + ordenacao))
+    linhas = [linha async for linha in queryset.order_by(*ordenacao)
+              .values(*colunas)[:tamanho + 1].aiterator()]
+
+    proxima = None
+    if len(linhas) > tamanho:
+        linhas = linhas[:tamanho]
+        parametros = request.GET.copy()
+        parametros[paginacao.cursor_query_param] = _codificar_cursor(
+            [linhas[-1][campo] for campo in ordenacao])
+        proxima = request.build_absolute_uri(
+            f"{request.path}?{parametros.urlencode()}")
+    return {'next': proxima, 'previous': None,
+            'results': leitura.representar(linhas)}
+
+
+@_get_autenticado
+async def listar_eventos(request, usuario):
+    """GET /api/async/eventos/ — mesma listagem (e filtros) da rota síncrona"""
+    try:
+        eventos = filtrar_eventos(Evento.objects.filter(usuario=usuario),
+                                  **filtros_de_eventos(Request(request)))
+        return _resposta(await _pagina(request, eventos,
+                                       EventoCursorPagination,
+                                       leitura_rapida(EventoSerializer)))
+    except ValidationError as ve:
+        return _resposta(ve.detail, status.HTTP_400_BAD_REQUEST)
+
+
+@_get_autenticado
+async def detalhar_evento(request, usuario, pk):
+    """GET /api/async/eventos/<pk>/"""
+    leitura = leitura_rapida(EventoSerializer)
+    try:
+        evento = await Evento.objects.filter(usuario=usuario) \
+            .values(*leitura.colunas).aget(pk=pk)
+    except Evento.DoesNotExist:
+        return _nao_encontrado()
+    return _resposta(leitura.representar([evento])[0])
+
+
+@_get_autenticado
+async def custos_do_evento(request, usuario, pk):
+    """GET /api/async/eventos/<pk>/custos/ — total e quantidade dos custos
+
+    Aceita ``detalhar`` e ``listar`` como a rota síncrona.
+    """
+    if not await Evento.objects.filter(pk=pk, usuario=usuario).aexists():
+        return _nao_encontrado()
+
+    custos = Custo.objects.filter(evento_id=pk)
+    resumo = await custos.aaggregate(**agregacoes_de_custos())
+    resposta = {'total': resumo['total'], 'quantidade': resumo['quantidade']}
+    if not resumo['quantidade']:
+        resposta['message'] = "Nenhum custo associado a este evento."
+    drf_request = Request(request)
+    if parametro_booleano(drf_request, 'detalhar'):
+        resposta['por_descricao'] = [
+            linha async for linha in custos_por_descricao(custos).aiterator()
+        ]
+    if parametro_booleano(drf_request, 'listar'):
+        try:
+            pagina = await _pagina(request, custos, CustoCursorPagination,
+                                   leitura_rapida(CustoSerializer))
+        except ValidationError as ve:
+            return _resposta(ve.detail, status.HTTP_400_BAD_REQUEST)
+        resposta['custos'] = pagina['results']
+        resposta['next'] = pagina['next']
+        resposta['previous'] = None
+    return _resposta(resposta)
@@ -0,0 +1,25 @@
+from django.apps import AppConfig # type: ignore
+from django.core import checks
+from django.db.backends.signals import connection_created
+
+
+class GerenciamentoEventosConfig(AppConfig):
+    """Infraestrutura do projeto: conexões, medições e verificações"""
+    name = 'gerenciamento_eventos'
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel
+        from .consultas_lentas import instalar_cronometro
+        from .metricas import instalar_medidor
+        from .roteamento import verificar_cache_das_replicas
+        from .sqlite import aplicar_pragmas
+        # Pragmas do perfil de produção em cada nova conexão SQLite
+        connection_created.connect(aplicar_pragmas,
+                                   dispatch_uid='aplicar_pragmas_sqlite')
+        # Medição das consultas por requisição (métricas e consultas lentas)
+        connection_created.connect(instalar_medidor,
+                                   dispatch_uid='instalar_medidor_metricas')
+        connection_created.connect(instalar_cronometro,
+                                   dispatch_uid='instalar_cronometro_lentas')
+        # Aviso de cache local para as marcas de escrita das réplicas
+        checks.register(verificar_cache_das_replicas, checks.Tags.caches)
@@ -0,0 +1,248 @@
+"""Registro de consultas lentas com o plano do SQLite (settings.CONSULTAS_LENTAS)
+
+Opcional (``CONSULTAS_LENTAS_ATIVO=1``). ``ConsultasLentasMiddleware``
+instala, durante cada requisição, um ``execute_wrapper`` que cronometra
+as consultas. As que passam de ``LIMITE_MS`` são:
+
+- agrupadas pela impressão digital do SQL (literais trocados por ``?`` e
+  listas de IN colapsadas), com ocorrências, tempo total e máximo e as
+  views que as emitiram;
+- registradas no logger ``gerenciamento_eventos.consultas_lentas`` com a
+  impressão digital, a view e o plano.
+
+Como nas métricas, o ``execute_wrapper`` (``cronometrar_consultas``) é
+instalado uma vez em cada conexão nova (``apps.py`` do projeto) e só age
+quando a requisição corrente pôs um cronômetro na ContextVar, o que
+funciona em WSGI e em ASGI.
+
+O ``EXPLAIN QUERY PLAN`` é executado uma única vez por impressão digital,
+na primeira ocorrência. ``piores_consultas`` lista as de maior tempo
+total, publicadas em ``/api/consultas-lentas/`` para administradores.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+CONFIGURACAO_CONSULTAS_LENTAS_PADRAO = {
+    'ATIVO': False,
+    'LIMITE_MS': 100,
+    # Impressões digitais guardadas; as novas além disso só são logadas
+    'MAX_IMPRESSOES': 500,
+}
+MAX_VIEWS_POR_CONSULTA = 10
+
+_cronometro_atual = ContextVar('cronometro_consultas_lentas', default=None)
+
+_TEXTOS = re.compile(r"'(?:[^']|'')*'")
+_NUMEROS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMETROS = re.compile(r'%s|\?')
+_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ESPACOS = re.compile(r'\s+')
+
+
+def configuracao_consultas_lentas():
+    """Configuração de CONSULTAS_LENTAS completada com os valores padrão"""
+    return {**CONFIGURACAO_CONSULTAS_LENTAS_PADRAO,
+            **getattr(settings, 'CONSULTAS_LENTAS', {})}
+
+
+def normalizar_sql(sql):
+    """SQL sem literais nem parâmetros, com ``IN (?, ?, ...)`` colapsado"""
+    sql = _TEXTOS.sub('?', sql)
+    sql = _NUMEROS.sub('?', sql)
+    sql = _PARAMETROS.sub('?', sql)
+    sql = _LISTAS.sub('(...)', sql)
+    return _ESPACOS.sub(' ', sql).strip()
+
+
+def impressao_digital(sql):
+    """(impressão digital, SQL normalizado) de uma consulta"""
+    normalizado = normalizar_sql(sql)
+    return hashlib.sha1(normalizado.encode()).hexdigest()[:16], normalizado
+
+
+def plano_da_consulta(conexao, sql, params):
+    """Linhas do EXPLAIN QUERY PLAN, ou None fora do SQLite
+
+    Usa um cursor cru do backend, fora dos execute_wrappers da conexão.
+    """
+    if conexao.vendor != 'sqlite':
+        return None
+    cursor = conexao.create_cursor()
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [linha[-1] for linha in cursor.fetchall()]
+    except Exception:  # pylint: disable=broad-except
+        # Algumas instruções (PRAGMA, SAVEPOINT...) não têm plano
+        return None
+    finally:
+        cursor.close()
+
+
+class RegistroConsultasLentas:
+    """Consultas lentas agregadas por impressão digital"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._consultas = {}
+        self.descartadas = 0
+
+    def registrar(self, impressao, normalizado, milissegundos, view,
+                  capturar_plano, max_impressoes):
+        """Soma uma ocorrência; retorna o plano da impressão digital
+
+        ``capturar_plano`` só é chamado na primeira ocorrência. Com
+        ``max_impressoes`` atingido, impressões novas só são contadas em
+        ``descartadas``.
+        """
+        with self._lock:
+            consulta = self._consultas.get(impressao)
+            if consulta is None and len(self._consultas) >= max_impressoes:
+                self.descartadas += 1
+                return None
+        if consulta is None:
+            # Fora do lock: o EXPLAIN vai ao banco
+            plano = capturar_plano()
+            with self._lock:
+                consulta = self._consultas.setdefault(impressao, {
+                    'impressao_digital': impressao, 'sql': normalizado,
+                    'ocorrencias': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'views': {}, 'plano': plano,
+                })
+        with self._lock:
+            consulta['ocorrencias'] += 1
+            consulta['total_ms'] += milissegundos
+            consulta['max_ms'] = max(consulta['max_ms'], milissegundos)
+            if view in consulta['views'] or \
+                    len(consulta['views']) < MAX_VIEWS_POR_CONSULTA:
+                consulta['views'][view] = consulta['views'].get(view, 0) + 1
+            return consulta['plano']
+
+    def piores(self, limite=20):
+        """As consultas de maior tempo total, da pior para a melhor"""
+        with self._lock:
+            consultas = sorted(self._consultas.values(),
+                               key=lambda consulta: consulta['total_ms'],
+                               reverse=True)[:limite]
+            return [{**consulta, 'views': dict(consulta['views']),
+                     'total_ms': round(consulta['total_ms'], 3),
+                     'max_ms': round(consulta['max_ms'], 3),
+                     'media_ms': round(consulta['total_ms'] /
+                                       consulta['ocorrencias'], 3)}
+                    for consulta in consultas]
+
+    def limpar(self):
+        """Esquece todas as consultas"""
+        with self._lock:
+            self._consultas.clear()
+            self.descartadas = 0
+
+
+REGISTRO = RegistroConsultasLentas()
+
+
+def piores_consultas(limite=20):
+    """As consultas lentas de maior tempo total e quantas foram descartadas"""
+    return {'limite_ms': configuracao_consultas_lentas()['LIMITE_MS'],
+            'descartadas': REGISTRO.descartadas,
+            'consultas': REGISTRO.piores(limite)}
+
+
+def _view_da_requisicao(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return request.path
+    return match.view_name or match.url_name or request.path
+
+
+class _CronometroConsultas:
+    """execute_wrapper que registra as consultas acima do limite"""
+
+    def __init__(self, request, configuracao):
+        self.request = request
+        self.limite_ms = configuracao['LIMITE_MS']
+        self.max_impressoes = configuracao['MAX_IMPRESSOES']
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        resultado = execute(sql, params, many, context)
+        milissegundos = (time.perf_counter() - inicio) * 1000
+        if milissegundos >= self.limite_ms:
+            self.registrar(sql, params, many, context, milissegundos)
+        return resultado
+
+    def registrar(self, sql, params, many, context, milissegundos):
+        """Agrega a consulta lenta e a registra no log"""
+        impressao, normalizado = impressao_digital(sql)
+        view = _view_da_requisicao(self.request)
+        plano = REGISTRO.registrar(
+            impressao, normalizado, milissegundos, view,
+            # executemany não tem um único conjunto de parâmetros
+            lambda: None if many else plano_da_consulta(
+                context['connection'], sql, params),
+            self.max_impressoes,
+        )
+        logger.warning(
+            "Consulta lenta (%.1f ms) em %s [%s]: %s | plano: %s",
+            milissegundos, view, impressao, normalizado,
+            ' / '.join(plano) if plano else '-',
+        )
+
+
+def cronometrar_consultas(execute, sql, params, many, context):
+    """execute_wrapper permanente: repassa ao cronômetro da requisição"""
+    cronometro = _cronometro_atual.get()
+    if cronometro is None:
+        return execute(sql, params, many, context)
+    return cronometro(execute, sql, params, many, context)
+
+
+def instalar_cronometro(sender, connection, **kwargs):  # pylint: disable=unused-argument
+    """connection_created: põe ``cronometrar_consultas`` na conexão (uma vez)"""
+    if cronometrar_consultas not in connection.execute_wrappers:
+        connection.execute_wrappers.append(cronometrar_consultas)
+
+
+class ConsultasLentasMiddleware:
+    """Liga o cronômetro de consultas durante cada requisição
+
+    Com CONSULTAS_LENTAS['ATIVO'] falso (o padrão) o Django o remove da
+    cadeia e nada é medido. Atende síncrona ou assincronamente, conforme a
+    cadeia em que está.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not configuracao_consultas_lentas()['ATIVO']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        marca = _cronometro_atual.set(_CronometroConsultas(
+            request, configuracao_consultas_lentas()))
+        try:
+            return self.get_response(request)
+        finally:
+            _cronometro_atual.reset(marca)
+
+    async def __acall__(self, request):
+        """Versão assíncrona de ``__call__``, usada na cadeia ASGI"""
+        marca = _cronometro_atual.set(_CronometroConsultas(
+            request, configuracao_consultas_lentas()))
+        try:
+            return await self.get_response(request)
+        finally:
+            _cronometro_atual.reset(marca)
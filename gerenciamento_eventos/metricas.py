@@ -0,0 +1,283 @@
+"""Métricas por endpoint no formato de texto do Prometheus (settings.METRICAS)
+
+``MetricasMiddleware`` mede cada requisição (latência, quantidade e tempo
+das consultas SQL, tamanho da resposta) e guarda os valores em
+histogramas e contadores por view: o nome da rota resolvida (por exemplo
+``eventos-calcular-custos``) e a ação do viewset (``list``, ``create``...).
+A view ``metricas`` publica os valores em ``/metrics``, só para os IPs de
+``IPS_PERMITIDOS``.
+
+O middleware funciona em WSGI e em ASGI sem trocar de thread. As
+consultas são contadas por ``medir_consultas``, um ``execute_wrapper``
+instalado em cada conexão nova (``apps.py`` do projeto) que só mede
+quando a requisição corrente pôs um medidor na ContextVar; a ContextVar
+acompanha a requisição até a thread em que o Django executa as views
+síncronas.
+
+Os valores ficam na memória do processo: com vários processos cada um
+publica os seus, como no modo multiprocesso do cliente do Prometheus sem
+agregação.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+CONFIGURACAO_METRICAS_PADRAO = {
+    'ATIVO': True,
+    'IPS_PERMITIDOS': ['127.0.0.1', '::1'],
+}
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                    5.0, 10.0)
+LIMITES_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+LIMITES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+VIEW_DESCONHECIDA = 'desconhecida'
+# Outros métodos viram METODO_DESCONHECIDO, para não criar séries à vontade
+METODOS_CONHECIDOS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH',
+                                'DELETE', 'OPTIONS'))
+METODO_DESCONHECIDO = 'OUTRO'
+TIPO_CONTEUDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def configuracao_metricas():
+    """Configuração de METRICAS completada com os valores padrão"""
+    return {**CONFIGURACAO_METRICAS_PADRAO,
+            **getattr(settings, 'METRICAS', {})}
+
+
+def _rotulos(nomes, valores):
+    """``{nome="valor",...}`` com os valores escapados"""
+    pares = []
+    for nome, valor in zip(nomes, valores):
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"') \
+            .replace('\n', '\\n')
+        pares.append(f'{nome}="{valor}"')
+    return '{' + ','.join(pares) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    """Contador monotônico por combinação de rótulos"""
+    tipo = 'counter'
+
+    def __init__(self, nome, ajuda, rotulos):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, rotulos
+        self._series = {}
+
+    def somar(self, valores, quantidade=1):
+        """Soma ``quantidade`` à série (chamar com o lock do registro)"""
+        self._series[valores] = self._series.get(valores, 0) + quantidade
+
+    def linhas(self):
+        """Amostras no formato de texto"""
+        for valores, total in sorted(self._series.items()):
+            yield f'{self.nome}{_rotulos(self.rotulos, valores)} ' \
+                  f'{_numero(total)}'
+
+
+class Histograma:
+    """Histograma com faixas fixas por combinação de rótulos"""
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos, limites):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, rotulos
+        self.limites = limites
+        # valores dos rótulos -> [contagem por faixa..., +Inf], soma
+        self._series = {}
+
+    def observar(self, valores, valor):
+        """Conta ``valor`` na sua faixa (chamar com o lock do registro)"""
+        serie = self._series.get(valores)
+        if serie is None:
+            serie = self._series[valores] = [[0] * (len(self.limites) + 1), 0]
+        serie[0][bisect_left(self.limites, valor)] += 1
+        serie[1] += valor
+
+    def linhas(self):
+        """Faixas acumuladas, soma e contagem no formato de texto"""
+        nomes = self.rotulos + ('le',)
+        for valores, (contagens, soma) in sorted(self._series.items()):
+            acumulado = 0
+            for limite, contagem in zip(self.limites + ('+Inf',), contagens):
+                acumulado += contagem
+                yield f'{self.nome}_bucket' \
+                      f'{_rotulos(nomes, valores + (limite,))} {acumulado}'
+            rotulos = _rotulos(self.rotulos, valores)
+            yield f'{self.nome}_sum{rotulos} {_numero(soma)}'
+            yield f'{self.nome}_count{rotulos} {acumulado}'
+
+
+class RegistroMetricas:
+    """Métricas das requisições, atualizadas sob um único lock"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        rotulos = ('view', 'acao', 'metodo')
+        self.requisicoes = Contador(
+            'http_requisicoes_total', 'Requisições por view e status.',
+            rotulos + ('status',))
+        self.latencia = Histograma(
+            'http_requisicao_segundos', 'Latência das requisições.',
+            rotulos, LIMITES_SEGUNDOS)
+        self.consultas = Histograma(
+            'db_consultas_por_requisicao', 'Consultas SQL por requisição.',
+            rotulos, LIMITES_CONSULTAS)
+        self.tempo_consultas = Contador(
+            'db_consultas_segundos_total',
+            'Tempo total gasto nas consultas SQL.', rotulos)
+        self.tamanho = Histograma(
+            'http_resposta_bytes', 'Tamanho do corpo das respostas.',
+            rotulos, LIMITES_BYTES)
+
+    def metricas(self):
+        """As métricas na ordem em que são publicadas"""
+        return (self.requisicoes, self.latencia, self.consultas,
+                self.tempo_consultas, self.tamanho)
+
+    def registrar(self, rotulos, status, segundos, consultas,
+                  segundos_consultas, tamanho):
+        """Registra uma requisição; ``tamanho`` None para respostas em fluxo"""
+        with self._lock:
+            self.requisicoes.somar(rotulos + (str(status),))
+            self.latencia.observar(rotulos, segundos)
+            self.consultas.observar(rotulos, consultas)
+            self.tempo_consultas.somar(rotulos, segundos_consultas)
+            if tamanho is not None:
+                self.tamanho.observar(rotulos, tamanho)
+
+    def texto(self):
+        """Todas as métricas no formato de texto do Prometheus"""
+        linhas = []
+        with self._lock:
+            for metrica in self.metricas():
+                linhas.append(f'# HELP {metrica.nome} {metrica.ajuda}')
+                linhas.append(f'# TYPE {metrica.nome} {metrica.tipo}')
+                linhas.extend(metrica.linhas())
+        return '\n'.join(linhas) + '\n'
+
+    def limpar(self):
+        """Zera todas as séries"""
+        with self._lock:
+            for metrica in self.metricas():
+                metrica._series.clear()  # pylint: disable=protected-access
+
+
+REGISTRO = RegistroMetricas()
+
+
+_medidor_atual = ContextVar('medidor_metricas', default=None)
+
+
+class _MedidorConsultas:
+    """execute_wrapper que conta e cronometra as consultas"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+def medir_consultas(execute, sql, params, many, context):
+    """execute_wrapper permanente: repassa ao medidor da requisição, se houver"""
+    medidor = _medidor_atual.get()
+    if medidor is None:
+        return execute(sql, params, many, context)
+    return medidor(execute, sql, params, many, context)
+
+
+def instalar_medidor(sender, connection, **kwargs):  # pylint: disable=unused-argument
+    """connection_created: põe ``medir_consultas`` na conexão (uma vez)"""
+    if medir_consultas not in connection.execute_wrappers:
+        connection.execute_wrappers.append(medir_consultas)
+
+
+def _rotulos_da_requisicao(request):
+    """(view, ação do viewset, método), ou None para o próprio /metrics"""
+    match = getattr(request, 'resolver_match', None)
+    view = (match.view_name or match.url_name) if match else None
+    if view == 'metricas':
+        return None
+    acoes = getattr(match.func, 'actions', None) if match else None
+    metodo = request.method if request.method in METODOS_CONHECIDOS \
+        else METODO_DESCONHECIDO
+    return (view or VIEW_DESCONHECIDA,
+            (acoes or {}).get(request.method.lower(), ''), metodo)
+
+
+class MetricasMiddleware:
+    """Mede latência, consultas e tamanho das respostas por view
+
+    Deve ser o primeiro de MIDDLEWARE, para que a latência inclua os
+    demais. Com METRICAS['ATIVO'] falso o Django o remove da cadeia.
+    Atende síncrona ou assincronamente, conforme a cadeia em que está.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not configuracao_metricas()['ATIVO']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medidor = _MedidorConsultas()
+        marca = _medidor_atual.set(medidor)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _medidor_atual.reset(marca)
+        self.registrar(request, response, time.perf_counter() - inicio,
+                       medidor)
+        return response
+
+    async def __acall__(self, request):
+        """Versão assíncrona de ``__call__``, usada na cadeia ASGI"""
+        medidor = _MedidorConsultas()
+        marca = _medidor_atual.set(medidor)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medidor_atual.reset(marca)
+        self.registrar(request, response, time.perf_counter() - inicio,
+                       medidor)
+        return response
+
+    @staticmethod
+    def registrar(request, response, segundos, medidor):
+        """Soma a requisição às métricas da sua view"""
+        rotulos = _rotulos_da_requisicao(request)
+        if rotulos is None:
+            return
+        tamanho = None if response.streaming else len(response.content)
+        REGISTRO.registrar(rotulos, response.status_code, segundos,
+                           medidor.consultas, medidor.segundos, tamanho)
+
+
+def metricas(request):
+    """GET /metrics — métricas em texto, só para IPs permitidos"""
+    configuracao = configuracao_metricas()
+    if not configuracao['ATIVO']:
+        raise Http404
+    if request.META.get('REMOTE_ADDR') not in configuracao['IPS_PERMITIDOS']:
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRO.texto(), content_type=TIPO_CONTEUDO)
@@ -0,0 +1,15 @@
+"""Paginação padrão da API"""
+from rest_framework.pagination import CursorPagination
+
+
+class PaginacaoPorCursor(CursorPagination):
+    """Paginação por cursor (keyset) ordenada por colunas indexadas
+
+    O cursor guarda a posição do último item lido, então páginas profundas
+    custam o mesmo que a primeira (não há OFFSET). O tamanho padrão vem de
+    ``REST_FRAMEWORK['PAGE_SIZE']`` e pode ser alterado por requisição com
+    ``?page_size=``, até ``max_page_size``.
+    """
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -0,0 +1,132 @@
+"""Roteamento de leituras para réplicas (settings.REPLICAS_LEITURA)
+
+Só as requisições de leitura (GET, HEAD, OPTIONS) dos viewsets que usam
+LeituraReplicaMixin vão para as réplicas: o mixin sorteia uma réplica por
+requisição e a guarda numa ContextVar, e o RoteadorReplicas só desvia as
+leituras feitas com ela definida. Assim todas as consultas de uma
+requisição veem o mesmo estado. Escritas, comandos, sinais e a
+autenticação continuam no ``default``.
+
+Para o usuário ler o que acabou de gravar (a réplica pode estar
+atrasada), toda escrita dele pela API grava uma marca no cache; enquanto
+ela existe (``ADERENCIA_SEGUNDOS``, que deve ser maior que o atraso da
+replicação) as leituras dele ficam no ``default``. Com vários processos o
+cache das marcas (``CACHE``) precisa ser compartilhado entre eles;
+``verificar_cache_das_replicas`` avisa quando ele é local ao processo.
+"""
+import random
+from contextvars import ContextVar
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+CONFIGURACAO_REPLICAS_PADRAO = {
+    # Aliases de DATABASES que recebem as leituras
+    'ALIASES': [],
+    # Cache das marcas de escrita; em produção com vários processos deve
+    # ser compartilhado (Redis, Memcached, banco)
+    'CACHE': 'default',
+    'ADERENCIA_SEGUNDOS': 5,
+}
+METODOS_DE_LEITURA = ('GET', 'HEAD', 'OPTIONS')
+# Backends cujo conteúdo não é visto pelos outros processos
+CACHES_LOCAIS = ('django.core.cache.backends.locmem.LocMemCache',
+                 'django.core.cache.backends.dummy.DummyCache')
+
+# Alias da réplica escolhida para a requisição atual (None: o padrão)
+_replica_da_requisicao = ContextVar('replica_da_requisicao', default=None)
+
+
+def configuracao_replicas():
+    """Configuração de REPLICAS_LEITURA completada com os valores padrão"""
+    return {**CONFIGURACAO_REPLICAS_PADRAO,
+            **getattr(settings, 'REPLICAS_LEITURA', {})}
+
+
+def _chave_escrita(usuario_id):
+    return f"replicas:escrita:{usuario_id}"
+
+
+def marcar_escrita(usuario_id):
+    """Mantém as leituras do usuário no default durante a aderência"""
+    configuracao = configuracao_replicas()
+    if configuracao['ALIASES']:
+        caches[configuracao['CACHE']].set(
+            _chave_escrita(usuario_id), True,
+            timeout=configuracao['ADERENCIA_SEGUNDOS'])
+
+
+def escreveu_recentemente(usuario_id):
+    """True se o usuário gravou algo dentro da janela de aderência"""
+    configuracao = configuracao_replicas()
+    return bool(caches[configuracao['CACHE']].get(_chave_escrita(usuario_id)))
+
+
+def verificar_cache_das_replicas(app_configs, **kwargs):  # pylint: disable=unused-argument
+    """System check: com réplicas, o cache das marcas deve ser compartilhado"""
+    configuracao = configuracao_replicas()
+    if not configuracao['ALIASES']:
+        return []
+    backend = settings.CACHES.get(configuracao['CACHE'], {}).get('BACKEND')
+    if backend in CACHES_LOCAIS:
+        return [checks.Warning(
+            f"O cache '{configuracao['CACHE']}' das marcas de escrita das "
+            f"réplicas ({backend}) não é compartilhado entre processos: "
+            "um usuário pode não ler as próprias escritas.",
+            hint="Aponte DB_REPLICA_CACHE para um cache compartilhado "
+                 "(Redis, Memcached, banco).",
+            id='gerenciamento_eventos.W001',
+        )]
+    return []
+
+
+class RoteadorReplicas:
+    """Envia às réplicas as leituras marcadas por LeituraReplicaMixin"""
+
+    def db_for_read(self, model, **hints):  # pylint: disable=unused-argument
+        """A réplica escolhida para a requisição; fora dela, o padrão"""
+        return _replica_da_requisicao.get()
+
+    def db_for_write(self, model, **hints):  # pylint: disable=unused-argument
+        """Escritas sempre no banco principal"""
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):  # pylint: disable=unused-argument
+        """Réplicas têm os mesmos dados do principal"""
+        return True
+
+
+class LeituraReplicaMixin:
+    """Lê das réplicas nas requisições de leitura do viewset
+
+    A réplica é sorteada uma vez, depois de ``super().initial()``: a
+    autenticação e as permissões já foram resolvidas no ``default`` e
+    todas as leituras da requisição vão para a mesma réplica.
+    Escritas bem-sucedidas marcam o usuário para a leitura das próprias
+    escritas.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        """Escolhe a réplica da requisição quando ela pode ir para lá"""
+        super().initial(request, *args, **kwargs)
+        usuario = request.user
+        aliases = configuracao_replicas()['ALIASES']
+        if request.method in METODOS_DE_LEITURA and aliases and \
+                not (usuario.is_authenticated and
+                     escreveu_recentemente(usuario.pk)):
+            self._marca_replica = _replica_da_requisicao.set(
+                random.choice(aliases))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Desfaz a marcação e registra as escritas do usuário"""
+        marca = getattr(self, '_marca_replica', None)
+        if marca is not None:
+            _replica_da_requisicao.reset(marca)
+            self._marca_replica = None
+        if request.method not in METODOS_DE_LEITURA and \
+                response.status_code < 400 and \
+                getattr(request, 'user', None) is not None and \
+                request.user.is_authenticated:
+            marcar_escrita(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
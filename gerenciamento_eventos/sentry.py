@@ -0,0 +1,137 @@
+"""Inicialização do Sentry com amostragem por rota (settings.SENTRY)
+
+O rastreamento custa tempo em toda requisição amostrada, então só uma
+fração das transações é medida. A decisão tem duas etapas:
+
+1. ``amostrador`` (``traces_sampler``) decide no início da requisição se
+   ela é medida, com a taxa de captura: a maior entre a taxa da rota e
+   ``AMOSTRA_CAPTURA``;
+2. ``filtro_de_transacoes`` (``before_send_transaction``) decide no fim o
+   que é enviado: transações lentas (``LENTA_MS``) ou com erro 5xx sempre
+   vão; as demais vão com a probabilidade que completa a taxa da rota.
+
+Assim a listagem de eventos, que é o grosso do tráfego, chega ao Sentry
+com uma taxa baixa sem deixar de reportar as suas requisições lentas. Os
+erros (exceções) têm a sua própria taxa, ``AMOSTRA_ERROS``.
+
+Este módulo é importado pelo settings, então não usa ``django.conf``.
+"""
+import random
+from datetime import datetime
+from urllib.parse import urlsplit
+import sentry_sdk
+from sentry_sdk.integrations.django import DjangoIntegration
+
+
+def ler_taxas_por_rota(texto):
+    """Converte ``"/api/eventos/=0.01,/api/*=0.2"`` em {rota: taxa}
+
+    Uma rota terminada em ``*`` vale como prefixo; as demais são exatas.
+    """
+    taxas = {}
+    for regra in filter(None, (parte.strip() for parte in texto.split(','))):
+        rota, _, taxa = regra.rpartition('=')
+        taxa = float(taxa)
+        if not rota or not 0 <= taxa <= 1:
+            raise ValueError(f"Regra de amostragem inválida: {regra}")
+        taxas[rota.strip()] = taxa
+    return taxas
+
+
+def taxa_da_rota(caminho, configuracao):
+    """Taxa da regra exata do caminho, ou do prefixo mais longo, ou a padrão"""
+    regras = configuracao['AMOSTRAS_POR_ROTA']
+    if caminho in regras:
+        return regras[caminho]
+    prefixos = [rota for rota in regras
+                if rota.endswith('*') and caminho.startswith(rota[:-1])]
+    if prefixos:
+        return regras[max(prefixos, key=len)]
+    return configuracao['AMOSTRA_PADRAO']
+
+
+def taxa_de_captura(caminho, configuracao):
+    """Fração das requisições do caminho que é medida"""
+    taxa = taxa_da_rota(caminho, configuracao)
+    return max(taxa, configuracao['AMOSTRA_CAPTURA']) if taxa else 0.0
+
+
+def _caminho_da_amostragem(contexto):
+    """Caminho da requisição no contexto de amostragem (WSGI ou ASGI)"""
+    if 'wsgi_environ' in contexto:
+        return contexto['wsgi_environ'].get('PATH_INFO', '')
+    return contexto.get('asgi_scope', {}).get('path', '')
+
+
+def amostrador(configuracao):
+    """``traces_sampler``: taxa de captura da rota da requisição"""
+    def _amostrar(contexto):
+        if contexto.get('parent_sampled') is not None:
+            # Segue a decisão do serviço que iniciou o rastreamento
+            return float(contexto['parent_sampled'])
+        caminho = _caminho_da_amostragem(contexto)
+        if not caminho:
+            return configuracao['AMOSTRA_PADRAO']
+        return taxa_de_captura(caminho, configuracao)
+    return _amostrar
+
+
+def _segundos(valor):
+    """Instante do evento em segundos (datetime, texto ISO 8601 ou número)"""
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    if isinstance(valor, datetime):
+        return valor.timestamp()
+    return float(valor or 0)
+
+
+def _com_erro(evento):
+    status_http = evento.get('tags', {}).get('http.status_code', '')
+    if status_http.isdigit():
+        return int(status_http) >= 500
+    return evento.get('contexts', {}).get('trace', {}) \
+        .get('status') == 'internal_error'
+
+
+def filtro_de_transacoes(configuracao):
+    """``before_send_transaction``: mantém as lentas e as com erro
+
+    As rápidas e sem erro são mantidas com probabilidade
+    taxa da rota / taxa de captura, para que cheguem ao Sentry na taxa da
+    rota.
+    """
+    def _filtrar(evento, dica):  # pylint: disable=unused-argument
+        duracao = _segundos(evento.get('timestamp')) - \
+            _segundos(evento.get('start_timestamp'))
+        if duracao * 1000 >= configuracao['LENTA_MS'] or _com_erro(evento):
+            return evento
+        url = evento.get('request', {}).get('url')
+        if not url:
+            return evento
+        caminho = urlsplit(url).path
+        captura = taxa_de_captura(caminho, configuracao)
+        if captura and random.random() < \
+                taxa_da_rota(caminho, configuracao) / captura:
+            return evento
+        return None
+    return _filtrar
+
+
+def iniciar_sentry(configuracao):
+    """Inicializa o SDK; não faz nada se desligado ou sem DSN
+
+    Retorna True se o Sentry foi inicializado.
+    """
+    if not configuracao['ATIVO'] or not configuracao['DSN']:
+        return False
+    sentry_sdk.init(
+        dsn=configuracao['DSN'],
+        integrations=[DjangoIntegration()],
+        sample_rate=configuracao['AMOSTRA_ERROS'],
+        traces_sampler=amostrador(configuracao),
+        before_send_transaction=filtro_de_transacoes(configuracao),
+        # Fração das transações medidas que também é perfilada
+        profiles_sample_rate=configuracao['AMOSTRA_PERFIS'],
+        environment=configuracao['AMBIENTE'],
+    )
+    return True
@@ -10,8 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
-import sentry_sdk
+from gerenciamento_eventos.sentry import iniciar_sentry, ler_taxas_por_rota
 
 
 
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework.authtoken',
+    'gerenciamento_eventos',
     'eventos',
     'usuarios',
 ]
@@ -49,6 +51,9 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'usuarios.Usuario'
 
 MIDDLEWARE = [
+    # Primeiro, para medir também os demais (gerenciamento_eventos/metricas.py)
+    'gerenciamento_eventos.metricas.MetricasMiddleware',
+    'gerenciamento_eventos.consultas_lentas.ConsultasLentasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +63,23 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Latência, consultas e tamanho das respostas por view, em /metrics
+METRICAS = {
+    'ATIVO': os.environ.get('METRICAS_ATIVO', '1') == '1',
+    # Quem pode ler /metrics (o Prometheus na mesma máquina, por padrão)
+    'IPS_PERMITIDOS': os.environ.get('METRICAS_IPS_PERMITIDOS',
+                                     '127.0.0.1,::1').split(','),
+}
+
+# Consultas acima de LIMITE_MS vão para o log com o EXPLAIN QUERY PLAN e
+# são agregadas em /api/consultas-lentas/ (gerenciamento_eventos/consultas_lentas.py)
+CONSULTAS_LENTAS = {
+    'ATIVO': os.environ.get('CONSULTAS_LENTAS_ATIVO', '0') == '1',
+    'LIMITE_MS': float(os.environ.get('CONSULTAS_LENTAS_LIMITE_MS', '100')),
+    'MAX_IMPRESSOES': int(os.environ.get('CONSULTAS_LENTAS_MAX_IMPRESSOES',
+                                         '500')),
+}
+
 ROOT_URLCONF = 'gerenciamento_eventos.urls'
 
 TEMPLATES = [
@@ -82,13 +104,95 @@ WSGI_APPLICATION = 'gerenciamento_eventos.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# DB_PERFIL=producao liga o WAL e os pragmas abaixo em cada conexão
+# (gerenciamento_eventos/sqlite.py) e mantém as conexões abertas entre
+# requisições. Com WAL, leituras não bloqueiam a escrita e vice-versa; o
+# busy_timeout faz a escrita concorrente esperar em vez de falhar com
+# "database is locked".
+DB_PERFIL = os.environ.get('DB_PERFIL', 'desenvolvimento')
+PRODUCAO_DB = DB_PERFIL == 'producao'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_ARQUIVO', BASE_DIR / 'db.sqlite3'),
+        # Segundos que uma conexão fica aberta para as próximas requisições
+        'CONN_MAX_AGE': int(os.environ.get(
+            'DB_CONN_MAX_AGE', '600' if PRODUCAO_DB else '0')),
+        'CONN_HEALTH_CHECKS': PRODUCAO_DB,
     }
 }
 
+# DB_REPLICAS=arquivo1,arquivo2 adiciona réplicas de leitura (replica_1,
+# replica_2...), mantidas em sincronia fora da aplicação (por exemplo com
+# Litestream ou LiteFS). As leituras dos viewsets vão para elas; veja
+# gerenciamento_eventos/roteamento.py
+REPLICAS_LEITURA = {
+    'ALIASES': [],
+    # Cache das marcas de escrita (leitura das próprias escritas). Com
+    # vários processos precisa ser compartilhado: o 'default' é local ao
+    # processo e o check gerenciamento_eventos.W001 avisa disso
+    'CACHE': os.environ.get('DB_REPLICA_CACHE', 'default'),
+    # Depois de gravar, o usuário lê do principal por esse tempo
+    'ADERENCIA_SEGUNDOS': int(os.environ.get('DB_REPLICA_ADERENCIA', '5')),
+}
+for _numero, _arquivo in enumerate(
+        filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica_{_numero}'] = {
+        **DATABASES['default'], 'NAME': _arquivo.strip(),
+        # Nos testes a réplica é o próprio banco de teste
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICAS_LEITURA['ALIASES'].append(f'replica_{_numero}')
+
+DATABASE_ROUTERS = ['gerenciamento_eventos.roteamento.RoteadorReplicas']
+
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    # NORMAL é seguro com WAL: só o último commit pode se perder numa
+    # queda de energia, nunca a integridade do arquivo
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000')),
+    # Negativo: em KiB (64 MiB de cache de páginas por conexão)
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-65536')),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 ** 2))),
+    'temp_store': 'MEMORY',
+} if PRODUCAO_DB else {}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# 'respostas' guarda as respostas da API (eventos.mixins.CacheRespostaMixin);
+# use RESPOSTAS_CACHE_BACKEND/LOCATION para trocar por um cache em arquivo.
+# Com locmem cada processo tem o seu cache: a memória no pior caso é
+# MAX_ENTRIES x TAMANHO_MAXIMO por processo (500 x 64 KB = 32 MB com os
+# valores padrão), e os contadores de acerto/falha também são por processo.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'respostas': {
+        'BACKEND': os.environ.get(
+            'RESPOSTAS_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('RESPOSTAS_CACHE_LOCATION', 'respostas'),
+        'TIMEOUT': int(os.environ.get('RESPOSTAS_CACHE_TIMEOUT', '300')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('RESPOSTAS_CACHE_MAX_ENTRIES',
+                                              '500')),
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
+RESPOSTAS_CACHE = {
+    'ATIVO': os.environ.get('RESPOSTAS_CACHE_ATIVO', '1') == '1',
+    'ALIAS': 'respostas',
+    'TAMANHO_MAXIMO': int(os.environ.get('RESPOSTAS_CACHE_TAMANHO_MAXIMO',
+                                         str(64 * 1024))),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -133,27 +237,55 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
+        'usuarios.authentication.CachedBasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'usuarios.authentication.CachedTokenAuthentication',
 
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS':
+        'gerenciamento_eventos.pagination.PaginacaoPorCursor',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', '50')),
 }
 
-sentry_sdk.init(
-    dsn=(
+# Cache da resolução token -> usuário (usuarios.authentication).
+# Com ALIAS definido usa um cache do Django compartilhado entre workers.
+# Sem ALIAS cada processo tem o seu LRU e os sinais (token apagado, usuário
+# salvo ou desativado) só invalidam o do processo que os disparou: nos
+# demais a entrada antiga vale até expirar (TIMEOUT).
+TOKEN_AUTH_CACHE = {
+    'TIMEOUT': int(os.environ.get('TOKEN_AUTH_CACHE_TIMEOUT', '300')),
+    'MAX_ENTRIES': int(os.environ.get('TOKEN_AUTH_CACHE_MAX_ENTRIES', '10000')),
+    'ALIAS': os.environ.get('TOKEN_AUTH_CACHE_ALIAS') or None,
+}
+
+# Cache das credenciais Basic já verificadas (evita o PBKDF2 repetido)
+BASIC_AUTH_CACHE = {
+    'TIMEOUT': int(os.environ.get('BASIC_AUTH_CACHE_TIMEOUT', '60')),
+    'MAX_ENTRIES': int(os.environ.get('BASIC_AUTH_CACHE_MAX_ENTRIES', '10000')),
+}
+
+# Sentry: SENTRY_ATIVO=0 ou SENTRY_DSN vazio desligam tudo. As taxas de
+# rastreamento são por rota (veja gerenciamento_eventos/sentry.py):
+# SENTRY_TRACES_ROTAS="/api/eventos/=0.01,/api/*=0.05" (``*`` = prefixo)
+SENTRY = {
+    'ATIVO': os.environ.get('SENTRY_ATIVO', '1') == '1',
+    'DSN': os.environ.get(
+        'SENTRY_DSN',
         "https://6082f5ebfddc84c1419f355f4c637f9d"
         "@o4508456896823296.ingest.us.sentry.io"
         "/4508457038708736"
     ),
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for tracing.
-    traces_sample_rate=1.0,
-    _experiments={
-        # Set continuous_profiling_auto_start to True
-        # to automatically start the profiler on when
-        # possible.
-        "continuous_profiling_auto_start": True,
-    },
-)
+    'AMBIENTE': os.environ.get('SENTRY_AMBIENTE'),
+    # Fração das exceções reportadas
+    'AMOSTRA_ERROS': float(os.environ.get('SENTRY_ERROS_AMOSTRA', '1.0')),
+    # Rotas sem regra própria
+    'AMOSTRA_PADRAO': float(os.environ.get('SENTRY_TRACES_AMOSTRA', '0.05')),
+    'AMOSTRAS_POR_ROTA': ler_taxas_por_rota(os.environ.get(
+        'SENTRY_TRACES_ROTAS', '/api/eventos/=0.01,/admin/*=0')),
+    # Fração medida para achar as requisições lentas, que sempre são enviadas
+    'AMOSTRA_CAPTURA': float(os.environ.get('SENTRY_CAPTURA_AMOSTRA', '0.1')),
+    'LENTA_MS': int(os.environ.get('SENTRY_LENTA_MS', '1000')),
+    'AMOSTRA_PERFIS': float(os.environ.get('SENTRY_PERFIS_AMOSTRA', '0')),
+}
+iniciar_sentry(SENTRY)
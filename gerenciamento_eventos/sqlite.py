@@ -0,0 +1,19 @@
+"""Ajustes aplicados a cada nova conexão SQLite (settings.SQLITE_PRAGMAS)"""
+from django.conf import settings
+
+
+def aplicar_pragmas(sender, connection, **kwargs):  # pylint: disable=unused-argument
+    """Executa os PRAGMAs configurados na conexão recém-aberta
+
+    Ligado ao sinal ``connection_created``; com CONN_MAX_AGE a conexão é
+    reaproveitada, então os pragmas rodam uma vez por conexão e não por
+    requisição.
+    """
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for nome, valor in pragmas.items():
+            if not nome.isidentifier() or not str(valor).lstrip('-').isalnum():
+                raise ValueError(f"Pragma inválido: {nome} = {valor}")
+            cursor.execute(f'PRAGMA {nome} = {valor}')
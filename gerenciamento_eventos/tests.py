@@ -0,0 +1,461 @@
+"""Testes da infraestrutura do projeto
+
+Pragmas do SQLite, réplicas de leitura, amostragem do Sentry, métricas e
+consultas lentas. Os dados de teste vêm de ``eventos.fabricas``.
+"""
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import caches
+from django.db import connection, connections, transaction
+from django.test import AsyncClient, TestCase, override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+from eventos.fabricas import DadosFactory
+from eventos.models import Local, Custo
+from eventos.services import incrementar_versao_dados
+from gerenciamento_eventos.consultas_lentas import (
+    REGISTRO as REGISTRO_LENTAS, impressao_digital, normalizar_sql,
+    plano_da_consulta
+)
+from gerenciamento_eventos.metricas import (
+    REGISTRO, Histograma, MetricasMiddleware
+)
+from gerenciamento_eventos.roteamento import verificar_cache_das_replicas
+from gerenciamento_eventos.sentry import (
+    amostrador, filtro_de_transacoes, iniciar_sentry, ler_taxas_por_rota,
+    taxa_da_rota
+)
+from usuarios.authentication import limpar_caches
+
+# pylint: disable=no-member
+
+
+class PragmasSqliteTests(TestCase):
+    """Testes dos pragmas aplicados às conexões no perfil de produção"""
+
+    def conectar(self, pasta):
+        """Abre uma conexão nova a um arquivo SQLite temporário"""
+        from django.db.backends.sqlite3.base import DatabaseWrapper  # pylint: disable=import-outside-toplevel
+        conexao = DatabaseWrapper(
+            {**connection.settings_dict,
+             "NAME": os.path.join(pasta, "pragmas.sqlite3")},
+            alias="pragmas"
+        )
+        self.addCleanup(conexao.close)
+        return conexao
+
+    def pragma(self, conexao, nome):
+        """Valor atual de um pragma na conexão"""
+        with conexao.cursor() as cursor:
+            cursor.execute(f"PRAGMA {nome}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_do_perfil(self):
+        """Cada nova conexão recebe WAL, synchronous, timeout e caches"""
+        pragmas = {"journal_mode": "WAL", "synchronous": "NORMAL",
+                   "busy_timeout": 4000, "cache_size": -2048,
+                   "mmap_size": 1048576}
+        with tempfile.TemporaryDirectory() as pasta, \
+                override_settings(SQLITE_PRAGMAS=pragmas):
+            conexao = self.conectar(pasta)
+            self.assertEqual(self.pragma(conexao, "journal_mode"), "wal")
+            self.assertEqual(self.pragma(conexao, "synchronous"), 1)
+            self.assertEqual(self.pragma(conexao, "busy_timeout"), 4000)
+            self.assertEqual(self.pragma(conexao, "cache_size"), -2048)
+            self.assertEqual(self.pragma(conexao, "mmap_size"), 1048576)
+            conexao.close()
+
+    def test_sem_perfil_nada_muda(self):
+        """Sem pragmas configurados a conexão fica com os padrões"""
+        with tempfile.TemporaryDirectory() as pasta, \
+                override_settings(SQLITE_PRAGMAS={}):
+            conexao = self.conectar(pasta)
+            self.assertEqual(self.pragma(conexao, "journal_mode"), "delete")
+            conexao.close()
+
+
+REPLICA_TESTE = "replica_teste"
+
+
+@override_settings(REPLICAS_LEITURA={"ALIASES": [REPLICA_TESTE],
+                                     "CACHE": "default",
+                                     "ADERENCIA_SEGUNDOS": 60})
+class ReplicasLeituraTests(APITestCase):
+    """Testes do roteamento de leituras para uma réplica (outro arquivo SQLite)"""
+
+    @classmethod
+    def setUpClass(cls):
+        from django.db.backends.sqlite3.base import DatabaseWrapper  # pylint: disable=import-outside-toplevel
+        cls.pasta = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        arquivo = os.path.join(cls.pasta.name, "replica.sqlite3")
+        # A réplica começa como cópia do esquema do banco de teste
+        principal = connections["default"]
+        principal.ensure_connection()
+        destino = sqlite3.connect(arquivo)
+        principal.connection.backup(destino)
+        destino.close()
+        connections[REPLICA_TESTE] = DatabaseWrapper(
+            {**principal.settings_dict, "NAME": arquivo}, alias=REPLICA_TESTE
+        )
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA_TESTE].close()
+        del connections[REPLICA_TESTE]
+        cls.pasta.cleanup()
+
+    def setUp(self):
+        caches["default"].clear()
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_replica")
+        self.client.force_authenticate(user=self.user)
+        # Tudo o que for gravado na réplica é desfeito no fim do teste
+        atomico = transaction.atomic(using=REPLICA_TESTE)
+        atomico.__enter__()  # pylint: disable=unnecessary-dunder-call
+        self.addCleanup(atomico.__exit__, None, None, None)
+        self.addCleanup(transaction.set_rollback, True, using=REPLICA_TESTE)
+        self.user.first_name = "Na réplica"
+        self.user.save(using=REPLICA_TESTE, force_insert=True)
+        Local.objects.using(REPLICA_TESTE).create(
+            nome="Só na réplica", logradouro="Rua A", numero=1,
+            bairro="Centro", cidade="Cidade X", estado="Estado Y",
+            cep="12345-678", capacidade=100, usuario=self.user
+        )
+
+    def nomes_dos_locais(self):
+        """Nomes dos locais listados pela API"""
+        response = self.client.get("/api/locais/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [local["nome"] for local in response.data["results"]]
+
+    def criar_local(self):
+        """Cria um local pela API (no banco principal)"""
+        response = self.client.post("/api/locais/", {
+            "nome": "Gravado agora", "logradouro": "Rua B", "numero": 2,
+            "bairro": "Centro", "cidade": "Cidade X", "estado": "Estado Y",
+            "cep": "12345-678", "capacidade": 50
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_leituras_vao_para_a_replica(self):
+        """GET nos viewsets de eventos e de usuários lê da réplica"""
+        self.assertEqual(self.nomes_dos_locais(), ["Só na réplica"])
+        response = self.client.get(f"/api/usuarios/{self.user.pk}/")
+        self.assertEqual(response.data["first_name"], "Na réplica")
+
+    def test_le_as_proprias_escritas(self):
+        """Depois de gravar, o usuário lê do principal até a aderência expirar"""
+        self.criar_local()
+        self.assertEqual(self.nomes_dos_locais(), ["Gravado agora"])
+        # A versão vem do principal: sem limpar as respostas, a lista
+        # guardada depois da escrita continuaria valendo
+        caches["default"].clear()
+        caches["respostas"].clear()
+        self.assertEqual(self.nomes_dos_locais(), ["Só na réplica"])
+
+    def test_escritas_ficam_no_principal(self):
+        """O POST grava no default mesmo com réplicas configuradas"""
+        self.criar_local()
+        self.assertTrue(Local.objects.filter(nome="Gravado agora").exists())
+        self.assertFalse(Local.objects.using(REPLICA_TESTE)
+                         .filter(nome="Gravado agora").exists())
+
+    def test_fora_dos_viewsets_le_do_principal(self):
+        """Comandos, serviços e sinais continuam lendo do default"""
+        self.assertEqual(Local.objects.all().db, "default")
+        self.assertFalse(Local.objects.filter(nome="Só na réplica").exists())
+
+    @override_settings(REPLICAS_LEITURA={"ALIASES": []})
+    def test_sem_replicas_tudo_no_principal(self):
+        """Sem aliases configurados nada é desviado"""
+        self.assertEqual(self.nomes_dos_locais(), [])
+
+    def test_uma_replica_por_requisicao(self):
+        """A réplica é sorteada uma vez e vale para todas as consultas"""
+        with override_settings(REPLICAS_LEITURA={
+                "ALIASES": [REPLICA_TESTE, "default"], "CACHE": "default"}), \
+                mock.patch("gerenciamento_eventos.roteamento.random.choice",
+                           return_value=REPLICA_TESTE) as sorteio:
+            self.assertEqual(self.nomes_dos_locais(), ["Só na réplica"])
+        sorteio.assert_called_once()
+
+    def test_versao_dos_dados_lida_do_principal(self):
+        """Uma réplica atrasada não revalida o ETag de dados já alterados"""
+        etag = self.client.get("/api/locais/")["ETag"]
+        incrementar_versao_dados(self.user.pk)
+        response = self.client.get("/api/locais/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_aviso_de_cache_local(self):
+        """Com réplicas, um cache de marcas local ao processo gera aviso"""
+        avisos = verificar_cache_das_replicas(None)
+        self.assertEqual([aviso.id for aviso in avisos],
+                         ["gerenciamento_eventos.W001"])
+        with override_settings(REPLICAS_LEITURA={"ALIASES": []}):
+            self.assertEqual(verificar_cache_das_replicas(None), [])
+
+
+class SentryAmostragemTests(TestCase):
+    """Testes da amostragem por rota do Sentry"""
+
+    def setUp(self):
+        self.configuracao = {
+            "ATIVO": True, "DSN": "https://chave@localhost/1",
+            "AMOSTRA_PADRAO": 0.05, "AMOSTRA_CAPTURA": 0.2, "LENTA_MS": 500,
+            "AMOSTRAS_POR_ROTA": ler_taxas_por_rota(
+                "/api/eventos/=0.01, /admin/*=0, /api/custos/*=0.5"),
+        }
+
+    def transacao(self, caminho, duracao, status_http="200"):
+        """Evento de transação como o SDK o entrega ao before_send"""
+        # O SDK entrega os instantes já serializados em ISO 8601
+        return {"type": "transaction",
+                "start_timestamp": "2024-12-01T10:00:00Z",
+                "timestamp": f"2024-12-01T10:00:{duracao:09.6f}Z",
+                "tags": {"http.status_code": status_http},
+                "request": {"url": f"http://testserver{caminho}"}}
+
+    def test_regras_de_rota(self):
+        """Regra exata, prefixo mais longo e taxa padrão"""
+        def taxa(caminho):
+            return taxa_da_rota(caminho, self.configuracao)
+        self.assertEqual(taxa("/api/eventos/"), 0.01)
+        self.assertEqual(taxa("/api/eventos/1/"), 0.05)
+        self.assertEqual(taxa("/api/custos/1/"), 0.5)
+        self.assertEqual(taxa("/admin/eventos/"), 0)
+        with self.assertRaises(ValueError):
+            ler_taxas_por_rota("/api/=2")
+
+    def test_amostrador_usa_a_taxa_de_captura(self):
+        """Rotas com taxa baixa são medidas na taxa de captura"""
+        amostrar = amostrador(self.configuracao)
+
+        def contexto(caminho):
+            return {"wsgi_environ": {"PATH_INFO": caminho}}
+        self.assertEqual(amostrar(contexto("/api/eventos/")), 0.2)
+        self.assertEqual(amostrar(contexto("/api/custos/")), 0.5)
+        self.assertEqual(amostrar(contexto("/admin/")), 0)
+        self.assertEqual(amostrar({"asgi_scope": {"path": "/api/eventos/"}}),
+                         0.2)
+        self.assertEqual(amostrar({"parent_sampled": True,
+                                   "wsgi_environ": {"PATH_INFO": "/admin/"}}),
+                         1.0)
+
+    def test_filtro_mantem_lentas_e_erros(self):
+        """Lentas e 5xx sempre vão; rápidas só na proporção da rota"""
+        filtrar = filtro_de_transacoes(self.configuracao)
+        lenta = self.transacao("/api/eventos/", 0.8)
+        com_erro = self.transacao("/api/eventos/", 0.01, "500")
+        rapida = self.transacao("/api/eventos/", 0.01)
+        with mock.patch("gerenciamento_eventos.sentry.random.random",
+                        return_value=0.99):
+            self.assertIs(filtrar(lenta, {}), lenta)
+            self.assertIs(filtrar(com_erro, {}), com_erro)
+            self.assertIsNone(filtrar(rapida, {}))
+        # 0.01 / 0.2: uma em cada 20 rápidas é mantida
+        with mock.patch("gerenciamento_eventos.sentry.random.random",
+                        return_value=0.04):
+            self.assertIs(filtrar(rapida, {}), rapida)
+
+    def test_desligado(self):
+        """SENTRY_ATIVO=0 ou DSN vazio não inicializam o SDK"""
+        with mock.patch("gerenciamento_eventos.sentry.sentry_sdk.init") as init:
+            self.assertFalse(iniciar_sentry({**self.configuracao,
+                                             "ATIVO": False}))
+            self.assertFalse(iniciar_sentry({**self.configuracao, "DSN": ""}))
+            init.assert_not_called()
+            self.assertTrue(iniciar_sentry({**self.configuracao,
+                                            "AMOSTRA_ERROS": 1.0,
+                                            "AMOSTRA_PERFIS": 0,
+                                            "AMBIENTE": None}))
+            self.assertEqual(init.call_args.kwargs["sample_rate"], 1.0)
+
+
+class MetricasTests(APITestCase):
+    """Testes do middleware de métricas e de /metrics"""
+
+    def setUp(self):
+        REGISTRO.limpar()
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_metricas")
+        self.client.force_authenticate(user=self.user)
+        local = DadosFactory.criar_local(self.user)
+        self.evento = DadosFactory.criar_evento(local)
+
+    def metricas(self):
+        """Texto publicado em /metrics"""
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return response.content.decode()
+
+    def test_metricas_por_view_e_acao(self):
+        """Latência, consultas e tamanho por rota resolvida e ação"""
+        response = self.client.get(f"/api/eventos/{self.evento.pk}/custos/")
+        self.client.get("/api/eventos/")
+        texto = self.metricas()
+
+        rotulos = 'view="eventos-calcular-custos",acao="calcular_custos",' \
+                  'metodo="GET"'
+        self.assertIn(f'http_requisicoes_total{{{rotulos},status="200"}} 1',
+                      texto)
+        self.assertIn(f'http_requisicao_segundos_bucket{{{rotulos},'
+                      f'le="+Inf"}} 1', texto)
+        # O evento do usuário e a agregação dos custos
+        self.assertIn(f'db_consultas_por_requisicao_sum{{{rotulos}}} 2',
+                      texto)
+        self.assertIn(f'http_resposta_bytes_sum{{{rotulos}}} '
+                      f'{len(response.content)}', texto)
+        self.assertIn('http_requisicao_segundos_count{view="eventos-list",'
+                      'acao="list",metodo="GET"} 1', texto)
+        self.assertIn("# TYPE http_requisicao_segundos histogram", texto)
+        # /metrics não mede a si mesmo
+        self.assertNotIn('view="metricas"', texto)
+
+    async def test_cadeia_assincrona(self):
+        """No ASGI o middleware é assíncrono e ainda conta as consultas"""
+        async def resposta(request):  # pylint: disable=unused-argument
+            return None
+        self.assertTrue(iscoroutinefunction(MetricasMiddleware(resposta)))
+        token = await sync_to_async(Token.objects.create)(user=self.user)
+        limpar_caches()
+        response = await AsyncClient().get(
+            "/api/async/eventos/",
+            headers={"Authorization": f"Token {token.key}"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        texto = REGISTRO.texto()
+        rotulos = 'view="async-eventos-list",acao="",metodo="GET"'
+        self.assertIn(f'http_requisicoes_total{{{rotulos},status="200"}} 1',
+                      texto)
+        # O token (com o usuário) e a página de eventos
+        self.assertIn(f'db_consultas_por_requisicao_sum{{{rotulos}}} 2',
+                      texto)
+
+    def test_metodos_desconhecidos_agrupados(self):
+        """Métodos fora dos conhecidos não criam séries próprias"""
+        self.client.generic("PROPFIND", "/api/eventos/")
+        self.client.generic("XYZ", "/api/eventos/")
+        texto = self.metricas()
+        self.assertIn('http_requisicoes_total{view="eventos-list",acao="",'
+                      'metodo="OUTRO",status="405"} 2', texto)
+        self.assertNotIn("PROPFIND", texto)
+
+    def test_so_ips_permitidos(self):
+        """Outros endereços recebem 403"""
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.8")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_desligado(self):
+        """Com METRICAS['ATIVO'] falso nada é medido nem publicado"""
+        with override_settings(METRICAS={"ATIVO": False}):
+            cliente = APIClient()
+            cliente.force_authenticate(user=self.user)
+            cliente.get("/api/eventos/")
+            self.assertEqual(cliente.get("/metrics").status_code,
+                             status.HTTP_404_NOT_FOUND)
+        self.assertNotIn("eventos-list", REGISTRO.texto())
+
+    def test_faixas_do_histograma(self):
+        """Faixas acumuladas com o limite inclusivo"""
+        histograma = Histograma("teste", "Teste.", ("view",), (1, 5))
+        for valor in (0, 1, 3, 9):
+            histograma.observar(("v",), valor)
+        self.assertEqual(list(histograma.linhas()), [
+            'teste_bucket{view="v",le="1"} 2',
+            'teste_bucket{view="v",le="5"} 3',
+            'teste_bucket{view="v",le="+Inf"} 4',
+            'teste_sum{view="v"} 13',
+            'teste_count{view="v"} 4',
+        ])
+
+
+@override_settings(CONSULTAS_LENTAS={"ATIVO": True, "LIMITE_MS": 0,
+                                     "MAX_IMPRESSOES": 50},
+                   RESPOSTAS_CACHE={"ATIVO": False})
+class ConsultasLentasTests(APITestCase):
+    """Testes do registro de consultas lentas"""
+
+    def setUp(self):
+        REGISTRO_LENTAS.limpar()
+        self.client = APIClient()
+        self.user = DadosFactory.criar_usuario("usuario_lentas")
+        self.admin = DadosFactory.criar_usuario(
+            "admin_lentas", is_staff=True, is_superuser=True)
+        local = DadosFactory.criar_local(self.user)
+        evento = DadosFactory.criar_evento(local)
+        Custo.objects.create(descricao="Item", valor="10.00", evento=evento)
+
+    def test_normalizacao(self):
+        """Literais, parâmetros e listas de IN viram marcadores"""
+        self.assertEqual(
+            normalizar_sql("SELECT  * FROM t WHERE a = 'x''y' AND b = 10\n"
+                           "AND c IN (%s, %s, %s) AND T3.d = 2.5"),
+            "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...) "
+            "AND T3.d = ?"
+        )
+        self.assertEqual(
+            impressao_digital("SELECT 1 WHERE x IN (%s)")[0],
+            impressao_digital("SELECT 2 WHERE x IN (%s, %s)")[0]
+        )
+
+    def test_agrega_por_impressao_digital_com_plano(self):
+        """Consultas repetidas somam ocorrências; o plano é capturado uma vez"""
+        self.client.force_authenticate(user=self.user)
+        with mock.patch("gerenciamento_eventos.consultas_lentas."
+                        "plano_da_consulta",
+                        wraps=plano_da_consulta) as plano, \
+                self.assertLogs("gerenciamento_eventos.consultas_lentas",
+                                "WARNING") as logs:
+            for _ in range(2):
+                self.client.get("/api/custos/")
+        custos = [consulta for consulta in REGISTRO_LENTAS.piores(50)
+                  if 'FROM "eventos_custo"' in consulta["sql"]]
+        self.assertEqual(len(custos), 1)
+        consulta = custos[0]
+        self.assertEqual(consulta["ocorrencias"], 2)
+        self.assertEqual(consulta["views"], {"custos-list": 2})
+        self.assertTrue(any("eventos_custo" in linha or "INDEX" in linha
+                            for linha in consulta["plano"]))
+        self.assertEqual(plano.call_count, len(REGISTRO_LENTAS.piores(50)))
+        self.assertTrue(any(consulta["impressao_digital"] in linha
+                            for linha in logs.output))
+
+    def test_endpoint_so_para_administradores(self):
+        """/api/consultas-lentas/ lista as piores para administradores"""
+        self.client.force_authenticate(user=self.user)
+        with self.assertLogs("gerenciamento_eventos.consultas_lentas",
+                             "WARNING"):
+            self.client.get("/api/custos/")
+        response = self.client.get("/api/consultas-lentas/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get("/api/consultas-lentas/?limite=1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["consultas"]), 1)
+        self.assertEqual(response.data["limite_ms"], 0)
+
+    async def test_cadeia_assincrona(self):
+        """As views assíncronas também têm as consultas cronometradas"""
+        token = await sync_to_async(Token.objects.create)(user=self.user)
+        with self.assertLogs("gerenciamento_eventos.consultas_lentas",
+                             "WARNING"):
+            response = await AsyncClient().get(
+                "/api/async/eventos/",
+                headers={"Authorization": f"Token {token.key}"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(any("async-eventos-list" in consulta["views"]
+                            for consulta in REGISTRO_LENTAS.piores(50)))
+
+    @override_settings(CONSULTAS_LENTAS={"ATIVO": False})
+    def test_desligado_por_padrao(self):
+        """Sem ATIVO nada é medido"""
+        self.client.force_authenticate(user=self.user)
+        self.client.get("/api/custos/")
+        self.assertEqual(REGISTRO_LENTAS.piores(), [])
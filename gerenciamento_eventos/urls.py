@@ -3,7 +3,12 @@ from django.urls import path, include
 from rest_framework.authtoken import views
 from rest_framework.routers import DefaultRouter
 
+from eventos import views_async
+from gerenciamento_eventos.metricas import metricas
 from eventos.views import LocalViewSet, EventoViewSet, CustoViewSet
+from gerenciamento_eventos.views import (
+    EstatisticasCacheView, ConsultasLentasView
+)
 from usuarios.views import UsuarioViewSet
 
 router = DefaultRouter()
@@ -22,9 +27,25 @@ urlpatterns = [
 
     path("api/token-auth/", views.obtain_auth_token),
 
+    path('api/cache/respostas/', EstatisticasCacheView.as_view(),
+         name='cache-respostas'),
+    path('api/consultas-lentas/', ConsultasLentasView.as_view(),
+         name='consultas-lentas'),
+
+    # Leituras assíncronas, para servir pelo ASGI (eventos/views_async.py)
+    path('api/async/eventos/', views_async.listar_eventos,
+         name='async-eventos-list'),
+    path('api/async/eventos/<int:pk>/', views_async.detalhar_evento,
+         name='async-eventos-detail'),
+    path('api/async/eventos/<int:pk>/custos/', views_async.custos_do_evento,
+         name='async-eventos-custos'),
+
     path('api/', include(router.urls)),
 
     path('sentry-debug/', trigger_error),
 
+    # Métricas no formato do Prometheus, só para IPs locais
+    path('metrics', metricas, name='metricas'),
+
 ]
 
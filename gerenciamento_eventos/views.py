@@ -0,0 +1,35 @@
+"""Endpoints de operação do projeto: estatísticas do cache de respostas e
+consultas lentas (só administradores)"""
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from eventos.mixins import estatisticas_cache_respostas
+from eventos.parametros import parametro_inteiro
+from .consultas_lentas import piores_consultas
+
+
+class EstatisticasCacheView(APIView):
+    """Contadores de acerto e falha do cache de respostas (só administradores)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Retorna acertos, falhas e a taxa de acerto
+
+        Com o cache locmem os números são só do processo que responde.
+        """
+        return Response(estatisticas_cache_respostas())
+
+
+class ConsultasLentasView(APIView):
+    """Consultas lentas agregadas por impressão digital (só administradores)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Retorna as consultas de maior tempo total, com o plano de cada uma"""
+        try:
+            limite = parametro_inteiro(request, 'limite') or 20
+        except ValidationError as ve:
+            return Response(ve.detail, status=status.HTTP_400_BAD_REQUEST)
+        return Response(piores_consultas(min(limite, 100)))
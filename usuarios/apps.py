@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UsuariosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'usuarios'
+
+    def ready(self):
+        # Registra os sinais que invalidam o cache de autenticação
+        from . import signals  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
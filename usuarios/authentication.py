@@ -0,0 +1,207 @@
+"""Autenticações com cache para evitar consultas repetidas a cada requisição"""
+import copy
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import salted_hmac
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .cache import CacheLRU
+
+CONFIGURACAO_PADRAO = {
+    # Segundos que uma resolução de token fica válida no cache
+    'TIMEOUT': 300,
+    # Quantidade máxima de tokens no cache em memória de cada processo
+    'MAX_ENTRIES': 10000,
+    # Alias de um cache do Django compartilhado entre workers (opcional)
+    'ALIAS': None,
+}
+
+CONFIGURACAO_BASIC_PADRAO = {
+    # Curto de propósito: outros processos só percebem a troca de senha
+    # quando a entrada expira
+    'TIMEOUT': 60,
+    'MAX_ENTRIES': 10000,
+}
+
+# Caches por usuário que não devem passar de uma requisição para outra
+CACHES_DA_INSTANCIA = ('_perm_cache', '_user_perm_cache', '_group_perm_cache')
+
+_cache_tokens = None
+_cache_basic = None
+
+
+def _configuracao():
+    """Configuração de TOKEN_AUTH_CACHE completada com os valores padrão"""
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+
+
+def _cache_local():
+    """Cache LRU de tokens do processo, criado no primeiro uso"""
+    global _cache_tokens  # pylint: disable=global-statement
+    if _cache_tokens is None:
+        configuracao = _configuracao()
+        _cache_tokens = CacheLRU(configuracao['MAX_ENTRIES'],
+                                 configuracao['TIMEOUT'])
+    return _cache_tokens
+
+
+def _cache_credenciais():
+    """Cache LRU de credenciais Basic já verificadas, criado no primeiro uso"""
+    global _cache_basic  # pylint: disable=global-statement
+    if _cache_basic is None:
+        configuracao = {**CONFIGURACAO_BASIC_PADRAO,
+                        **getattr(settings, 'BASIC_AUTH_CACHE', {})}
+        _cache_basic = CacheLRU(configuracao['MAX_ENTRIES'],
+                                configuracao['TIMEOUT'])
+    return _cache_basic
+
+
+def _copia_das_credenciais(credenciais):
+    """(usuário, auth) com instâncias novas, sem os caches de permissão
+
+    As entradas do LRU em memória nunca são entregues às requisições: cada
+    uma recebe a sua cópia, que pode alterar sem afetar as outras threads.
+    """
+    usuario, auth = credenciais
+    usuario = copy.copy(usuario)
+    for atributo in CACHES_DA_INSTANCIA:
+        usuario.__dict__.pop(atributo, None)
+    if auth is not None:
+        auth = copy.copy(auth)
+        auth.user = usuario
+    return usuario, auth
+
+
+def _chave_token(key):
+    """Chave do cache para um token (o token em si não é guardado)"""
+    return 'token-auth:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidar_token(key):
+    """Remove um token do cache (token apagado ou trocado)"""
+    alias = _configuracao()['ALIAS']
+    if alias:
+        caches[alias].delete(_chave_token(key))
+    else:
+        _cache_local().remover(_chave_token(key))
+
+
+def _chave_credenciais(userid, password):
+    """Digest HMAC (com a SECRET_KEY) de usuário e senha
+
+    A senha não fica na memória; sem a SECRET_KEY o digest não serve para
+    testar senhas.
+    """
+    return salted_hmac('usuarios.authentication.basic',
+                       f'{userid}\x00{password}',
+                       algorithm='sha256').hexdigest()
+
+
+def invalidar_usuario(usuario_id):
+    """Remove do cache todos os tokens e credenciais de um usuário"""
+    _cache_credenciais().remover_do_usuario(usuario_id)
+    alias = _configuracao()['ALIAS']
+    if alias:
+        chaves = Token.objects.filter(user_id=usuario_id) \
+            .values_list('key', flat=True)
+        caches[alias].delete_many([_chave_token(key) for key in chaves])
+    else:
+        _cache_local().remover_do_usuario(usuario_id)
+
+
+def limpar_caches():
+    """Esvazia os caches em memória de tokens e de credenciais"""
+    _cache_local().limpar()
+    _cache_credenciais().limpar()
+
+
+async def autenticar_token(key):
+    """Resolve um token para (usuário, token) nas views assíncronas
+
+    Usa o mesmo cache de CachedTokenAuthentication; só a consulta ao banco
+    é feita pelo ORM assíncrono. Retorna None se o token não existir ou o
+    usuário estiver inativo.
+    """
+    chave = _chave_token(key)
+    alias = _configuracao()['ALIAS']
+    if alias:
+        credenciais = await caches[alias].aget(chave)
+    else:
+        credenciais = _cache_local().obter(chave)
+    if credenciais is not None:
+        return credenciais if alias else _copia_das_credenciais(credenciais)
+
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        return None
+    if not token.user.is_active:
+        return None
+    credenciais = (token.user, token)
+    if alias:
+        await caches[alias].aset(chave, credenciais,
+                                 _configuracao()['TIMEOUT'])
+    else:
+        _cache_local().guardar(chave, _copia_das_credenciais(credenciais),
+                               token.user.pk)
+    return credenciais
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication que guarda a resolução token -> usuário em cache
+
+    Por padrão usa um LRU em memória do processo, limitado e com expiração
+    (``TOKEN_AUTH_CACHE`` nos settings). Com ``ALIAS`` usa um cache do
+    Django compartilhado entre workers. As entradas são removidas pelos
+    sinais quando o token é apagado ou trocado e quando o usuário é salvo
+    (por exemplo, ao ser desativado). Cada requisição recebe a sua cópia do
+    usuário guardado.
+    """
+
+    def authenticate_credentials(self, key):
+        chave = _chave_token(key)
+        alias = _configuracao()['ALIAS']
+        if alias:
+            credenciais = caches[alias].get(chave)
+        else:
+            credenciais = _cache_local().obter(chave)
+        if credenciais is not None:
+            # O cache do Django já devolve uma cópia desserializada
+            return credenciais if alias else \
+                _copia_das_credenciais(credenciais)
+
+        credenciais = super().authenticate_credentials(key)
+        if alias:
+            caches[alias].set(chave, credenciais,
+                              _configuracao()['TIMEOUT'])
+        else:
+            _cache_local().guardar(chave,
+                                   _copia_das_credenciais(credenciais),
+                                   credenciais[0].pk)
+        return credenciais
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """BasicAuthentication que não refaz o hash da senha a cada requisição
+
+    Depois de uma verificação bem sucedida guarda, por pouco tempo
+    (``BASIC_AUTH_CACHE``), o digest HMAC de usuário e senha junto com o
+    usuário. Requisições seguintes com as mesmas credenciais não passam
+    pelo PBKDF2. Falhas nunca são guardadas, e salvar o usuário (troca de
+    senha, desativação) remove as entradas dele. Como no cache de tokens,
+    cada requisição recebe a sua cópia do usuário.
+    """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        chave = _chave_credenciais(userid, password)
+        credenciais = _cache_credenciais().obter(chave)
+        if credenciais is not None:
+            return _copia_das_credenciais(credenciais)
+
+        credenciais = super().authenticate_credentials(userid, password,
+                                                       request)
+        _cache_credenciais().guardar(chave,
+                                     _copia_das_credenciais(credenciais),
+                                     credenciais[0].pk)
+        return credenciais
@@ -0,0 +1,75 @@
+"""Cache em memória (LRU com expiração) usado na autenticação"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheLRU:
+    """Dicionário limitado com expiração por entrada e índice por usuário
+
+    Guarda no máximo ``max_entradas`` itens; ao passar do limite remove o
+    usado há mais tempo. Cada entrada pertence a um usuário, para que todas
+    as entradas dele possam ser removidas de uma vez. Seguro para threads.
+    """
+
+    def __init__(self, max_entradas, timeout):
+        self.max_entradas = max_entradas
+        self.timeout = timeout
+        self._dados = OrderedDict()
+        self._por_usuario = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._dados)
+
+    def obter(self, chave):
+        """Retorna o valor guardado, ou None se não existir ou expirou"""
+        with self._lock:
+            entrada = self._dados.get(chave)
+            if entrada is None:
+                return None
+            valor, usuario_id, expira_em = entrada
+            if expira_em <= time.monotonic():
+                self._remover(chave, usuario_id)
+                return None
+            self._dados.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor, usuario_id):
+        """Guarda o valor, removendo o item menos usado se estiver cheio"""
+        with self._lock:
+            if chave in self._dados:
+                self._remover(chave, self._dados[chave][1])
+            self._dados[chave] = (valor, usuario_id,
+                                  time.monotonic() + self.timeout)
+            self._por_usuario.setdefault(usuario_id, set()).add(chave)
+            while len(self._dados) > self.max_entradas:
+                antiga, (_, dono, _) = next(iter(self._dados.items()))
+                self._remover(antiga, dono)
+
+    def remover(self, chave):
+        """Remove uma entrada, se existir"""
+        with self._lock:
+            entrada = self._dados.get(chave)
+            if entrada is not None:
+                self._remover(chave, entrada[1])
+
+    def remover_do_usuario(self, usuario_id):
+        """Remove todas as entradas de um usuário"""
+        with self._lock:
+            for chave in list(self._por_usuario.get(usuario_id, ())):
+                self._remover(chave, usuario_id)
+
+    def limpar(self):
+        """Esvazia o cache"""
+        with self._lock:
+            self._dados.clear()
+            self._por_usuario.clear()
+
+    def _remover(self, chave, usuario_id):
+        self._dados.pop(chave, None)
+        chaves = self._por_usuario.get(usuario_id)
+        if chaves is not None:
+            chaves.discard(chave)
+            if not chaves:
+                del self._por_usuario[usuario_id]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-17 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0002_alter_usuario_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='versao_dados',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
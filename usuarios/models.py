@@ -9,3 +9,29 @@ class Usuario(AbstractUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     cpf = models.CharField(max_length=14, unique=True)
     email = models.EmailField(unique=True)
+    # Incrementado a cada escrita em Local, Evento ou Custo do usuário;
+    # usado para gerar os ETags das respostas
+    versao_dados = models.PositiveBigIntegerField(default=0, editable=False)
+
+    CAMPOS_INCREMENTADOS = ('versao_dados',)
+
+    def save(self, *args, **kwargs):
+        """Salva o usuário sem sobrescrever a versão dos dados
+
+        ``versao_dados`` só muda por ``F()`` (services.incrementar_versao_dados);
+        uma instância carregada antes de uma escrita traz a versão defasada,
+        que não pode voltar ao banco.
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert') and args == ():
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key
+                and campo.name not in self.CAMPOS_INCREMENTADOS
+            ]
+        elif kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = [
+                campo for campo in kwargs['update_fields']
+                if campo not in self.CAMPOS_INCREMENTADOS
+            ]
+        super().save(*args, **kwargs)
@@ -0,0 +1,7 @@
+"""Paginação dos endpoints de usuários"""
+from gerenciamento_eventos.pagination import PaginacaoPorCursor
+
+
+class UsuarioCursorPagination(PaginacaoPorCursor):
+    """Usuários em ordem de username (coluna única e indexada)"""
+    ordering = ('username',)
@@ -0,0 +1,21 @@
+"""Sinais que mantêm o cache de autenticação consistente"""
+# pylint: disable=unused-argument
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import invalidar_token, invalidar_usuario
+from .models import Usuario
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_alterado(sender, instance, **kwargs):
+    """Token apagado ou regravado deixa de valer no cache"""
+    invalidar_token(instance.key)
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def usuario_alterado(sender, instance, **kwargs):
+    """Qualquer alteração do usuário (senha, ativo...) limpa o cache dele"""
+    invalidar_usuario(instance.pk)
@@ -1,9 +1,18 @@
 """Testes do Sistema"""
+import base64
+from unittest import mock
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
 from eventos.models import Local, Evento
+from usuarios.authentication import (
+    CachedBasicAuthentication, CachedTokenAuthentication, limpar_caches
+)
+from usuarios.cache import CacheLRU
 # pylint: disable=no-member
 
 
@@ -45,7 +54,9 @@ class UsuarioAPITests(TestCase):
         self.client.post(self.url_usuarios, self.user_data, format='json')
         response = self.client.get(self.url_usuarios, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)  # Ao menos um?
+        self.assertEqual([usuario["username"]
+                          for usuario in response.data["results"]],
+                         [self.user_data["username"]])
 
     def test_buscar_usuario_por_id(self):
         """
@@ -325,4 +336,132 @@ class CustoAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         # Verifica se o custo foi realmente excluído
         response = self.client.get(url, format='json')
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TokenCacheTests(APITestCase):
+    """Testes do cache da autenticação por token"""
+
+    def setUp(self):
+        self.client = APIClient()
+        usuario = get_user_model()
+        self.user = usuario.objects.create_user(
+            username="usuario_token", password="Senha@123",
+            cpf="987.654.321-00", email="token@example.com"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.url_locais = "/api/locais/"
+
+    def test_token_resolvido_uma_vez(self):
+        """A segunda requisição não consulta Token nem Usuario"""
+        self.client.get(self.url_locais)
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(self.url_locais)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([consulta for consulta in consultas.captured_queries
+                          if "authtoken_token" in consulta["sql"]])
+
+    def test_token_apagado(self):
+        """Um token apagado deixa de autenticar imediatamente"""
+        self.client.get(self.url_locais)
+        self.token.delete()
+        response = self.client.get(self.url_locais)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_usuario_desativado(self):
+        """Um usuário desativado deixa de autenticar imediatamente"""
+        self.client.get(self.url_locais)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.url_locais)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cada_requisicao_recebe_sua_copia(self):
+        """O usuário guardado no cache não é compartilhado entre requisições"""
+        autenticacao = CachedTokenAuthentication()
+        usuario, token = autenticacao.authenticate_credentials(self.token.key)
+        usuario.first_name = "Alterado"
+        outro, outro_token = autenticacao.authenticate_credentials(
+            self.token.key)
+        self.assertIsNot(outro, usuario)
+        self.assertNotEqual(outro.first_name, "Alterado")
+        self.assertIsNot(outro_token, token)
+        self.assertIs(outro_token.user, outro)
+        terceiro, _ = autenticacao.authenticate_credentials(self.token.key)
+        self.assertIsNot(terceiro, outro)
+
+    def test_cache_lru_limitado(self):
+        """O LRU descarta o item usado há mais tempo e respeita a expiração"""
+        cache = CacheLRU(max_entradas=2, timeout=60)
+        cache.guardar("a", 1, "u1")
+        cache.guardar("b", 2, "u1")
+        cache.obter("a")
+        cache.guardar("c", 3, "u2")
+        self.assertIsNone(cache.obter("b"))
+        self.assertEqual(cache.obter("a"), 1)
+        cache.remover_do_usuario("u1")
+        self.assertEqual(len(cache), 1)
+        expirado = CacheLRU(max_entradas=2, timeout=0)
+        expirado.guardar("a", 1, "u1")
+        self.assertIsNone(expirado.obter("a"))
+
+
+class BasicAuthCacheTests(APITestCase):
+    """Testes do cache de credenciais da autenticação Basic"""
+
+    def setUp(self):
+        # O rollback dos testes não dispara sinais; começa com cache vazio
+        limpar_caches()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username="usuario_basic", password="Senha@123",
+            cpf="987.654.321-11", email="basic@example.com"
+        )
+        self.url_locais = "/api/locais/"
+
+    def autenticar(self, senha):
+        """Define o cabeçalho Basic com a senha informada"""
+        credenciais = base64.b64encode(
+            f"usuario_basic:{senha}".encode()).decode()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Basic {credenciais}")
+
+    def test_senha_verificada_uma_vez(self):
+        """Só a primeira requisição executa o hash da senha"""
+        self.autenticar("Senha@123")
+        with mock.patch("django.contrib.auth.hashers.PBKDF2PasswordHasher"
+                        ".verify", autospec=True,
+                        return_value=True) as verify:
+            self.client.get(self.url_locais)
+            response = self.client.get(self.url_locais)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(verify.call_count, 1)
+
+    def test_senha_errada_nao_vai_para_o_cache(self):
+        """Senha errada continua falhando e não afeta a senha certa"""
+        self.autenticar("errada")
+        self.assertEqual(self.client.get(self.url_locais).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        self.autenticar("Senha@123")
+        self.assertEqual(self.client.get(self.url_locais).status_code,
+                         status.HTTP_200_OK)
+
+    def test_troca_de_senha(self):
+        """Depois da troca de senha a antiga deixa de valer"""
+        self.autenticar("Senha@123")
+        self.client.get(self.url_locais)
+        self.user.set_password("Nova@456")
+        self.user.save()
+        self.assertEqual(self.client.get(self.url_locais).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_cada_requisicao_recebe_sua_copia(self):
+        """O usuário guardado no cache não é compartilhado entre requisições"""
+        autenticacao = CachedBasicAuthentication()
+        usuario, _ = autenticacao.authenticate_credentials("usuario_basic",
+                                                           "Senha@123")
+        usuario.first_name = "Alterado"
+        outro, _ = autenticacao.authenticate_credentials("usuario_basic",
+                                                         "Senha@123")
+        self.assertIsNot(outro, usuario)
+        self.assertNotEqual(outro.first_name, "Alterado")
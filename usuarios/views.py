@@ -1,10 +1,13 @@
 """Views Base User"""
 from rest_framework import viewsets
+from gerenciamento_eventos.roteamento import LeituraReplicaMixin
 from .serializers import UsuarioSerializer
 from .models import Usuario
+from .pagination import UsuarioCursorPagination
 
 
-class UsuarioViewSet(viewsets.ModelViewSet):
+class UsuarioViewSet(LeituraReplicaMixin, viewsets.ModelViewSet):
     """View Base User"""
     queryset = Usuario.objects.all()
     serializer_class = UsuarioSerializer
+    pagination_class = UsuarioCursorPagination